@@ -1,15 +1,17 @@
 """
 File of common functions and code used throughout the project code.
 """
+import gzip
 import json
 import logging
+import mmap
 import os
 import re
 import urllib.parse
 import time
 from enum import Enum
 from functools import lru_cache
-import ijson
+from typing import Optional, Tuple
 import requests
 from pathvalidate import sanitize_filename
 from cs4529_secrets import Secrets
@@ -78,6 +80,12 @@ gerrit_url_prefix = 'https://gerrit.wikimedia.org/r/'
 
 gerrit_api_url_prefix = gerrit_url_prefix + 'a/'
 
+git_remote_url_prefix = gerrit_url_prefix
+"""
+The prefix of the URL that repositories are cloned and fetched from. This can be a file:// URL or
+a path to a local mirror, in which case the repository is expected at <prefix><repository>.git.
+"""
+
 def remove_gerrit_api_json_response_prefix(text_content: str) -> str:
     """
     Remove the ")]}'" characters from the Gerrit API response which is added
@@ -122,18 +130,206 @@ class TimePeriods(Enum):
     LAST_3_MONTHS = 'last three months'
     LAST_MONTH = 'last month'
 
+test_data_set_path = path_relative_to_root('data_collection/raw_data/test_data_set.json')
+
+test_data_set_index_path = path_relative_to_root('data_collection/raw_data/test_data_set.index.json')
+
+# Matches JSON strings (including any escaped characters) and the brackets that
+#  open or close an object or array. Everything else in the file can be skipped
+#  when working out where each item in the data set starts and ends.
+_json_structure_regex = re.compile(rb'"[^"\\]*(?:\\.[^"\\]*)*"|[\[\]{}]', re.DOTALL)
+
+def build_test_data_set_index(data_set_path: str = test_data_set_path) -> dict[str, Tuple[int, int]]:
+    """
+    Scan the training and testing data set once and work out the byte range
+    of the item for each repository. The data set is a JSON array of objects with
+    the repository as the only key, so the range for a repository covers
+    that object.
+
+    :param data_set_path: The path to the training and testing data set JSON file.
+    :returns: The repository names mapped to the start and end byte offsets of their item.
+    """
+    index = {}
+    if not os.path.getsize(data_set_path):
+        return index
+    with open(data_set_path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+        depth = 0
+        item_start = None
+        repository = None
+        for match in _json_structure_regex.finditer(data):
+            character = data[match.start()]
+            if character == ord('"'):
+                # The first string directly inside an item is the repository name.
+                if depth == 2 and item_start is not None and repository is None:
+                    repository = json.loads(match.group(0))
+            elif character == ord('{') or character == ord('['):
+                depth += 1
+                if depth == 2 and character == ord('{'):
+                    # Start of an item in the top-level array.
+                    item_start = match.start()
+                    repository = None
+            else:
+                if depth == 2 and item_start is not None:
+                    # End of an item. Like ijson, only the first item for a repository is used.
+                    if repository is not None and repository not in index:
+                        index[repository] = (item_start, match.end())
+                    item_start = None
+                depth -= 1
+    return index
+
+def get_test_data_set_index() -> dict[str, Tuple[int, int]]:
+    """
+    Get the index of repository names to the byte range of their item in the training
+    and testing data set. The index is stored in a sidecar file next to the data set and
+    is rebuilt if the data set has been modified since the index was built.
+    """
+    global _test_data_set_index
+    data_set_stat = os.stat(test_data_set_path)
+    if _test_data_set_index is not None and _test_data_set_index['mtime_ns'] == data_set_stat.st_mtime_ns \
+            and _test_data_set_index['size'] == data_set_stat.st_size:
+        return _test_data_set_index['repositories']
+    index = None
+    if os.path.exists(test_data_set_index_path):
+        try:
+            index = json.load(open(test_data_set_index_path, 'r'))
+            if index['mtime_ns'] != data_set_stat.st_mtime_ns or index['size'] != data_set_stat.st_size:
+                # The data set has changed since the index was built.
+                index = None
+        except (ValueError, KeyError):
+            logging.warning("Training and testing data set index is corrupt. Rebuilding it.")
+            index = None
+    if index is None:
+        logging.info("Building the training and testing data set index.")
+        index = {
+            'mtime_ns': data_set_stat.st_mtime_ns,
+            'size': data_set_stat.st_size,
+            'repositories': build_test_data_set_index()
+        }
+        json.dump(index, open(test_data_set_index_path, 'w'))
+    _test_data_set_index = index
+    return index['repositories']
+
+_test_data_set_index = None
+"""The loaded training and testing data set index. Used to avoid reloading the sidecar file."""
+
+test_data_set_shards_path = path_relative_to_root('data_collection/raw_data/test_data_set_shards')
+
+test_data_set_shards_manifest_path = os.path.join(test_data_set_shards_path, 'manifest.json')
+
+def get_test_data_shard_path(repository: str) -> str:
+    """
+    Gets the path to the compressed file that holds the training and testing data set
+    for the given repository when the data set is stored in the sharded format.
+
+    :param repository: The repository the shard is for.
+    """
+    return os.path.join(test_data_set_shards_path, get_sanitised_filename(repository) + '.json.gz')
+
+def write_test_data_shard(repository: str, time_period: str, test_data: dict) -> dict:
+    """
+    Write the training and testing data set for one repository to its own compressed file.
+
+    The first line of the file is a small JSON header with the time period and the number
+    of changes for each status. The second line is the data set for the repository. This
+    allows the header to be read without decoding any of the changes.
+
+    :param repository: The repository the data set is for
+    :param time_period: The time period the changes were selected from
+    :param test_data: The changes for the repository keyed by their status
+    :returns: The header that was written, which should be added to the manifest.
+    """
+    os.makedirs(test_data_set_shards_path, exist_ok=True)
+    header = {
+        'repository': repository,
+        'time_period': time_period,
+        'counts': {status: len(changes) for status, changes in test_data.items()}
+    }
+    with gzip.open(get_test_data_shard_path(repository), 'wt', encoding='utf-8') as f:
+        f.write(json.dumps(header) + "\n")
+        f.write(json.dumps(test_data) + "\n")
+    return header
+
+def write_test_data_shards_manifest(headers: dict[str, dict]) -> None:
+    """
+    Write the manifest of the repositories that have a shard in the sharded data set.
+
+    :param headers: The repositories mapped to the header that was written to their shard
+    """
+    os.makedirs(test_data_set_shards_path, exist_ok=True)
+    manifest = {
+        repository: {'file': os.path.basename(get_test_data_shard_path(repository)), **header}
+        for repository, header in headers.items()
+    }
+    # Write to a temporary file first so that readers never see a partially written manifest.
+    temporary_manifest_path = test_data_set_shards_manifest_path + '.tmp'
+    json.dump(manifest, open(temporary_manifest_path, 'w'))
+    os.replace(temporary_manifest_path, test_data_set_shards_manifest_path)
+
+def get_test_data_shards_manifest() -> Optional[dict[str, dict]]:
+    """
+    Get the manifest for the sharded training and testing data set, or None
+    if the data set has not been written in the sharded format.
+    """
+    global _test_data_shards_manifest
+    if not os.path.exists(test_data_set_shards_manifest_path):
+        return None
+    manifest_mtime = os.stat(test_data_set_shards_manifest_path).st_mtime_ns
+    if _test_data_shards_manifest is None or _test_data_shards_manifest[0] != manifest_mtime:
+        _test_data_shards_manifest = (manifest_mtime, json.load(open(test_data_set_shards_manifest_path, 'r')))
+    return _test_data_shards_manifest[1]
+
+_test_data_shards_manifest = None
+"""The mtime and contents of the loaded sharded data set manifest."""
+
+def get_test_data_header_for_repo(repository: str) -> Optional[dict]:
+    """
+    Get the time period and the number of changes for each status in the training and
+    testing data set for the repository. When the data set is sharded, only the header
+    of the shard is read. Otherwise, the data for the repository is loaded and counted.
+
+    :param repository: The repository to get the header for.
+    :returns: A dictionary with the 'time_period' and 'counts' keys, or None if there is no data for this repository.
+    """
+    manifest = get_test_data_shards_manifest()
+    if manifest is not None:
+        if repository not in manifest:
+            return None
+        with gzip.open(os.path.join(test_data_set_shards_path, manifest[repository]['file']), 'rt', encoding='utf-8') as f:
+            header = json.loads(f.readline())
+        return {'time_period': header['time_period'], 'counts': header['counts']}
+    test_data = get_test_data_for_repo(repository)
+    if test_data is None:
+        return None
+    return {'time_period': test_data[0], 'counts': {status: len(changes) for status, changes in test_data[1].items()}}
+
 @lru_cache(maxsize=5)
-def get_test_data_for_repo(repository: str) -> tuple:
+def get_test_data_for_repo(repository: str) -> Optional[tuple]:
     """
     Load the training and testing data set for a given repository. This method
     does not load the full training and testing data set into memory to get the
     training and testing data set for this repository.
 
-    This is done using ijson's kvitems method that iteratively reads the JSON file.
+    If the data set has been written in the sharded format, the shard for the repository
+    is opened directly. Otherwise, the byte range for the repository is looked up in the
+    index generated by ::get_test_data_set_index and then only that part of the file is parsed.
 
     :param repository: The repository to load the testing and training data set for.
+    :returns: The time period and the training and testing data set, or None if there is
+     no data for this repository.
     """
-    with open(path_relative_to_root('data_collection/raw_data/test_data_set.json'), 'rb') as f:
-        for item in ijson.kvitems(f, 'item.' + repository):
-            # Should only be one item with the repository name, so return this.
-            return item
+    manifest = get_test_data_shards_manifest()
+    if manifest is not None:
+        if repository not in manifest:
+            return None
+        with gzip.open(os.path.join(test_data_set_shards_path, manifest[repository]['file']), 'rt', encoding='utf-8') as f:
+            header = json.loads(f.readline())
+            return header['time_period'], json.loads(f.readline())
+    index = get_test_data_set_index()
+    if repository not in index:
+        return None
+    start, end = index[repository]
+    with open(test_data_set_path, 'rb') as f:
+        f.seek(start)
+        item = json.loads(f.read(end - start))
+    # Should only be one time period for the repository, so return this.
+    return next(iter(item[repository].items()), None)
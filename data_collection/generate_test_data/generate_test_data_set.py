@@ -1,3 +1,4 @@
+import argparse
 import datetime
 import json
 import urllib.parse
@@ -198,9 +199,42 @@ def generate_test_data_for_repos(repositories: List[str]):
             print("Error:", repr(e))
             logging.error("Error thrown when generating data: " + str(repr(e)))
 
-repos = list(json.load(open(common.path_relative_to_root("data_collection/raw_data/mediawiki_repos.json"), "r")).keys())
-with open(common.path_relative_to_root("data_collection/raw_data/test_data_set.json"), "w") as f:
-    # Load the training and testing data set for the repositories one-by-one and then save it
-    #  to the data set JSON file in chunks to avoid running out of memory.
-    for chunk in json.JSONEncoder().iterencode(StreamArray(repos, generate_test_data_for_repos)):
-        f.write(chunk)
\ No newline at end of file
+if __name__ == "__main__":
+    argument_parser = argparse.ArgumentParser(
+        description="Generates the training and testing data set for the repositories under mediawiki")
+    argument_parser.add_argument(
+        '--format', choices=["json", "sharded"], default="json",
+        help="Write the data set as one JSON file or as one compressed file per repository with a manifest."
+    )
+    argument_parser.add_argument(
+        '--convert-existing', action='store_true',
+        help="Write the existing test_data_set.json in the sharded format instead of collecting the data again."
+    )
+    command_line_arguments = argument_parser.parse_args()
+    repos = list(json.load(open(common.path_relative_to_root("data_collection/raw_data/mediawiki_repos.json"), "r")).keys())
+    if command_line_arguments.convert_existing:
+        # Convert the already collected data set to the sharded format using the byte range index.
+        headers = {}
+        for repository in common.get_test_data_set_index().keys():
+            test_data = common.get_test_data_for_repo(repository)
+            if test_data is None:
+                continue
+            headers[repository] = common.write_test_data_shard(repository, test_data[0], test_data[1])
+        common.write_test_data_shards_manifest(headers)
+    elif command_line_arguments.format == "sharded":
+        # Write each repository's data set to its own compressed file as soon as it
+        #  has been collected, and update the manifest so that a partial run is still usable.
+        headers = {}
+        for item in generate_test_data_for_repos(repos):
+            for repository, test_data in item.items():
+                if not test_data:
+                    continue
+                time_period, test_data_for_time_period = next(iter(test_data.items()))
+                headers[repository] = common.write_test_data_shard(repository, time_period, test_data_for_time_period)
+            common.write_test_data_shards_manifest(headers)
+    else:
+        with open(common.path_relative_to_root("data_collection/raw_data/test_data_set.json"), "w") as f:
+            # Load the training and testing data set for the repositories one-by-one and then save it
+            #  to the data set JSON file in chunks to avoid running out of memory.
+            for chunk in json.JSONEncoder().iterencode(StreamArray(repos, generate_test_data_for_repos)):
+                f.write(chunk)
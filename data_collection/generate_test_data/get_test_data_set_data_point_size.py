@@ -10,13 +10,12 @@ count = 0
 
 repos = list(json.load(open(common.path_relative_to_root("data_collection/raw_data/mediawiki_repos.json"), "r")).keys())
 for repo in repos:
-    # Load and then count the data for each repository one by one
-    #  as loading the entire data set would use a lot of memory.
-    test_data = common.get_test_data_for_repo(repo)
-    if test_data is None:
+    # Count the data for each repository one by one as loading the entire data set
+    #  would use a lot of memory. If the data set is sharded only the headers are read.
+    test_data_header = common.get_test_data_header_for_repo(repo)
+    if test_data_header is None:
         continue
-    for changes in (test_data[1]).values():
-        count += len(changes)
+    count += sum(test_data_header['counts'].values())
 
 # Print the count out. Used as a script to only generate a number for the report, so this doesn't need
 #  a better output method.
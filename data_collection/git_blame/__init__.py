@@ -3,12 +3,16 @@ import logging
 import re
 from typing import List, Union, Optional, Any
 import common
-from git import Repo, RemoteProgress, Commit, Actor, GitCommandError
+from git import Repo, RemoteProgress, Commit, GitCommandError, Head
+from gitdb.exc import BadName
 import urllib.parse
 import os
 from pathvalidate import sanitize_filename
 from dateutil.relativedelta import relativedelta
+import threading
 import time
+from concurrent.futures import ThreadPoolExecutor
+from data_collection.git_blame.blame_cache import GitBlameCache, get_git_blame_cache
 
 class GitProgressPrinter(RemoteProgress):
     """
@@ -51,7 +55,7 @@ def get_repo(repository: str) -> Repo:
         print("Cloning repository", repository + ". This may take a some time.")
         # Clone the repo if it doesn't already exist
         repo = Repo.clone_from(
-            common.gerrit_url_prefix + urllib.parse.quote(repository, safe='') + '.git',
+            get_remote_url(repository),
             repository_path,
             progress=GitProgressPrinter()
         )
@@ -60,6 +64,46 @@ def get_repo(repository: str) -> Repo:
         repo = Repo(repository_path)
         return repo
 
+def get_remote_url(repository: str) -> str:
+    """
+    Gets the URL that the repository is cloned and fetched from.
+
+    :param repository: The name of the repository
+    """
+    if is_local_remote_url(common.git_remote_url_prefix):
+        # Local mirrors store the repositories in directories named after the repository.
+        return common.git_remote_url_prefix + repository + '.git'
+    return common.git_remote_url_prefix + urllib.parse.quote(repository, safe='') + '.git'
+
+def is_local_remote_url(url: str) -> bool:
+    """
+    Whether the remote URL is a file:// URL or a path on this machine.
+
+    :param url: The URL
+    """
+    return urllib.parse.urlparse(url).scheme in ('', 'file')
+
+def get_bare_repo_path(repository: str) -> str:
+    """
+    Gets the path to the bare cloned repository, which may not exist yet.
+
+    :param repository: The name of the repository
+    """
+    return common.path_relative_to_root(
+        "data_collection/raw_data/git_bare_repos/" + sanitize_filename(re.sub(r'/', '-', repository))
+    )
+
+def is_fetch_head_fresh(repository: str) -> bool:
+    """
+    Whether the bare cloned repository exists and its HEADs were fetched recently enough
+    that they don't need to be fetched again.
+
+    :param repository: The name of the repository
+    """
+    fetch_head_file = get_bare_repo_path(repository) + "/FETCH_HEAD"
+    fetch_expiry = time.mktime((datetime.datetime.now() - relativedelta(hours=2)).timetuple())
+    return os.path.exists(fetch_head_file) and os.stat(fetch_head_file).st_ctime >= fetch_expiry
+
 def get_bare_repo(repository: str, update_heads: bool = False) -> Repo:
     """
     Gets the Repo object for a bare cloned repo.
@@ -68,15 +112,13 @@ def get_bare_repo(repository: str, update_heads: bool = False) -> Repo:
     :param update_heads: Whether the HEADs should be updated if the bare repo already exists
     :return: A object allowing interaction with the bare cloned repository
     """
-    bare_cloned_repository_path = common.path_relative_to_root(
-        "data_collection/raw_data/git_bare_repos/" + sanitize_filename(re.sub(r'/', '-', repository))
-    )
+    bare_cloned_repository_path = get_bare_repo_path(repository)
     if not os.path.exists(bare_cloned_repository_path):
         logging.info("Cloning repo as it doesn't exist")
         print("Cloning repository", repository + ". This may take a some time.")
         # Clone the repo if it doesn't already exist
         repo = Repo.clone_from(
-            common.gerrit_url_prefix + urllib.parse.quote(repository, safe='') + '.git',
+            get_remote_url(repository),
             bare_cloned_repository_path,
             bare=True,
             progress=GitProgressPrinter()
@@ -89,45 +131,228 @@ def get_bare_repo(repository: str, update_heads: bool = False) -> Repo:
         repo = Repo(bare_cloned_repository_path)
         # Check if we should fetch the latest HEADs
         #  based on the last time an update was called.
-        if update_heads:
-            fetch_head_file = bare_cloned_repository_path + "/FETCH_HEAD"
-            fetch_expiry = time.mktime((datetime.datetime.now() - relativedelta(hours=2)).timetuple())
-            if not os.path.exists(fetch_head_file) or os.stat(fetch_head_file).st_ctime < fetch_expiry:
-                # Update the HEADs for the branches
-                logging.debug("Updating heads by a fetch")
-                # First point HEAD to correct head
-                repo.head.reference = repo.create_head(common.get_main_branch_for_repository(repository))
-                # Then fetch heads
-                repo.remote().fetch("refs/heads/*:refs/heads/*", progress=GitProgressPrinter())
+        if update_heads and not is_fetch_head_fresh(repository):
+            # Update the HEADs for the branches
+            logging.debug("Updating heads by a fetch")
+            # First point HEAD to correct head
+            repo.head.reference = repo.create_head(common.get_main_branch_for_repository(repository))
+            # Fetch from the current remote, which may have been changed to a local mirror since the clone.
+            if repo.remote().url != get_remote_url(repository):
+                repo.remote().set_url(get_remote_url(repository))
+            # Then fetch heads
+            repo.remote().fetch("refs/heads/*:refs/heads/*", progress=GitProgressPrinter())
+            # Re-blame the files modified by the fetched commits if the repository is in the ownership index.
+            from data_collection.git_blame.ownership_index import get_ownership_index
+            ownership_index = get_ownership_index()
+            if ownership_index is not None:
+                ownership_index.update(repo, repository)
         return repo
 
-def _generate_stats_for_commit(actor: Actor, commit_date, lines_count: int, result_dictionary: dict) -> None:
-    author_entry: Actor
-    # Skip bots
-    if common.convert_email_to_index_format(actor.email) in common.email_exclude_list:
-        return
-    if common.convert_name_to_index_format(actor.name) in common.username_exclude_list:
-        return
-    if actor.email not in result_dictionary.keys():
-        result_dictionary[actor.email] = {
-            'names': [],
-            'all_time_lines_count': 0,
-            'last_year_lines_count': 0,
-            'last_three_months_lines_count': 0,
-            'last_month_lines_count': 0,
+class _ActorLineCounts:
+    """
+    The line counts for one author or committer, identified by their email.
+    Uses slots as one is created for each actor in the blame of every file.
+    """
+    __slots__ = ('names', 'all_time', 'last_year', 'last_three_months', 'last_month')
+
+    def __init__(self):
+        self.names = []
+        """The names used by this actor in the order they were found"""
+        self.all_time = 0
+        self.last_year = 0
+        self.last_three_months = 0
+        self.last_month = 0
+
+    def to_dict(self) -> dict:
+        return {
+            'names': self.names,
+            'all_time_lines_count': self.all_time,
+            'last_year_lines_count': self.last_year,
+            'last_three_months_lines_count': self.last_three_months,
+            'last_month_lines_count': self.last_month,
         }
-    if actor.name not in result_dictionary[actor.email]['names']:
-        result_dictionary[actor.email]['names'].append(actor.name)
-    result_dictionary[actor.email]['all_time_lines_count'] += lines_count
-    for relative_delta, key in [
-        (relativedelta(month=1), 'month'),
-        (relativedelta(months=3), 'three_months'),
-        (relativedelta(year=1), 'year'),
-    ]:
-        if commit_date > time.mktime((datetime.datetime.now() - relative_delta).timetuple()):
-            result_dictionary[actor.email]['last_' + key + '_lines_count'] += lines_count
-
-def git_blame_stats_for_head_of_branch(files: Union[List[str], str], repository: str, branch: Optional[str] = None, parent_commit_sha: str = None, throw_on_missing_file: bool = False, per_file: bool = False):
+
+class BlameStatsAccumulator:
+    """
+    Accumulates the lines count for each author or committer from the raw git blame
+    entries, split into the time periods. The cutoffs for the time periods are
+    computed once when the accumulator is created instead of for every blame entry.
+    """
+    def __init__(self, now: Optional[datetime.datetime] = None):
+        """
+        :param now: The time the time periods are relative to. Defaults to the current time.
+        """
+        if now is None:
+            now = datetime.datetime.now()
+        self._last_month_cutoff = time.mktime((now - relativedelta(month=1)).timetuple())
+        self._last_three_months_cutoff = time.mktime((now - relativedelta(months=3)).timetuple())
+        self._last_year_cutoff = time.mktime((now - relativedelta(year=1)).timetuple())
+        self._email_exclude_set = frozenset(common.email_exclude_list)
+        self._username_exclude_set = frozenset(common.username_exclude_list)
+        self._line_counts_by_email = {}
+        """Emails mapped to the _ActorLineCounts for that email"""
+        self._line_counts_by_actor = {}
+        """(name, email) pairs mapped to their _ActorLineCounts, or None if the actor is excluded. Avoids
+        re-checking the exclusion lists and names for every blame entry."""
+
+    def add(self, actor_name: str, actor_email: str, commit_date: int, lines_count: int) -> None:
+        """
+        Add the lines from a blame entry to the actor's line counts.
+
+        :param actor_name: The name of the author or committer
+        :param actor_email: The email of the author or committer
+        :param commit_date: The authored or committed date as a unix timestamp
+        :param lines_count: The number of lines in the blame entry
+        """
+        actor = (actor_name, actor_email)
+        if actor in self._line_counts_by_actor:
+            line_counts = self._line_counts_by_actor[actor]
+            if line_counts is None:
+                return
+        else:
+            # Skip bots
+            if common.convert_email_to_index_format(actor_email) in self._email_exclude_set or \
+                    common.convert_name_to_index_format(actor_name) in self._username_exclude_set:
+                self._line_counts_by_actor[actor] = None
+                return
+            line_counts = self._line_counts_by_email.get(actor_email)
+            if line_counts is None:
+                line_counts = self._line_counts_by_email[actor_email] = _ActorLineCounts()
+            if actor_name not in line_counts.names:
+                line_counts.names.append(actor_name)
+            self._line_counts_by_actor[actor] = line_counts
+        line_counts.all_time += lines_count
+        if commit_date > self._last_month_cutoff:
+            line_counts.last_month += lines_count
+        if commit_date > self._last_three_months_cutoff:
+            line_counts.last_three_months += lines_count
+        if commit_date > self._last_year_cutoff:
+            line_counts.last_year += lines_count
+
+    def to_dict(self) -> dict:
+        """
+        Get the line counts as a dictionary of emails to the names and the lines counts for each time period.
+        """
+        return {email: line_counts.to_dict() for email, line_counts in self._line_counts_by_email.items()}
+
+def _blame_file(repo: Repo, commit: Commit, file: str) -> List[list]:
+    """
+    Run git blame on a file at the given commit and return the raw blame entries.
+
+    Each raw blame entry is a list of the lines count, the author name, the author email,
+    the authored date, the committer name, the committer email and the committed date.
+
+    :param repo: The repository to run git blame in
+    :param commit: The commit to blame the file at
+    :param file: The path of the file
+    :raises GitCommandError: If git blame fails, such as when the file doesn't exist.
+    """
+    entries = []
+    for blame_entry in repo.blame_incremental(commit, file, w=True, M=True, C=True):
+        lines_count = blame_entry.linenos.stop - blame_entry.linenos.start
+        commit_entries: Any
+        commit_entries = blame_entry.commit
+        # Through testing the actual type of blame_entry.commit should just be "Commit" instead of a dictionary.
+        # However, incase there is a dictionary returned this is accounted for.
+        if isinstance(commit_entries, dict):
+            commit_entries = list(commit_entries.values())
+        if isinstance(commit_entries, Commit):
+            commit_entries = [commit_entries]
+        commit_entries: List[Commit]
+        for commit_entry in commit_entries:
+            entries.append([
+                lines_count,
+                commit_entry.author.name, commit_entry.author.email, commit_entry.authored_date,
+                commit_entry.committer.name, commit_entry.committer.email, commit_entry.committed_date
+            ])
+    return entries
+
+def _get_branch_head(repo: Repo, branch: str) -> Optional[Head]:
+    """
+    Get the head for the branch in the repository, or None if the branch doesn't exist.
+
+    :param repo: The repository
+    :param branch: The name of the branch or the full reference for the branch (such as refs/heads/master)
+    """
+    return next(filter(lambda x: x.path.replace('refs/heads/', '') == branch or x.path == branch, repo.heads), None)
+
+def resolve_commit(repo: Repo, repository: str, branch: Optional[str] = None, parent_commit_sha: Optional[str] = None) -> Commit:
+    """
+    Resolve the commit that git blame should be run against without modifying the HEAD of
+    the repository. This allows several recommendations to use the same bare repository at once.
+
+    :param repo: The Repo object for the repository
+    :param repository: The name of the repository
+    :param branch: The branch to use if no parent sha is given or it can't be found (if None, the main branch is used)
+    :param parent_commit_sha: A commit SHA in the repository to use instead of the branch if it can be found
+    :returns: The commit to blame files at
+    """
+    if parent_commit_sha:
+        logging.debug("Using parent sha")
+        try:
+            return repo.commit(parent_commit_sha)
+        except (ValueError, BadName):
+            logging.warning("Unable to find sha " + parent_commit_sha + ". Using branch instead.")
+    logging.debug("Using branch.")
+    # Use the "main" branch if no branch specified
+    if not branch:
+        branch = common.get_main_branch_for_repository(repository)
+    head = _get_branch_head(repo, branch)
+    if head is None:
+        # Use main branch instead.
+        head = _get_branch_head(repo, common.get_main_branch_for_repository(repository))
+    if head is None:
+        raise ValueError("Unable to find the branch " + branch + " or the main branch for " + repository)
+    return head.commit
+
+_thread_local_repos = threading.local()
+"""Repo objects for each worker thread, keyed by the path to the git directory."""
+
+def _get_raw_blame_entries_for_file(repo: Optional[Repo], git_dir: str, repository: str, commit_sha: str, file: str,
+                                    blame_cache: Optional[GitBlameCache], throw_on_missing_file: bool) -> Optional[List[list]]:
+    """
+    Get the raw blame entries for a file at a commit, using the git blame cache if provided.
+
+    :param repo: The Repo object to use. If None, a Repo object for the current thread is used.
+    :param git_dir: The path to the git directory of the repository
+    :param repository: The name of the repository
+    :param commit_sha: The SHA of the commit to blame the file at
+    :param file: The path of the file
+    :param blame_cache: The git blame cache, or None to not use the cache
+    :param throw_on_missing_file: Throw an error if the file is missing.
+    :returns: The raw blame entries as returned by ::_blame_file, or None if the file is missing.
+    """
+    entries = None
+    if blame_cache is not None:
+        entries = blame_cache.get(repository, commit_sha, file)
+    if entries is not None:
+        return entries
+    if repo is None:
+        if not hasattr(_thread_local_repos, 'repos'):
+            _thread_local_repos.repos = {}
+        if git_dir not in _thread_local_repos.repos:
+            _thread_local_repos.repos[git_dir] = Repo(git_dir)
+        repo = _thread_local_repos.repos[git_dir]
+    try:
+        entries = _blame_file(repo, repo.commit(commit_sha), file)
+    except GitCommandError as e:
+        # Ignore missing files from the HEAD.
+        #
+        # In cases of patches that depend on another not merged change,
+        #  that change does not contain information we want to get here
+        #  as the change hasn't been merged (thus the committer is not available).
+        #
+        # In this case the file may not exist as it was added in said
+        #  unmerged change.
+        if not throw_on_missing_file and re.search(r'fatal: no such path ' + file, e.stderr):
+            logging.info("File " + file + " doesn't exist in the HEAD commit.")
+            return None
+        raise e
+    if blame_cache is not None:
+        blame_cache.put(repository, commit_sha, file, entries)
+    return entries
+
+def git_blame_stats_for_head_of_branch(files: Union[List[str], str], repository: str, branch: Optional[str] = None, parent_commit_sha: str = None, throw_on_missing_file: bool = False, per_file: bool = False, use_cache: bool = True, max_workers: int = 1, use_ownership_index: bool = True):
     """
     Get git-blame line count stats for the HEAD of the branch or for the specified commit sha over the specified files
      on the repository specified.
@@ -138,83 +363,72 @@ def git_blame_stats_for_head_of_branch(files: Union[List[str], str], repository:
     :param parent_commit_sha: A commit SHA in the repository to use instead of the branch if it can be found
     :param throw_on_missing_file: Throw an error if one of the files is missing (default of False means don't do this).
     :param per_file: Generate the line count stats per file if set to True. Otherwise combine the stats for all files.
+    :param use_cache: Read and store the raw git blame entries in the persistent git blame cache.
+    :param max_workers: The maximum number of files to blame at the same time. The default of 1 blames files one after another.
+    :param use_ownership_index: Read the blame of files not modified since the commit in the ownership index from the index.
     :returns: The line count stats.
     """
     # Get the Repo object for the specified repository
     repo = get_bare_repo(repository)
-    # Use the "main" branch if no branch or parent sha specified
-    if not branch:
-        branch = common.get_main_branch_for_repository(repository)
-    if branch:
-        if parent_commit_sha:
-            logging.debug("Moving to specified branch before trying commit")
-        else:
-            logging.debug("Using branch.")
-        # Update the HEAD to the specified branch if branch is specified
-        try:
-            repo.head.reference = next(filter(lambda x: x.path.replace('refs/heads/', '') == branch or x.path == branch, repo.heads))
-        except StopIteration:
-            # Use main branch instead.
-            branch = common.get_main_branch_for_repository(repository)
-            repo.head.reference = next(filter(lambda x: x.path.replace('refs/heads/', '') == branch or x.path == branch, repo.heads))
-    try:
-        if parent_commit_sha:
-            logging.debug("Using parent sha")
-            parent_commit_sha: str
-            # Update the HEAD to the specified sha commit
-            repo.head.reference = repo.commit(parent_commit_sha)
-    except ValueError:
-        logging.warning("Unable to find sha " + parent_commit_sha + ". Using branch instead.")
+    commit = resolve_commit(repo, repository, branch, parent_commit_sha)
     if isinstance(files, str):
         files = [files]
+    blame_cache = get_git_blame_cache() if use_cache else None
+    indexed_entries = {}
+    if use_ownership_index:
+        from data_collection.git_blame.ownership_index import get_ownership_index
+        ownership_index = get_ownership_index()
+        if ownership_index is not None:
+            indexed_entries = ownership_index.get_entries(repo, repository, commit.hexsha, files)
+    # Only blame the files which are not covered by the ownership index.
+    files_to_blame = [file for file in files if file not in indexed_entries]
+    if max_workers > 1 and len(files_to_blame) > 1:
+        # Blame the files in parallel. Each worker thread uses its own Repo object as these
+        #  are not safe to share between threads. The results are returned in the same order
+        #  as the files so that the stats are built in the same order as the serial path.
+        with ThreadPoolExecutor(max_workers=min(max_workers, len(files_to_blame))) as executor:
+            blamed_entries = dict(zip(files_to_blame, executor.map(
+                lambda file: _get_raw_blame_entries_for_file(
+                    None, repo.git_dir, repository, commit.hexsha, file, blame_cache, throw_on_missing_file
+                ),
+                files_to_blame
+            )))
+        entries_for_files = (
+            indexed_entries[file] if file in indexed_entries else blamed_entries[file] for file in files
+        )
+    else:
+        entries_for_files = (
+            indexed_entries[file] if file in indexed_entries else _get_raw_blame_entries_for_file(
+                repo, repo.git_dir, repository, commit.hexsha, file, blame_cache, throw_on_missing_file
+            ) for file in files
+        )
+    # Compute the time period cutoffs once for every file.
+    now = datetime.datetime.now()
     authors = {}
     committers = {}
-    for file in files:
+    authors_accumulator = BlameStatsAccumulator(now)
+    committers_accumulator = BlameStatsAccumulator(now)
+    for file, entries in zip(files, entries_for_files):
         if per_file:
             authors[file] = {}
             committers[file] = {}
-        try:
-            for blame_entry in repo.blame_incremental(repo.head, file, w=True, M=True, C=True):
-                lines_count = blame_entry.linenos.stop - blame_entry.linenos.start
-                commit_entries: Any
-                commit_entries = blame_entry.commit
-                # Through testing the actual type of blame_entry.commit should just be "Commit" instead of a dictionary.
-                # However, incase there is a dictionary returned this is accounted for.
-                if isinstance(commit_entries, dict):
-                    commit_entries = list(commit_entries.values())
-                if isinstance(commit_entries, Commit):
-                    commit_entries = [commit_entries]
-                commit_entries: List[Commit]
-                for commit_entry in commit_entries:
-                    # Assign the author of the commit the lines in the file
-                    if per_file:
-                        # If in "per file" mode add the stats to a separate list for this file.
-                        _generate_stats_for_commit(
-                            commit_entry.author, commit_entry.authored_date, lines_count, authors[file]
-                        )
-                        _generate_stats_for_commit(
-                            commit_entry.committer, commit_entry.committed_date, lines_count, committers[file]
-                        )
-                    else:
-                        _generate_stats_for_commit(
-                            commit_entry.author, commit_entry.authored_date, lines_count, authors
-                        )
-                        _generate_stats_for_commit(
-                            commit_entry.committer, commit_entry.committed_date, lines_count, committers
-                        )
-        except GitCommandError as e:
-            # Ignore missing files from the HEAD.
-            #
-            # In cases of patches that depend on another not merged change,
-            #  that change does not contain information we want to get here
-            #  as the change hasn't been merged (thus the committer is not available).
-            #
-            # In this case the file may not exist as it was added in said
-            #  unmerged change.
-            if not throw_on_missing_file and re.search(r'fatal: no such path ' + file, e.stderr):
-                logging.info("File " + file + " doesn't exist in the HEAD commit.")
-                continue
-            raise e
+        if entries is None:
+            # File doesn't exist in the commit.
+            continue
+        if per_file:
+            # If in "per file" mode add the stats to a separate list for this file.
+            authors_accumulator = BlameStatsAccumulator(now)
+            committers_accumulator = BlameStatsAccumulator(now)
+        for lines_count, author_name, author_email, authored_date, committer_name, committer_email, committed_date in entries:
+            # Assign the author and committer of the commit the lines in the file
+            authors_accumulator.add(author_name, author_email, authored_date, lines_count)
+            committers_accumulator.add(committer_name, committer_email, committed_date, lines_count)
+        if per_file:
+            authors[file] = authors_accumulator.to_dict()
+            committers[file] = committers_accumulator.to_dict()
+    if not per_file:
+        authors = authors_accumulator.to_dict()
+        committers = committers_accumulator.to_dict()
     return {
         'authors': authors,
         'committers': committers
@@ -0,0 +1,160 @@
+"""
+A persistent cache of git blame results. The blame of a file at a given commit
+never changes, so the raw blame entries are stored keyed by the repository,
+the resolved commit SHA and the path of the file. The least recently used
+entries are evicted when the cache grows larger than its size limit.
+"""
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+import zlib
+from typing import List, Optional
+
+import common
+
+DEFAULT_CACHE_PATH = common.path_relative_to_root("data_collection/raw_data/git_blame_cache.sqlite3")
+
+DEFAULT_MAX_SIZE_BYTES = 512 * 1024 * 1024
+
+class GitBlameCache:
+    """
+    Stores the raw git blame entries for a file at a commit in a SQLite database.
+
+    Each raw blame entry is a list of the lines count, the author name, the author email, the
+    authored date, the committer name, the committer email and the committed date.
+    """
+    def __init__(self, path: str = DEFAULT_CACHE_PATH, max_size_bytes: int = DEFAULT_MAX_SIZE_BYTES):
+        """
+        Open (and create if needed) the git blame cache.
+
+        :param path: The path to the SQLite database file
+        :param max_size_bytes: The maximum size of the stored blame entries before the least recently used are evicted.
+        """
+        self.max_size_bytes = max_size_bytes
+        """The maximum size in bytes of the stored (compressed) blame entries."""
+        self._lock = threading.Lock()
+        """Serialises use of the connection when the cache is shared between threads."""
+        self._connection = sqlite3.connect(path, timeout=60, check_same_thread=False)
+        """The connection to the SQLite database."""
+        with self._lock, self._connection:
+            self._connection.executescript("""
+                CREATE TABLE IF NOT EXISTS blame (
+                    repository TEXT NOT NULL,
+                    commit_sha TEXT NOT NULL,
+                    path TEXT NOT NULL,
+                    entries BLOB NOT NULL,
+                    size INTEGER NOT NULL,
+                    last_used REAL NOT NULL,
+                    PRIMARY KEY (repository, commit_sha, path)
+                );
+                CREATE INDEX IF NOT EXISTS blame_last_used ON blame (last_used);
+                CREATE TABLE IF NOT EXISTS total_size (size INTEGER NOT NULL);
+                INSERT INTO total_size SELECT 0 WHERE NOT EXISTS (SELECT 1 FROM total_size);
+                CREATE TRIGGER IF NOT EXISTS blame_insert AFTER INSERT ON blame BEGIN
+                    UPDATE total_size SET size = size + new.size;
+                END;
+                CREATE TRIGGER IF NOT EXISTS blame_update AFTER UPDATE OF size ON blame BEGIN
+                    UPDATE total_size SET size = size - old.size + new.size;
+                END;
+                CREATE TRIGGER IF NOT EXISTS blame_delete AFTER DELETE ON blame BEGIN
+                    UPDATE total_size SET size = size - old.size;
+                END;
+            """)
+
+    def get(self, repository: str, commit_sha: str, path: str) -> Optional[List[list]]:
+        """
+        Get the raw blame entries for a file at a commit.
+
+        :param repository: The repository the file is in
+        :param commit_sha: The full SHA of the commit that was blamed
+        :param path: The path of the file
+        :returns: The raw blame entries, or None if they are not in the cache.
+        """
+        with self._lock, self._connection:
+            row = self._connection.execute(
+                "SELECT entries FROM blame WHERE repository = ? AND commit_sha = ? AND path = ?",
+                (repository, commit_sha, path)
+            ).fetchone()
+            if row is None:
+                return None
+            # Mark the entry as recently used so that it is evicted last.
+            self._connection.execute(
+                "UPDATE blame SET last_used = ? WHERE repository = ? AND commit_sha = ? AND path = ?",
+                (time.time(), repository, commit_sha, path)
+            )
+        return json.loads(zlib.decompress(row[0]))
+
+    def put(self, repository: str, commit_sha: str, path: str, entries: List[list]) -> None:
+        """
+        Store the raw blame entries for a file at a commit, evicting the least recently used
+        entries if this makes the cache larger than its maximum size.
+
+        :param repository: The repository the file is in
+        :param commit_sha: The full SHA of the commit that was blamed
+        :param path: The path of the file
+        :param entries: The raw blame entries
+        """
+        compressed_entries = zlib.compress(json.dumps(entries, separators=(',', ':')).encode('utf-8'))
+        with self._lock, self._connection:
+            self._connection.execute(
+                "INSERT INTO blame (repository, commit_sha, path, entries, size, last_used) VALUES (?, ?, ?, ?, ?, ?) "
+                "ON CONFLICT (repository, commit_sha, path) DO UPDATE SET "
+                "entries = excluded.entries, size = excluded.size, last_used = excluded.last_used",
+                (repository, commit_sha, path, compressed_entries, len(compressed_entries), time.time())
+            )
+            self._evict()
+
+    def _evict(self) -> None:
+        """
+        Delete the least recently used entries until the cache is within its maximum size.
+        Must be called while holding the lock and inside a transaction.
+        """
+        total_size = self._connection.execute("SELECT size FROM total_size").fetchone()[0]
+        if total_size <= self.max_size_bytes:
+            return
+        # Free a bit more than needed so that eviction doesn't happen on every insert.
+        size_to_free = total_size - int(self.max_size_bytes * 0.9)
+        rows_to_delete = []
+        for rowid, size in self._connection.execute("SELECT rowid, size FROM blame ORDER BY last_used"):
+            rows_to_delete.append((rowid,))
+            size_to_free -= size
+            if size_to_free <= 0:
+                break
+        logging.debug("Evicting " + str(len(rows_to_delete)) + " entries from the git blame cache.")
+        self._connection.executemany("DELETE FROM blame WHERE rowid = ?", rows_to_delete)
+
+    def size(self) -> int:
+        """
+        The total size in bytes of the stored (compressed) blame entries.
+        """
+        with self._lock:
+            return self._connection.execute("SELECT size FROM total_size").fetchone()[0]
+
+    def clear(self) -> None:
+        """
+        Remove all entries from the cache.
+        """
+        with self._lock, self._connection:
+            self._connection.execute("DELETE FROM blame")
+
+_git_blame_cache = None
+"""The GitBlameCache shared by calls in this process. Created on first use."""
+
+_git_blame_cache_process_id = None
+"""The ID of the process that created the shared GitBlameCache, as a connection can't be used after a fork."""
+
+_git_blame_cache_lock = threading.Lock()
+
+def get_git_blame_cache() -> GitBlameCache:
+    """
+    Get the git blame cache shared by this process, creating it if needed.
+    """
+    global _git_blame_cache, _git_blame_cache_process_id
+    with _git_blame_cache_lock:
+        if _git_blame_cache is None or _git_blame_cache_process_id != os.getpid():
+            _git_blame_cache = GitBlameCache()
+            _git_blame_cache_process_id = os.getpid()
+        return _git_blame_cache
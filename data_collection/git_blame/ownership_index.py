@@ -0,0 +1,287 @@
+"""
+A persistent index of the line ownership of every file in a repository at a given commit.
+
+The index is built by blaming every file at the HEAD of a branch once. After each fetch
+it is updated by only re-blaming the files that were modified by the new commits. When
+recommending, the ownership of files not modified between the indexed commit and the
+commit being blamed is read from the index instead of running git blame again. Files
+that are not covered by the index are still blamed live.
+
+The raw blame entries (as returned by git_blame._blame_file) are stored instead of the line
+counts for each time period, as the time periods are relative to when the stats are generated.
+
+Can be run as a script to build or update the index for the repositories provided.
+"""
+import argparse
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Optional, Iterable, Iterator
+
+from git import Repo, Commit
+
+import common
+from data_collection import git_blame
+
+DEFAULT_INDEX_PATH = common.path_relative_to_root("data_collection/raw_data/git_ownership_index.sqlite3")
+
+MAX_FILE_SIZE = 500_000
+"""Files larger than this are not indexed, as recommendations skip these files."""
+
+class OwnershipIndex:
+    """
+    Stores the raw git blame entries for every file in a repository at one indexed commit.
+    """
+    def __init__(self, path: str = DEFAULT_INDEX_PATH):
+        """
+        Open (and create if needed) the ownership index.
+
+        :param path: The path to the SQLite database file
+        """
+        self._lock = threading.Lock()
+        """Serialises use of the connection when the index is shared between threads."""
+        self._connection = sqlite3.connect(path, timeout=60, check_same_thread=False)
+        """The connection to the SQLite database."""
+        with self._lock, self._connection:
+            self._connection.executescript("""
+                CREATE TABLE IF NOT EXISTS indexed_commits (
+                    repository TEXT PRIMARY KEY,
+                    branch TEXT NOT NULL,
+                    commit_sha TEXT NOT NULL,
+                    updated REAL NOT NULL
+                );
+                CREATE TABLE IF NOT EXISTS ownership (
+                    repository TEXT NOT NULL,
+                    path TEXT NOT NULL,
+                    entries BLOB NOT NULL,
+                    PRIMARY KEY (repository, path)
+                );
+            """)
+
+    def get_indexed_commit(self, repository: str) -> Optional[tuple[str, str]]:
+        """
+        Get the branch and the SHA of the commit that the index for the repository was built at.
+
+        :param repository: The repository
+        :returns: The branch and commit SHA, or None if the repository has not been indexed.
+        """
+        with self._lock:
+            return self._connection.execute(
+                "SELECT branch, commit_sha FROM indexed_commits WHERE repository = ?", (repository,)
+            ).fetchone()
+
+    def build(self, repo: Repo, repository: str, branch: Optional[str] = None, max_workers: int = 1) -> None:
+        """
+        Build the index for the repository from scratch by blaming every file at the HEAD of the branch.
+
+        :param repo: The Repo object for the bare repository
+        :param repository: The name of the repository
+        :param branch: The branch to index. Defaults to the main branch of the repository.
+        :param max_workers: The maximum number of files to blame at the same time.
+        """
+        if not branch:
+            branch = common.get_main_branch_for_repository(repository)
+        commit = git_blame.resolve_commit(repo, repository, branch)
+        logging.info("Building the ownership index for " + repository + " at " + commit.hexsha)
+        with self._lock, self._connection:
+            self._connection.execute("DELETE FROM ownership WHERE repository = ?", (repository,))
+            self._connection.execute("DELETE FROM indexed_commits WHERE repository = ?", (repository,))
+        self._index_files(repo, repository, commit, self._get_files_to_index(commit), max_workers)
+        self._set_indexed_commit(repository, branch, commit)
+
+    def update(self, repo: Repo, repository: str, max_workers: int = 1) -> None:
+        """
+        Update the index for the repository to the current HEAD of the indexed branch by only
+        re-blaming the files modified since the indexed commit. The index is rebuilt if the
+        indexed commit is no longer an ancestor of the HEAD of the branch.
+
+        :param repo: The Repo object for the bare repository
+        :param repository: The name of the repository
+        :param max_workers: The maximum number of files to blame at the same time.
+        """
+        indexed_commit = self.get_indexed_commit(repository)
+        if indexed_commit is None:
+            return
+        branch, indexed_commit_sha = indexed_commit
+        commit = git_blame.resolve_commit(repo, repository, branch)
+        if commit.hexsha == indexed_commit_sha:
+            return
+        if not repo.is_ancestor(indexed_commit_sha, commit.hexsha):
+            logging.info("Indexed commit for " + repository + " is no longer on " + branch + ". Rebuilding the index.")
+            self.build(repo, repository, branch, max_workers)
+            return
+        modified_files = self._get_modified_files(repo, indexed_commit_sha, commit.hexsha)
+        logging.info("Updating the ownership index for " + repository + " with " + str(len(modified_files)) + " modified files.")
+        files_to_index = self._get_files_to_index(commit)
+        rows = list(self._blame_files(repo, repository, commit, [file for file in modified_files if file in files_to_index], max_workers))
+        # Write the modified files and the new indexed commit in one transaction, so that the entries
+        #  for the new commit are never read as the entries at the old indexed commit.
+        with self._lock, self._connection:
+            # Remove the files that were deleted or are now too large to index.
+            self._connection.executemany(
+                "DELETE FROM ownership WHERE repository = ? AND path = ?",
+                [(repository, file) for file in modified_files if file not in files_to_index]
+            )
+            self._insert_rows(rows)
+            self._execute_set_indexed_commit(repository, branch, commit)
+
+    def get_entries(self, repo: Repo, repository: str, commit_sha: str, files: Iterable[str]) -> dict[str, List[list]]:
+        """
+        Get the raw blame entries for the files at the given commit that are covered by the index.
+
+        A file is covered if it is in the index and no commit between the indexed commit and
+        the given commit modified it, as the blame of the file is then the same at both commits.
+
+        :param repo: The Repo object for the bare repository
+        :param repository: The name of the repository
+        :param commit_sha: The SHA of the commit the files are being blamed at
+        :param files: The files being blamed
+        :returns: The files that are covered by the index mapped to their raw blame entries.
+        """
+        indexed_commit = self.get_indexed_commit(repository)
+        if indexed_commit is None:
+            return {}
+        indexed_commit_sha = indexed_commit[1]
+        files = set(files)
+        if commit_sha != indexed_commit_sha:
+            if repo.is_ancestor(commit_sha, indexed_commit_sha):
+                files.difference_update(self._get_modified_files(repo, commit_sha, indexed_commit_sha))
+            elif repo.is_ancestor(indexed_commit_sha, commit_sha):
+                files.difference_update(self._get_modified_files(repo, indexed_commit_sha, commit_sha))
+            else:
+                # The commits are on diverged branches, so the index can't be used.
+                return {}
+        entries = {}
+        with self._lock:
+            for file in files:
+                row = self._connection.execute(
+                    "SELECT entries FROM ownership WHERE repository = ? AND path = ?", (repository, file)
+                ).fetchone()
+                if row is not None:
+                    entries[file] = json.loads(zlib.decompress(row[0]))
+        return entries
+
+    @staticmethod
+    def _get_files_to_index(commit: Commit) -> set[str]:
+        """
+        Get the paths of the files in the commit that should be indexed.
+        """
+        return {
+            item.path for item in commit.tree.traverse()
+            if item.type == 'blob' and item.size <= MAX_FILE_SIZE
+        }
+
+    @staticmethod
+    def _get_modified_files(repo: Repo, from_commit_sha: str, to_commit_sha: str) -> set[str]:
+        """
+        Get the paths of the files modified between the two commits. This is the files which differ
+        between the two commits, which includes files only changed by merge commits, and the files
+        modified by any commit between them, which includes files changed and then reverted. The
+        blame of a reverted file still changes, as the reverted lines are blamed on the revert.
+        """
+        modified_files = repo.git.diff('--name-only', '--no-renames', from_commit_sha, to_commit_sha).splitlines()
+        modified_files += repo.git.log('-m', '--name-only', '--no-renames', '--format=', from_commit_sha + '..' + to_commit_sha).splitlines()
+        return set(filter(None, modified_files))
+
+    def _blame_files(self, repo: Repo, repository: str, commit: Commit, files: Iterable[str], max_workers: int) -> Iterator[tuple]:
+        """
+        Blame the files at the commit, yielding the rows to store in the index.
+        """
+        files = sorted(files)
+        with ThreadPoolExecutor(max_workers=max(1, max_workers)) as executor:
+            results = executor.map(
+                lambda file: git_blame._get_raw_blame_entries_for_file(  # noqa
+                    None, repo.git_dir, repository, commit.hexsha, file, None, False
+                ),
+                files
+            )
+            for number_processed, (file, entries) in enumerate(zip(files, results), start=1):
+                if number_processed % 100 == 0 or number_processed == len(files):
+                    logging.debug("Indexed " + str(number_processed) + " out of " + str(len(files)) + " files.")
+                if entries is not None:
+                    yield repository, file, zlib.compress(json.dumps(entries, separators=(',', ':')).encode('utf-8'))
+
+    def _index_files(self, repo: Repo, repository: str, commit: Commit, files: Iterable[str], max_workers: int) -> None:
+        """
+        Blame the files at the commit and store the raw blame entries in the index in batches.
+        """
+        rows = []
+        for row in self._blame_files(repo, repository, commit, files, max_workers):
+            rows.append(row)
+            if len(rows) >= 100:
+                with self._lock, self._connection:
+                    self._insert_rows(rows)
+                rows = []
+        with self._lock, self._connection:
+            self._insert_rows(rows)
+
+    def _insert_rows(self, rows: List[tuple]) -> None:
+        # The caller must hold the lock and be in a transaction.
+        self._connection.executemany(
+            "INSERT INTO ownership (repository, path, entries) VALUES (?, ?, ?) "
+            "ON CONFLICT (repository, path) DO UPDATE SET entries = excluded.entries",
+            rows
+        )
+
+    def _set_indexed_commit(self, repository: str, branch: str, commit: Commit) -> None:
+        with self._lock, self._connection:
+            self._execute_set_indexed_commit(repository, branch, commit)
+
+    def _execute_set_indexed_commit(self, repository: str, branch: str, commit: Commit) -> None:
+        # The caller must hold the lock and be in a transaction.
+        self._connection.execute(
+            "INSERT INTO indexed_commits (repository, branch, commit_sha, updated) VALUES (?, ?, ?, ?) "
+            "ON CONFLICT (repository) DO UPDATE SET "
+            "branch = excluded.branch, commit_sha = excluded.commit_sha, updated = excluded.updated",
+            (repository, branch, commit.hexsha, time.time())
+        )
+
+_ownership_index = None
+"""The OwnershipIndex shared by calls in this process. Created on first use."""
+
+_ownership_index_process_id = None
+"""The ID of the process that created the shared OwnershipIndex, as a connection can't be used after a fork."""
+
+_ownership_index_lock = threading.Lock()
+
+def get_ownership_index(create: bool = False) -> Optional[OwnershipIndex]:
+    """
+    Get the ownership index shared by this process.
+
+    :param create: Create the index file if it doesn't exist. If False and the index
+     doesn't exist, None is returned.
+    """
+    global _ownership_index, _ownership_index_process_id
+    with _ownership_index_lock:
+        if _ownership_index is None or _ownership_index_process_id != os.getpid():
+            if not create and not os.path.exists(DEFAULT_INDEX_PATH):
+                return None
+            _ownership_index = OwnershipIndex()
+            _ownership_index_process_id = os.getpid()
+        return _ownership_index
+
+if __name__ == "__main__":
+    logging.basicConfig(
+        filename=common.path_relative_to_root("logs/git_ownership_index.log.txt"),
+        level=logging.DEBUG
+    )
+    argument_parser = argparse.ArgumentParser(
+        description="Builds or updates the line ownership index for the provided repositories")
+    argument_parser.add_argument('repositories', nargs='+', help="The repositories to index")
+    argument_parser.add_argument('--branch', help="The branch to index (default is the main branch)", default=None, required=False)
+    argument_parser.add_argument('--rebuild', action='store_true', help="Rebuild the index instead of updating it")
+    argument_parser.add_argument('--workers', type=int, default=4, help="The number of files to blame at the same time")
+    command_line_arguments = argument_parser.parse_args()
+    ownership_index = get_ownership_index(create=True)
+    for repository in command_line_arguments.repositories:
+        print("Indexing", repository)
+        repo = git_blame.get_bare_repo(repository)
+        if command_line_arguments.rebuild or ownership_index.get_indexed_commit(repository) is None:
+            ownership_index.build(repo, repository, command_line_arguments.branch, command_line_arguments.workers)
+        else:
+            ownership_index.update(repo, repository, command_line_arguments.workers)
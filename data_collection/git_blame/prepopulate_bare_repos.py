@@ -1,14 +1,69 @@
 """
 Script used to mass create the bared cloned repositories,
 as doing this when trying to make recommendations is very inefficent.
+
+Repositories are cloned or fetched concurrently using a pool of workers. The number of
+repositories being cloned or fetched from the same host at once is limited so that the
+remote is not overloaded, unless the repositories are cloned from a local mirror using
+--remote-url-prefix. Repositories which were fetched recently are skipped, so the script
+can be re-run to resume after being stopped.
 """
+import contextlib
 import json
 import logging
+import threading
 import time
+import urllib.parse
 from argparse import ArgumentParser
+from concurrent.futures import ThreadPoolExecutor, as_completed
 
 import common
-from data_collection.git_blame import get_bare_repo
+from data_collection.git_blame import get_bare_repo, get_remote_url, is_fetch_head_fresh, is_local_remote_url
+
+def get_repositories_to_process(repositories: list[str]) -> list[str]:
+    """
+    Get the repositories which need to be cloned or fetched, skipping those fetched recently
+    so that a stopped run can be resumed.
+
+    :param repositories: The names of the repositories
+    """
+    return [repository for repository in repositories if not is_fetch_head_fresh(repository)]
+
+def get_host_semaphores(repositories: list[str], per_host_limit: int) -> dict[str, threading.Semaphore]:
+    """
+    Create the semaphores which limit the concurrent clones or fetches for each remote host.
+    Local remotes are not limited.
+
+    :param repositories: The names of the repositories
+    :param per_host_limit: The maximum number of clones or fetches from the same host at the same time
+    """
+    return {
+        urllib.parse.urlparse(get_remote_url(repository)).netloc: threading.Semaphore(per_host_limit)
+        for repository in repositories if not is_local_remote_url(get_remote_url(repository))
+    }
+
+def prepopulate_bare_repo(repository: str, host_semaphores: dict[str, threading.Semaphore]) -> bool:
+    """
+    Clone the bare repository if it doesn't exist or otherwise fetch the HEADs if needed.
+
+    :param repository: The name of the repository
+    :param host_semaphores: The semaphores which limit the concurrent clones or fetches for each host, as returned by ::get_host_semaphores
+    :returns: Whether the repository was successfully cloned or fetched.
+    """
+    remote_url = get_remote_url(repository)
+    if is_local_remote_url(remote_url):
+        host_limit = contextlib.nullcontext()
+    else:
+        host_limit = host_semaphores[urllib.parse.urlparse(remote_url).netloc]
+    try:
+        with host_limit:
+            # Call get_bare_repo which will download the bare repository if it doesn't exist
+            #  and also refreshes the HEADs in the branch if needed.
+            get_bare_repo(repository, True)
+        return True
+    except BaseException as e:
+        logging.exception("Failed to download " + repository, exc_info=e)
+        return False
 
 if __name__ == "__main__":
     logging.basicConfig(
@@ -16,24 +71,41 @@ if __name__ == "__main__":
         level=logging.DEBUG
     )
     argument_parser = ArgumentParser(
-        description="Generates file counts for provided repositories")
-    argument_parser.add_argument('repositories', nargs='*', help="The repositories to file count")
+        description="Clones or fetches the bare repositories for the provided repositories")
+    argument_parser.add_argument('repositories', nargs='*', help="The repositories to clone or fetch. Defaults to all repositories")
+    argument_parser.add_argument('--workers', type=int, default=4, help="The number of repositories to clone or fetch at the same time")
+    argument_parser.add_argument('--per-host-limit', type=int, default=2, help="The maximum number of clones or fetches from the same host at the same time. Not applied to local remotes.")
+    argument_parser.add_argument('--remote-url-prefix', default=None, help="Clone and fetch from this URL prefix instead of Gerrit, such as file:///srv/mirror/ for a local mirror containing <repository>.git")
     arguments = argument_parser.parse_args()
+    if arguments.remote_url_prefix:
+        common.git_remote_url_prefix = arguments.remote_url_prefix
     if not len(arguments.repositories):
         repos_and_associated_members = json.load(open(
             common.path_relative_to_root("data_collection/raw_data/members_of_mediawiki_repos.json")
         ))
-        repositories = repos_and_associated_members['groups_for_repository'].keys()
+        repositories = list(repos_and_associated_members['groups_for_repository'].keys())
     else:
         repositories = arguments.repositories
-    for number_processed, repo in enumerate(repositories):
-        try:
-            print("Processed", number_processed, "repos out of", str(len(repositories)) + ". Currently processing", repo)
-            logging.info("Processed " + str(number_processed) + " repos. Currently processing " + repo)
-            # Call get_bare_repo which will download the bare repository if it doesn't exist
-            #  and also refreshes the HEADs in the branch if needed.
-            get_bare_repo(repo, True)
-            time.sleep(1)
-        except BaseException as e:
-            logging.exception("Failed to download" + repo, exc_info=e)
-            pass
\ No newline at end of file
+    repositories_to_process = get_repositories_to_process(repositories)
+    print("Skipping", len(repositories) - len(repositories_to_process), "repos which were recently fetched.")
+    host_semaphores = get_host_semaphores(repositories_to_process, arguments.per_host_limit)
+    start_time = time.time()
+    failed = []
+    with ThreadPoolExecutor(max_workers=max(1, arguments.workers)) as executor:
+        futures = {
+            executor.submit(prepopulate_bare_repo, repository, host_semaphores): repository
+            for repository in repositories_to_process
+        }
+        for number_processed, future in enumerate(as_completed(futures), start=1):
+            repository = futures[future]
+            if not future.result():
+                failed.append(repository)
+            elapsed = time.time() - start_time
+            eta = elapsed / number_processed * (len(repositories_to_process) - number_processed)
+            print(
+                "Processed", number_processed, "repos out of", str(len(repositories_to_process)) + ".",
+                "Finished", repository + ".", "Elapsed: %ds, ETA: %ds" % (elapsed, eta)
+            )
+            logging.info("Processed " + str(number_processed) + " repos. Finished " + repository)
+    if failed:
+        print("Failed to clone or fetch", len(failed), "repos:", ", ".join(failed))
@@ -4,15 +4,16 @@ Common functions used for the evalaution of the implementations.
 import copy
 import json
 import logging
+from abc import ABC, abstractmethod
 from enum import Enum
 from functools import lru_cache
-from typing import Callable, Union, List, Tuple
+from typing import Any, Callable, Union, List, Sequence, Tuple, Type
 import random
 
 from sklearn.exceptions import NotFittedError
 
 import common
-from recommender import Recommendations
+from recommender import Recommendations, RecommendedReviewer
 
 
 class KValues(Enum):
@@ -57,19 +58,188 @@ def get_reviewers_and_approvers_for_change(change_info: dict) -> Tuple[set, set,
             actual_reviewers_emails.add(common.convert_email_to_index_format(vote['email']))
     return actual_approvers_names, actual_approvers_emails, actual_reviewers_names, actual_reviewers_emails
 
-def top_k_accuracy_for_repo(
-        method: Callable[[dict], Recommendations], repository: str, num_changes: int, branch: Union[str, None]
-) -> dict[str, dict[str, dict[str, float]]]:
+def reviewer_has_name_in(reviewer: RecommendedReviewer, names: set) -> bool:
     """
-    Performs the Top-k evaluation for the repository using the method provided in the first argument.
+    Whether any of the names of the recommended reviewer are in the set of names in index format.
+    """
+    return any(name for name in reviewer.names if common.convert_name_to_index_format(name) in names)
+
+def reviewer_has_email_in(reviewer: RecommendedReviewer, emails: set) -> bool:
+    """
+    Whether any of the emails of the recommended reviewer are in the set of emails in index format.
+    """
+    return any(email for email in reviewer.emails if common.convert_email_to_index_format(email) in emails)
+
+class ActualReviewers:
+    """
+    The names and emails of the users who actually voted on and approved a change.
+    """
+    def __init__(self, change_info: dict):
+        """
+        :param change_info: The change info dictionary for the change, including the code review votes.
+        """
+        self.approvers_names, self.approvers_emails, self.reviewers_names, self.reviewers_emails = \
+            get_reviewers_and_approvers_for_change(change_info)
+
+    def approved(self, reviewer: RecommendedReviewer) -> bool:
+        """
+        Whether the recommended reviewer actually approved the change.
+        """
+        return reviewer_has_name_in(reviewer, self.approvers_names) or reviewer_has_email_in(reviewer, self.approvers_emails)
+
+    def voted(self, reviewer: RecommendedReviewer) -> bool:
+        """
+        Whether the recommended reviewer actually voted on the change.
+        """
+        return reviewer_has_name_in(reviewer, self.reviewers_names) or reviewer_has_email_in(reviewer, self.reviewers_emails)
+
+class EvaluationMetric(ABC):
+    """
+    A metric that is calculated from the recommendations made for each change in the evaluation.
+    A new instance is used for each status of change that is evaluated.
+    """
+    name = ""
+    """The key the results for this metric are stored under"""
+    include_partial_results = True
+    """Whether to return the results so far if the evaluation stops early because the model is not fitted."""
+
+    @abstractmethod
+    def add_change(self, recommendations: Recommendations, ordered_recommendations: List[RecommendedReviewer],
+                   actual_reviewers: ActualReviewers) -> None:
+        """
+        Add the recommendations for a change to the metric.
+
+        :param recommendations: The recommendations made for the change
+        :param ordered_recommendations: The recommendations ordered by their score
+        :param actual_reviewers: The users who actually voted on and approved the change
+        """
+        return NotImplemented
+
+    @abstractmethod
+    def get_result(self, num_changes: int):
+        """
+        Get the result of the metric over the changes added.
+
+        :param num_changes: The number of changes that was requested to be evaluated.
+        """
+        return NotImplemented
+
+class TopKMetric(EvaluationMetric):
+    """
+    The Top-k accuracy for each value of k in KValues.
+    """
+    name = "top-k"
+
+    def __init__(self):
+        self._hits = {"approved": {k.value: 0 for k in KValues}, "voted": {k.value: 0 for k in KValues}}
+        """The number of changes where an actual approver or voter was in the top k recommendations"""
+
+    def add_change(self, recommendations: Recommendations, ordered_recommendations: List[RecommendedReviewer],
+                   actual_reviewers: ActualReviewers) -> None:
+        for vote_type, is_actual_reviewer in [("approved", actual_reviewers.approved), ("voted", actual_reviewers.voted)]:
+            # Find the position of the first recommended reviewer who actually approved or voted,
+            #  as the change counts towards every value of k greater than this position.
+            position = next((
+                position for position, reviewer in enumerate(ordered_recommendations[:max(k.value for k in KValues)])
+                if is_actual_reviewer(reviewer)
+            ), None)
+            if position is None:
+                continue
+            for k in self._hits[vote_type].keys():
+                if position < k:
+                    self._hits[vote_type][k] += 1
+
+    def get_result(self, num_changes: int) -> dict[str, dict[int, float]]:
+        return {
+            vote_type: {k: hits / num_changes for k, hits in hits_for_k.items()}
+            for vote_type, hits_for_k in self._hits.items()
+        }
+
+class MRRMetric(EvaluationMetric):
+    """
+    The mean reciprocal rank of the first recommended reviewer who approved or voted on each change.
+    """
+    name = "mrr"
+    include_partial_results = False
+
+    def __init__(self):
+        self._mrr_score_for_approved = 0
+        self._mrr_score_for_voted = 0
+
+    def add_change(self, recommendations: Recommendations, ordered_recommendations: List[RecommendedReviewer],
+                   actual_reviewers: ActualReviewers) -> None:
+        # The ranks are taken from the order the recommendations were added in.
+        recommended_reviewers = recommendations.recommendations
+        # MRR score for approvers
+        for position, reviewer in enumerate(recommended_reviewers):
+            if actual_reviewers.approved(reviewer):
+                self._mrr_score_for_approved += 1/(position+1)
+                break
+        else:
+            # If no recommended reviewer actually approved, then use the length of the list
+            self._mrr_score_for_approved += 1/len(recommended_reviewers)
+        # MRR score for voters
+        for position, reviewer in enumerate(recommended_reviewers):
+            if reviewer_has_name_in(reviewer, actual_reviewers.reviewers_names):
+                self._mrr_score_for_voted += 1/(position+1)
+                break
+            if reviewer_has_email_in(reviewer, actual_reviewers.reviewers_emails):
+                self._mrr_score_for_approved += 1/(position+1)
+                break
+        else:
+            # If no recommended reviewer actually voted, then use the length of the list
+            self._mrr_score_for_voted += 1/len(recommended_reviewers)
+
+    def get_result(self, num_changes: int) -> dict[str, float]:
+        # Perform the rest of the MRR equation.
+        return {"approved": (1 / num_changes) * self._mrr_score_for_approved, "voted": (1 / num_changes) * self._mrr_score_for_voted}
+
+def evaluate_changes(method: Callable[[dict], Recommendations], changes: List[dict], num_changes: int,
+                     metrics: Sequence[EvaluationMetric]) -> bool:
+    """
+    Get the recommendations for each change once and add them to every metric.
 
     :param method: The method to call to get the recommendations
-    :param repository: The repository to perform the Top-k evaluation on
-    :param num_changes: The number of changes to analyse to perform Top-k evaluation
+    :param changes: The change info dictionaries for the changes to evaluate
+    :param num_changes: The number of changes to analyse. The first "num_changes" changes are used.
+    :param metrics: The metrics to add the recommendations to
+    :return: Whether every change was evaluated. False if the model used by the method is not fitted.
+    """
+    try:
+        for change_info in changes[:num_changes]:
+            # Remove possibility for cheating by the implementations by removing code review votes
+            #  and reviewers on change from change_info.
+            sanitised_change_info = copy.copy(change_info)
+            del sanitised_change_info['code_review_votes']
+            del sanitised_change_info['reviewers']
+            actual_reviewers = ActualReviewers(change_info)
+            # Get recommendations from the function/method provided.
+            recommendations = method(sanitised_change_info)
+            ordered_recommendations = recommendations.ordered_by_score()
+            for metric in metrics:
+                metric.add_change(recommendations, ordered_recommendations, actual_reviewers)
+    except NotFittedError as e:
+        logging.error("Model not fitted. Skipping this model", exc_info=e)
+        return False
+    return True
+
+def evaluate_repository(
+        method: Callable[[dict], Recommendations], repository: str, num_changes: int, branch: Union[str, None],
+        metric_types: Sequence[Type[EvaluationMetric]] = (TopKMetric, MRRMetric)
+) -> dict[str, dict[str, Any]]:
+    """
+    Evaluates the method on the repository using each metric. The changes are sampled once
+    for each status and the recommendations for each change are used by every metric, so
+    the results of the metrics are for the same recommendations.
+
+    :param method: The method to call to get the recommendations
+    :param repository: The repository to perform the evaluation on
+    :param num_changes: The number of changes to analyse for each status of change
     :param branch: The branch these changes should be selected from
-    :return: The Top-k accuracy scores
+    :param metric_types: The metrics to calculate
+    :return: The results for each status of change, keyed by the metric name
     """
-    top_k_accuracies_for_repo = {}
+    results = {metric_type.name: {} for metric_type in metric_types}
     test_data = common.get_test_data_for_repo(repository)
     test_data = test_data[1]
     for status, sub_test_data in test_data.items():
@@ -77,7 +247,6 @@ def top_k_accuracy_for_repo(
         if branch is not None:
             # Filter for changes from the specified branch only
             test_data = {k: v for k, v in sub_test_data.items() if v['branch'] == branch}
-        # Use test_train_split to shuffle appropriately and then select the first "num_changes" changes as the test data
         for change_id in sub_test_data.keys():
             sub_test_data[change_id]["id"] = change_id
         # If the changes in this part of the test data have
@@ -85,54 +254,33 @@ def top_k_accuracy_for_repo(
         sub_test_data = list(sub_test_data.values())
         if len(sub_test_data) <= 1:
             continue
-        # Perform Top-k evaluation for the changes with the specified status
-        top_k_accuracies_for_repo[status] = {"approved": {}, "voted": {}}
-        # Shuffle the data and then take the top "num_changes"
+        # Shuffle the data so that the first "num_changes" changes are a random sample
         random.shuffle(sub_test_data)
-        if len(sub_test_data) > num_changes:
-            sub_test_data = sub_test_data[:num_changes]
-        # Prepare the result dictionary for the repository
-        top_k_accuracies_for_repo[status] = {}
-        top_k_accuracies_for_repo[status]["approved"] = {k.value: 0 for k in KValues}
-        top_k_accuracies_for_repo[status]["voted"] = {k.value: 0 for k in KValues}
-        try:
-            for change_info in sub_test_data:
-                # Remove possibility for cheating by the implementations by removing code review votes
-                #  and reviewers on change from change_info.
-                sanitised_change_info = copy.copy(change_info)
-                del sanitised_change_info['code_review_votes']
-                del sanitised_change_info['reviewers']
-                actual_approvers_names, actual_approvers_emails, actual_reviewers_names, actual_reviewers_emails = get_reviewers_and_approvers_for_change(
-                    change_info)
-                # Get recommendations from the function/method provided.
-                recommendations = method(sanitised_change_info)
-                for k in KValues:
-                    # Perform the Top-k evaluation for this particular value of k.
-                    k = k.value
-                    recommended_reviewers = recommendations.top_n(k)
-                    # Perform the Top-k evaluation for approvers
-                    for reviewer in recommended_reviewers:
-                        if any(name for name in reviewer.names if common.convert_name_to_index_format(name) in actual_approvers_names):
-                            top_k_accuracies_for_repo[status]["approved"][k] += (1/num_changes)
-                            break
-                        if any(email for email in reviewer.emails if common.convert_email_to_index_format(email) in actual_approvers_emails):
-                            top_k_accuracies_for_repo[status]["approved"][k] += (1/num_changes)
-                            break
-                    # Perform the Top-k evaluation for voters
-                    for reviewer in recommended_reviewers:
-                        if any(name for name in reviewer.names if common.convert_name_to_index_format(name) in actual_reviewers_names):
-                            top_k_accuracies_for_repo[status]["voted"][k] += (1/num_changes)
-                            break
-                        if any(email for email in reviewer.emails if common.convert_email_to_index_format(email) in actual_reviewers_emails):
-                            top_k_accuracies_for_repo[status]["voted"][k] += (1/num_changes)
-                            break
-        except NotFittedError as e:
-            logging.error("Model not fitted. Skipping this model", exc_info=e)
-    return top_k_accuracies_for_repo
+        metrics = [metric_type() for metric_type in metric_types]
+        completed = evaluate_changes(method, sub_test_data, num_changes, metrics)
+        for metric in metrics:
+            results[metric.name][status] = metric.get_result(num_changes) if completed or metric.include_partial_results else {}
+    return results
+
+def top_k_accuracy_for_repo(
+        method: Callable[[dict], Recommendations], repository: str, num_changes: int, branch: Union[str, None]
+) -> dict[str, dict[str, dict[str, float]]]:
+    """
+    Performs the Top-k evaluation for the repository using the method provided in the first argument.
+    Use ::evaluate_repository to calculate the Top-k accuracy and MRR scores from the same recommendations.
+
+    :param method: The method to call to get the recommendations
+    :param repository: The repository to perform the Top-k evaluation on
+    :param num_changes: The number of changes to analyse to perform Top-k evaluation
+    :param branch: The branch these changes should be selected from
+    :return: The Top-k accuracy scores
+    """
+    return evaluate_repository(method, repository, num_changes, branch, [TopKMetric])[TopKMetric.name]
 
 def mrr_result_for_repo(method: Callable[[dict], Recommendations], repository: str, num_changes: int, branch: Union[str, None]) -> dict[str, dict[str, float]]:
     """
     Performs MRR results for the repository provided using the method to get the recommendation.
+    Use ::evaluate_repository to calculate the Top-k accuracy and MRR scores from the same recommendations.
 
     :param method: The method to call to get the recommendations
     :param repository: The repository to perform the MRR evaluation on
@@ -140,66 +288,7 @@ def mrr_result_for_repo(method: Callable[[dict], Recommendations], repository: s
     :param branch: The branch these changes should be selected from
     :return: The MRR scores
     """
-    # MRR results for repositories
-    mrr_results_for_repo = {}
-    test_data = common.get_test_data_for_repo(repository)
-    test_data = test_data[1]
-    for status, sub_test_data in test_data.items():
-        logging.debug("Status: " + status)
-        if branch is not None:
-            # Filter for changes from the specified branch only
-            test_data = {k: v for k, v in sub_test_data.items() if v['branch'] == branch}
-        # Use test_train_split to shuffle appropriately and then select the first "num_changes" changes as the test data
-        for change_id in sub_test_data.keys():
-            sub_test_data[change_id]["id"] = change_id
-        # Skip if there are one or no changes in the appropriate part of the training and testing
-        #  data set.
-        sub_test_data = list(sub_test_data.values())
-        if len(sub_test_data) <= 1:
-            continue
-        mrr_results_for_repo[status] = {}
-        # Shuffle the testing data and then select the top "num_changes" changes
-        random.shuffle(sub_test_data)
-        sub_test_data = sub_test_data[:num_changes]
-        mrr_score_for_approved = 0
-        mrr_score_for_voted = 0
-        try:
-            for change_info in sub_test_data:
-                # Remove possibility for cheating by removing code review votes and reviewers on change from change_info
-                sanitised_change_info = copy.copy(change_info)
-                del sanitised_change_info['code_review_votes']
-                del sanitised_change_info['reviewers']
-                # Get recommendation
-                recommended_reviewers = method(sanitised_change_info).recommendations
-                actual_approvers_names, actual_approvers_emails, actual_reviewers_names, actual_reviewers_emails = get_reviewers_and_approvers_for_change(change_info)
-                # MRR score for approvers
-                for position, reviewer in enumerate(recommended_reviewers):
-                    if any(name for name in reviewer.names if common.convert_name_to_index_format(name) in actual_approvers_names):
-                        mrr_score_for_approved += 1/(position+1)
-                        break
-                    if any(email for email in reviewer.emails if common.convert_email_to_index_format(email) in actual_approvers_emails):
-                        mrr_score_for_approved += 1/(position+1)
-                        break
-                else:
-                    # If no recommended reviewer actually approved, then use the length of the list
-                    mrr_score_for_approved += 1/len(recommended_reviewers)
-                # MRR score for voters
-                for position, reviewer in enumerate(recommended_reviewers):
-                    if any(name for name in reviewer.names if common.convert_name_to_index_format(name) in actual_reviewers_names):
-                        mrr_score_for_voted += 1/(position+1)
-                        break
-                    if any(email for email in reviewer.emails if common.convert_email_to_index_format(email) in actual_reviewers_emails):
-                        mrr_score_for_approved += 1/(position+1)
-                        break
-                else:
-                    # If no recommended reviewer actually approved, then use the length of the list
-                    mrr_score_for_voted += 1/len(recommended_reviewers)
-            # Perform the rest of the MRR equation.
-            mrr_results_for_repo[status]["approved"] = (1 / num_changes) * mrr_score_for_approved
-            mrr_results_for_repo[status]["voted"] = (1 / num_changes) * mrr_score_for_voted
-        except NotFittedError as e:
-            logging.error("Model not fitted. Skipping.", exc_info=e)
-    return mrr_results_for_repo
+    return evaluate_repository(method, repository, num_changes, branch, [MRRMetric])[MRRMetric.name]
 
 @lru_cache(maxsize=1)
 def get_repos_to_use_for_evaluation() -> List[str]:
@@ -25,15 +25,12 @@ for number_processed, repository in enumerate(repos_and_associated_members['grou
     print("Tallying", repository)
     # Get the test data for the repository to check that the repository could be used
     #  for the evaluation
-    test_data = common.get_test_data_for_repo(repository)
-    if test_data is None:
+    test_data_header = common.get_test_data_header_for_repo(repository)
+    if test_data_header is None:
         # If the test data is not available, then skip this repository
         continue
-    time_period = test_data[0]
-    test_data = test_data[1]
-    test_data_change_counts_per_repo[time_period][repository] = 0
-    for status, sub_test_data in test_data.items():
-        test_data_change_counts_per_repo[time_period][repository] += len(sub_test_data)
+    time_period = test_data_header['time_period']
+    test_data_change_counts_per_repo[time_period][repository] = sum(test_data_header['counts'].values())
 
 
 # Choose repos from each time period based on their counts choosing 10 repositories from
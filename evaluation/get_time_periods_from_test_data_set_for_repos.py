@@ -17,16 +17,14 @@ for repository in arguments.repositories:
     # Get the changes count for each repository and store the associated
     #  time period too.
     print("Repository", repository, end=': ')
-    test_data = common.get_test_data_for_repo(repository)
-    if test_data is None:
+    test_data_header = common.get_test_data_header_for_repo(repository)
+    if test_data_header is None:
         print("0 from undefined time period.")
         continue
-    changes_count = 0
-    for changes in test_data[1].values():
-        changes_count += len(changes)
-    print(changes_count, "from", test_data[0])
+    changes_count = sum(test_data_header['counts'].values())
+    print(changes_count, "from", test_data_header['time_period'])
     repository_test_data_changes_count[repository] = {
-        "time_period": test_data[0],
+        "time_period": test_data_header['time_period'],
         "changes_count": changes_count
     }
 
@@ -8,11 +8,15 @@ import sys
 import pandas
 
 import common
-from evaluation import top_k_accuracy_for_repo, mrr_result_for_repo
-from recommender.neural_network_recommender.neural_network_recommender import ModelMode, MLPClassifierImplementation, \
-    SelectionMode
+from evaluation import TopKMetric, MRRMetric
+from evaluation.scheduler import EvaluationCell, run_cells
+from recommender import RecommenderImplementationBase
+from recommender.neural_network_recommender import MLPClassifierImplementationBase
+from recommender.neural_network_recommender.neural_network_recommender import ModelMode, SelectionMode
 
 if __name__ == "__main__":
+    # Store the base DataFrames on disk so that later evaluation runs can load them instead of building them.
+    MLPClassifierImplementationBase.use_base_data_frame_snapshots = True
     if len(sys.argv) > 1:
         # Accept command line arguments using the argparse library.
         argument_parser = argparse.ArgumentParser(
@@ -42,11 +46,25 @@ if __name__ == "__main__":
         argument_parser.add_argument(
             '--exclude-merged', action='store_true', help="Exclude the merged models from evaluation"
         )
+        argument_parser.add_argument(
+            '--workers', type=int, default=1, help="The number of repository, model type and selection mode combinations to evaluate at the same time in separate processes"
+        )
+        argument_parser.add_argument(
+            '--seed', type=int, default=0, help="The seed used to derive the seed for each combination, which selects the changes to test with"
+        )
+        argument_parser.add_argument(
+            '--use-signal-cache', action='store_true', help="Store the git blame stats and other signals for each change in the signal cache, and reuse them if already stored when re-running the evaluation"
+        )
         command_line_arguments = argument_parser.parse_args()
         repositories = command_line_arguments.repositories
         branch = command_line_arguments.branch
         num_changes = command_line_arguments.num_changes
         raw = command_line_arguments.raw
+        workers = max(1, command_line_arguments.workers)
+        seed = command_line_arguments.seed
+        # Set on the base class so that all the implementations use the signal cache. These options are
+        #  copied to the processes used to evaluate by run_cells.
+        RecommenderImplementationBase.use_signal_cache = command_line_arguments.use_signal_cache
         test_models = []
         # Generate the models used for the evaluation by adding those
         #  which are not excluded based on flags in the command line arguments.
@@ -91,40 +109,23 @@ if __name__ == "__main__":
         else:
             test_models = [ModelMode(model_mode)]
         raw = False
+        workers = 1
+        seed = 0
     logging.info("Evaluating with the repos " + str(repositories))
-    # Store the Top-k and MRR metric scores, to be saved to a JSON file later.
-    top_k_accuracies = {}
-    mrr_score = {}
+    # Evaluate each repository, model type and selection mode separately.
+    cells = []
     for repository in repositories:
-        try:
-            print("Evaluating", repository + ":")
-            test_data_for_repo = common.get_test_data_for_repo(repository)
-            if test_data_for_repo is None:
-                # Skip if no test data for repo.
-                print("No test data for", repository + ". Skipping.")
-                continue
-            time_period = test_data_for_repo[0]
-            top_k_accuracies[repository] = {}
-            mrr_score[repository] = {}
-            for model in test_models:
-                print(" Evaluating using model type", model.value + ":")
-                top_k_accuracies[repository][model.value] = {}
-                mrr_score[repository][model.value] = {}
-                for selection_mode in SelectionMode:
-                    print("  Evaluating using selection mode", selection_mode.value)
-                    try:
-                        top_k_accuracies[repository][model.value][selection_mode.value] = top_k_accuracy_for_repo(
-                            MLPClassifierImplementation(repository, model, selection_mode, time_period=time_period).recommend_using_change_info, repository, num_changes, branch
-                        )
-                        mrr_score[repository][model.value][selection_mode.value] = mrr_result_for_repo(
-                            MLPClassifierImplementation(repository, model, selection_mode, time_period=time_period).recommend_using_change_info, repository, num_changes, branch
-                        )
-                    except BaseException as e:
-                        # Model does not exist, so skip.
-                        continue
-        except BaseException as e:
-            print("Error:", e)
-            logging.error("Error occurred. Moving to next repo.", exc_info=e)
+        if common.get_test_data_header_for_repo(repository) is None:
+            # Skip if no test data for repo.
+            print("No test data for", repository + ". Skipping.")
+            continue
+        for model in test_models:
+            for selection_mode in SelectionMode:
+                cells.append(EvaluationCell(repository, num_changes, branch, model, selection_mode))
+    results = run_cells(cells, workers, seed)
+    # Store the Top-k and MRR metric scores, to be saved to a JSON file later.
+    top_k_accuracies = results[TopKMetric.name]
+    mrr_score = results[MRRMetric.name]
     if raw:
         # If the results are requested in a raw format, just print the result dictionary
         print({'top-k': top_k_accuracies, 'mrr': mrr_score})
@@ -152,5 +153,4 @@ if __name__ == "__main__":
         except BaseException as e:
             pass
     # Export the results to a JSON file for analysis
-    json.dump({'top-k': top_k_accuracies, 'mrr': mrr_score},
-              open(common.path_relative_to_root("evaluation/results/neural_network_recommender.json"), 'w'))
\ No newline at end of file
+    json.dump(results, open(common.path_relative_to_root("evaluation/results/neural_network_recommender.json"), 'w'))
\ No newline at end of file
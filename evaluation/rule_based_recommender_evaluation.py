@@ -8,7 +8,9 @@ import sys
 import pandas
 
 import common
-from evaluation import top_k_accuracy_for_repo, mrr_result_for_repo
+from evaluation import TopKMetric, MRRMetric
+from evaluation.scheduler import EvaluationCell, run_cells
+from recommender import RecommenderImplementationBase
 from recommender.rule_based_recommender import RuleBasedImplementation
 
 if __name__ == "__main__":
@@ -26,11 +28,29 @@ if __name__ == "__main__":
         argument_parser.add_argument(
             '--raw', action='store_true', help="Return results as the raw result dictionary"
         )
+        argument_parser.add_argument(
+            '--workers', type=int, default=1, help="The number of repositories to evaluate at the same time in separate processes"
+        )
+        argument_parser.add_argument(
+            '--seed', type=int, default=0, help="The seed used to derive the seed for each repository, which selects the changes to test with"
+        )
+        argument_parser.add_argument(
+            '--use-signal-cache', action='store_true', help="Store the git blame stats and other signals for each change in the signal cache, and reuse them if already stored when re-running the evaluation"
+        )
+        argument_parser.add_argument(
+            '--scoring-engine', action='store_true', help="Score the users using the vectorised scoring engine. The results are not comparable with those from the default scoring, as the engine sums the signals of users found under several names or emails instead of averaging them"
+        )
         command_line_arguments = argument_parser.parse_args()
         repositories = command_line_arguments.repositories
         branch = command_line_arguments.branch
         num_changes = command_line_arguments.num_changes
         raw = command_line_arguments.raw
+        workers = max(1, command_line_arguments.workers)
+        seed = command_line_arguments.seed
+        # Set on the base class so that all the implementations use the signal cache. These options are
+        #  copied to the processes used to evaluate by run_cells.
+        RecommenderImplementationBase.use_signal_cache = command_line_arguments.use_signal_cache
+        RuleBasedImplementation.use_scoring_engine = command_line_arguments.scoring_engine
     else:
         # Allow input of arguments using input statements.
         repositories = [input("Please enter the repository:").strip()]
@@ -47,23 +67,13 @@ if __name__ == "__main__":
             except ValueError:
                 print("Number of changes was not an integer. Please try again.")
         raw = False
+        workers = 1
+        seed = 0
     logging.info("Evaluating with the repos " + str(repositories))
-    # Perform the evaluation for Top-k and MRR
-    top_k_accuracies = {}
-    mrr_score = {}
-    try:
-        for repository in repositories:
-            print("Evaluating", repository)
-            top_k_accuracies[repository] = top_k_accuracy_for_repo(
-                RuleBasedImplementation(repository).recommend_using_change_info, repository, num_changes, branch
-            )
-            mrr_score[repository] = mrr_result_for_repo(
-                RuleBasedImplementation(repository).recommend_using_change_info, repository, num_changes, branch
-            )
-    except BaseException as e:
-        # If there is an error, just stop here and export the already generated results.
-        print("Error:", e)
-        logging.error("Error occurred. Exiting early.", exc_info=e)
+    # Perform the evaluation for Top-k and MRR, with each repository evaluated separately.
+    results = run_cells([EvaluationCell(repository, num_changes, branch) for repository in repositories], workers, seed)
+    top_k_accuracies = results[TopKMetric.name]
+    mrr_score = results[MRRMetric.name]
     if raw:
         # Print out the dictionary if the results were requested in a raw format
         print({'top-k': top_k_accuracies, 'mrr': mrr_score})
@@ -81,4 +91,4 @@ if __name__ == "__main__":
             print(pandas.DataFrame.from_dict(repository_mrr))
 
     # Export the generated stats to a JSON file.
-    json.dump({'top-k': top_k_accuracies, 'mrr': mrr_score}, open(common.path_relative_to_root("evaluation/results/rule_based_recommender.json"), 'w'))
\ No newline at end of file
+    json.dump(results, open(common.path_relative_to_root("evaluation/results/rule_based_recommender.json"), 'w'))
\ No newline at end of file
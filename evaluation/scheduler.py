@@ -0,0 +1,189 @@
+"""
+Runs the evaluation of independent "cells" in a pool of processes. A cell is a repository
+for the rule based implementation, or a repository, model type and selection mode for the
+neural network implementation.
+
+Each cell seeds the random number generators with a seed derived from the base seed and the
+cell, so the changes sampled for a cell (and the order chosen by the random selection modes)
+don't depend on how many processes are used or the order the cells finish in.
+
+The options the evaluation scripts set as class attributes on the implementations are copied
+to each process when it starts, so they are used whichever start method the processes use.
+"""
+import logging
+import random
+import time
+import zlib
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from typing import List, Optional, Tuple
+
+import numpy
+
+import common
+from evaluation import evaluate_repository, TopKMetric, MRRMetric
+from recommender import RecommenderImplementationBase
+from recommender.neural_network_recommender import MLPClassifierImplementationBase
+from recommender.neural_network_recommender.neural_network_recommender import MLPClassifierImplementation, ModelMode, \
+    SelectionMode
+from recommender.rule_based_recommender import RuleBasedImplementation
+
+_implementation_options = [
+    (RecommenderImplementationBase, 'use_signal_cache'),
+    (RuleBasedImplementation, 'use_scoring_engine'),
+    (RuleBasedImplementation, 'scoring_engine_top_n'),
+    (MLPClassifierImplementationBase, 'use_base_data_frame_snapshots'),
+]
+"""The class attributes used as options by the evaluation scripts, which are copied to the processes used by ::run_cells."""
+
+def _get_implementation_options() -> list:
+    """
+    Get the values of the options in ::_implementation_options.
+    """
+    return [getattr(cls, name) for cls, name in _implementation_options]
+
+def _set_implementation_options(values: list) -> None:
+    """
+    Set the options in ::_implementation_options to the values got by ::_get_implementation_options
+    in the process that started this one.
+    """
+    for (cls, name), value in zip(_implementation_options, values):
+        setattr(cls, name, value)
+
+class EvaluationCell:
+    """
+    An independent part of the evaluation, which is evaluated in one process.
+    """
+    def __init__(self, repository: str, num_changes: int, branch: Optional[str] = None,
+                 model_mode: Optional[ModelMode] = None, selection_mode: Optional[SelectionMode] = None):
+        """
+        :param repository: The repository to evaluate
+        :param num_changes: The number of changes to analyse for each status of change
+        :param branch: The branch the changes should be selected from
+        :param model_mode: The type of model to evaluate. None to evaluate the rule based implementation.
+        :param selection_mode: The selection mode used by the neural network implementation
+        """
+        self.repository = repository
+        self.num_changes = num_changes
+        self.branch = branch
+        self.model_mode = model_mode
+        """The type of model to evaluate, or None if the rule based implementation is evaluated"""
+        self.selection_mode = selection_mode
+
+    @property
+    def key(self) -> Tuple[str, ...]:
+        """
+        The keys the results for this cell are stored under in the results dictionary.
+        """
+        if self.model_mode is None:
+            return self.repository,
+        return self.repository, self.model_mode.value, self.selection_mode.value
+
+    def get_seed(self, seed: int) -> int:
+        """
+        Get the seed for this cell from the base seed.
+        """
+        return zlib.crc32("/".join(self.key).encode('utf-8'), seed & 0xFFFFFFFF)
+
+def evaluate_cell(cell: EvaluationCell, seed: int) -> Tuple[Optional[dict], float]:
+    """
+    Evaluate the cell. This is run in the processes used by ::run_cells.
+
+    :param cell: The cell to evaluate
+    :param seed: The base seed
+    :returns: The Top-k and MRR results keyed by the metric name, or None if the cell was skipped,
+     along with the number of seconds taken.
+    """
+    start_time = time.perf_counter()
+    cell_seed = cell.get_seed(seed)
+    random.seed(cell_seed)
+    numpy.random.seed(cell_seed)
+    if cell.model_mode is None:
+        implementation = RuleBasedImplementation(cell.repository)
+    else:
+        test_data_header = common.get_test_data_header_for_repo(cell.repository)
+        if test_data_header is None:
+            # Skip if no test data for repo.
+            return None, time.perf_counter() - start_time
+        try:
+            implementation = MLPClassifierImplementation(
+                cell.repository, cell.model_mode, cell.selection_mode, time_period=test_data_header['time_period']
+            )
+        except Exception as e:
+            # The model may not exist, so skip.
+            logging.warning("Unable to load the models for " + str(cell.key), exc_info=e)
+            return None, time.perf_counter() - start_time
+    results = evaluate_repository(implementation.recommend_using_change_info, cell.repository, cell.num_changes, cell.branch)
+    return results, time.perf_counter() - start_time
+
+def run_cells(cells: List[EvaluationCell], workers: int = 1, seed: int = 0) -> dict:
+    """
+    Evaluate the cells using a pool of processes and merge the results. If stopped early by
+    a keyboard interrupt or an error, the results for the cells that finished are returned.
+
+    :param cells: The cells to evaluate
+    :param workers: The number of processes to use. 1 evaluates the cells in this process.
+    :param seed: The base seed used to derive the seed for each cell
+    :returns: The Top-k and MRR results and the seconds taken, keyed by "top-k", "mrr" and "timings"
+     and then by the keys of each cell.
+    """
+    cell_results = {}
+    start_time = time.time()
+    try:
+        if workers <= 1:
+            for number_evaluated, cell in enumerate(cells, start=1):
+                try:
+                    cell_results[cell.key] = evaluate_cell(cell, seed)
+                except Exception as e:
+                    logging.error("Evaluation failed for " + str(cell.key), exc_info=e)
+                _print_evaluation_progress(cell, number_evaluated, len(cells), start_time)
+        else:
+            with ProcessPoolExecutor(
+                    max_workers=workers, initializer=_set_implementation_options, initargs=(_get_implementation_options(),)
+            ) as executor:
+                futures = {executor.submit(evaluate_cell, cell, seed): cell for cell in cells}
+                try:
+                    for number_evaluated, future in enumerate(as_completed(futures), start=1):
+                        cell = futures[future]
+                        try:
+                            cell_results[cell.key] = future.result()
+                        except Exception as e:
+                            logging.error("Evaluation failed for " + str(cell.key), exc_info=e)
+                        _print_evaluation_progress(cell, number_evaluated, len(cells), start_time)
+                except BaseException:
+                    # Don't start evaluating the remaining cells.
+                    executor.shutdown(wait=False, cancel_futures=True)
+                    raise
+    except BaseException as e:
+        # If stopped early, just stop here and return the already generated results.
+        print("Error:", e)
+        logging.error("Error occurred. Exiting early.", exc_info=e)
+    return merge_results(cells, cell_results)
+
+def merge_results(cells: List[EvaluationCell], cell_results: dict[Tuple[str, ...], Tuple[Optional[dict], float]]) -> dict:
+    """
+    Merge the results for each cell into one dictionary, in the order of the cells.
+    """
+    merged = {TopKMetric.name: {}, MRRMetric.name: {}, 'timings': {}}
+    for cell in cells:
+        if cell.key not in cell_results:
+            continue
+        results, seconds = cell_results[cell.key]
+        _set_nested(merged['timings'], cell.key, seconds)
+        if results is None:
+            continue
+        for metric_name in [TopKMetric.name, MRRMetric.name]:
+            _set_nested(merged[metric_name], cell.key, results[metric_name])
+    return merged
+
+def _set_nested(dictionary: dict, keys: Tuple[str, ...], value) -> None:
+    for key in keys[:-1]:
+        dictionary = dictionary.setdefault(key, {})
+    dictionary[keys[-1]] = value
+
+def _print_evaluation_progress(cell: EvaluationCell, number_evaluated: int, number_of_cells: int, start_time: float) -> None:
+    elapsed = time.time() - start_time
+    eta = elapsed / number_evaluated * (number_of_cells - number_evaluated)
+    print(
+        "Evaluated", " ".join(cell.key) + ".", number_evaluated, "out of", number_of_cells, "done.",
+        "Elapsed: %ds, ETA: %ds" % (elapsed, eta)
+    )
@@ -0,0 +1,172 @@
+"""
+Compares the under-sampling modes for the neural network recommender by training the
+same models using each mode and recording the wall time taken to scale, under-sample
+and train, along with the Top-k accuracy and MRR score on the held-out testing changes.
+
+The Top-k and MRR scores are calculated by ranking the users for each testing change
+using the probability given by the model, so the saved models are not modified.
+"""
+import argparse
+import json
+import logging
+import random
+import time
+from typing import List, Tuple
+
+import numpy
+import pandas
+from sklearn.exceptions import NotFittedError
+from sklearn.model_selection import train_test_split
+
+import common
+from evaluation import KValues
+from recommender.neural_network_recommender.neural_network_recommender import ModelMode
+from recommender.neural_network_recommender.neural_network_recommender_trainer import MLPClassifierTrainer, \
+    ModelScalerAndData, TrainingMode
+from recommender.neural_network_recommender.under_sampling import UnderSamplingMode
+
+def get_training_and_testing_data_frames(trainer: MLPClassifierTrainer, repository: str) -> Tuple[List[Tuple[str, pandas.DataFrame]], List[Tuple[str, pandas.DataFrame]]]:
+    """
+    Split the changes in the test data set for the repository into training and testing
+    changes, and generate the DataFrame for each change.
+
+    :returns: The status and DataFrame for each training change and for each testing change.
+    """
+    training_data_frames = []
+    testing_data_frames = []
+    test_data = common.get_test_data_for_repo(repository)
+    if test_data is None:
+        return training_data_frames, testing_data_frames
+    time_period, test_data = test_data
+    base_data_frame_for_repo = trainer.preprocess_into_pandas_data_frame(repository)[time_period]
+    for status, sub_test_data in test_data.items():
+        for change_id in sub_test_data.keys():
+            sub_test_data[change_id]["id"] = change_id
+        sub_test_data = list(sub_test_data.values())
+        if len(sub_test_data) <= 1:
+            # Skip if only one or zero changes.
+            continue
+        train, test = train_test_split(sub_test_data)
+        for data_frames, changes in [(training_data_frames, train), (testing_data_frames, test)]:
+            for change_info in changes:
+                try:
+                    data_frames.append((status, trainer.get_training_and_testing_change_specific_data_frame(
+                        repository, change_info, base_data_frame_for_repo
+                    )))
+                except BaseException as e:
+                    if isinstance(e, KeyboardInterrupt):
+                        raise e
+                    logging.error("Unable to generate the DataFrame for change " + str(change_info['id']), exc_info=e)
+    return training_data_frames, testing_data_frames
+
+def top_k_and_mrr_for_model(model: ModelScalerAndData, target: str) -> Tuple[dict[int, float], float]:
+    """
+    Calculate the Top-k accuracy and MRR score for the model on its (scaled) testing data, where
+    the users for each change are ranked by the probability the model gives for the target.
+    As for ::evaluation.mrr_result_for_repo, a change with no correct user in the ranking scores
+    one divided by the number of users.
+    """
+    top_k = {k.value: 0 for k in KValues}
+    mrr_score = 0
+    changes = [change for change in model.scaled_testing_changes if len(model.testing_data.get_features(change))]
+    for change in changes:
+        probabilities = model.model.predict_proba(model.testing_data.get_data_frame(change))[:, list(model.model.classes_).index(True)]
+        actual = model.testing_data.get_labels(target, change)[numpy.argsort(-probabilities, kind='stable')]
+        for k in top_k.keys():
+            if actual[:k].any():
+                top_k[k] += 1 / len(changes)
+        mrr_score += 1 / (int(numpy.argmax(actual)) + 1) if actual.any() else 1 / len(actual)
+    return top_k, mrr_score / len(changes) if changes else 0
+
+def benchmark_under_sampling_mode(under_sampling_mode: UnderSamplingMode, model_mode: ModelMode, training_mode: TrainingMode,
+                                  training_data_frames: List[Tuple[str, str, pandas.DataFrame]],
+                                  testing_data_frames: List[Tuple[str, str, pandas.DataFrame]], seed: int) -> dict:
+    """
+    Train new models using the under-sampling mode and return the wall time and the Top-k
+    and MRR scores for each of the models trained.
+
+    :param training_data_frames: The repository, status and DataFrame for each training change
+    :param testing_data_frames: The repository, status and DataFrame for each testing change
+    """
+    numpy.random.seed(seed)
+    trainer = MLPClassifierTrainer(
+        [model_mode], False, training_mode, under_sampling_mode=under_sampling_mode
+    )
+    for repository, status, data_frame in training_data_frames:
+        trainer.add_training_data(repository, status, data_frame)
+    for repository, status, data_frame in testing_data_frames:
+        trainer.add_testing_data(repository, status, data_frame)
+    start_time = time.perf_counter()
+    trainer.scale_data()
+    scaling_and_under_sampling_time = time.perf_counter() - start_time
+    trainer.perform_training()
+    results = {
+        'scaling_and_under_sampling_seconds': scaling_and_under_sampling_time,
+        'total_seconds': time.perf_counter() - start_time,
+        'models': {}
+    }
+    for mode, target, repository, model in trainer.get_models_to_train():
+        try:
+            top_k, mrr_score = top_k_and_mrr_for_model(model, target)
+        except NotFittedError:
+            logging.error("Model " + model.name + " was not trained using " + under_sampling_mode.value + ". Skipping.")
+            continue
+        results['models'][model.name] = {'top-k': top_k, 'mrr': mrr_score}
+    return results
+
+if __name__ == "__main__":
+    logging.basicConfig(
+        filename=common.path_relative_to_root("logs/under_sampling_benchmark.log.txt"),
+        level=logging.INFO
+    )
+    argument_parser = argparse.ArgumentParser(
+        description="Compares the wall time and resulting Top-k accuracy and MRR score for each under-sampling mode")
+    argument_parser.add_argument('repositories', nargs='+', help="The repositories to train and test on")
+    argument_parser.add_argument(
+        '--under-sampling-modes', nargs='+', choices=[mode.value for mode in UnderSamplingMode],
+        default=[mode.value for mode in UnderSamplingMode], help="The under-sampling modes to compare (default is all)"
+    )
+    argument_parser.add_argument(
+        '--model-type', choices=[mode.value for mode in ModelMode], default=ModelMode.REPO_SPECIFIC.value,
+        help="The type of model to train"
+    )
+    argument_parser.add_argument(
+        '--training-mode', choices=[mode.value for mode in TrainingMode], default=TrainingMode.PER_CHANGE.value,
+        help="How the models are trained on the under-sampled data"
+    )
+    argument_parser.add_argument('--seed', type=int, default=0, help="The seed used to split and shuffle the data")
+    command_line_arguments = argument_parser.parse_args()
+    random.seed(command_line_arguments.seed)
+    numpy.random.seed(command_line_arguments.seed)
+    # Generate the DataFrames once, so that every mode is trained and tested on the same changes.
+    data_frame_trainer = MLPClassifierTrainer([], False)
+    training_data_frames = []
+    testing_data_frames = []
+    for repository in command_line_arguments.repositories:
+        print("Generating the DataFrames for", repository)
+        training_for_repository, testing_for_repository = get_training_and_testing_data_frames(data_frame_trainer, repository)
+        training_data_frames.extend((repository, status, data_frame) for status, data_frame in training_for_repository)
+        testing_data_frames.extend((repository, status, data_frame) for status, data_frame in testing_for_repository)
+    benchmark_results = {}
+    for under_sampling_mode in map(UnderSamplingMode, command_line_arguments.under_sampling_modes):
+        print("Benchmarking", under_sampling_mode.value)
+        benchmark_results[under_sampling_mode.value] = benchmark_under_sampling_mode(
+            under_sampling_mode, ModelMode(command_line_arguments.model_type), TrainingMode(command_line_arguments.training_mode),
+            training_data_frames, testing_data_frames, command_line_arguments.seed
+        )
+    # Print a summary with the average score over the models for each mode.
+    summary = {}
+    for under_sampling_mode, results in benchmark_results.items():
+        summary[under_sampling_mode] = {
+            'scaling and under-sampling (s)': results['scaling_and_under_sampling_seconds'],
+            'total (s)': results['total_seconds']
+        }
+        for target in ["approved", "voted"]:
+            model_results = [result for name, result in results['models'].items() if name.endswith("_" + target)]
+            if not model_results:
+                continue
+            for k in KValues:
+                summary[under_sampling_mode][target + ' top-' + str(k.value)] = numpy.mean([result['top-k'][k.value] for result in model_results])
+            summary[under_sampling_mode][target + ' MRR'] = numpy.mean([result['mrr'] for result in model_results])
+    print(pandas.DataFrame.from_dict(summary, orient='index').to_string())
+    json.dump(benchmark_results, open(common.path_relative_to_root("evaluation/results/under_sampling_benchmark.json"), 'w'))
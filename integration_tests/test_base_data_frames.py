@@ -0,0 +1,96 @@
+import json
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+import numpy
+import pandas.testing
+
+import common
+import recommender
+from recommender import neural_network_recommender
+from recommender.neural_network_recommender import MLPClassifierImplementationBase
+
+
+class TestBaseDataFramesCache(unittest.TestCase):
+    repository = "test/repository"
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        paths = {
+            name: os.path.join(self.directory.name, name + ".json")
+            for name in ["reviewer_data_path", "comment_data_path", "members_of_mediawiki_repos_path"]
+        }
+        votes = {"Approved": 0.5, "Voted": 1.0}
+        json.dump({self.repository: {
+            time_period.value: {"Test User": votes, "Other ": votes} for time_period in common.TimePeriods
+        }}, open(paths["reviewer_data_path"], "w"))
+        json.dump({self.repository: {
+            time_period.value: {"Test User": 1, "Commenter": 3} for time_period in common.TimePeriods
+        }}, open(paths["comment_data_path"], "w"))
+        json.dump({
+            "groups_for_repository": {self.repository: {"group": "Group"}},
+            "members_in_group": {"group": [{"name": "Test User", "email": "test@test.com"}]}
+        }, open(paths["members_of_mediawiki_repos_path"], "w"))
+        self.patches = [mock.patch.object(recommender, name, path) for name, path in paths.items()]
+        self.patches.append(mock.patch.object(neural_network_recommender, "base_data_frame_snapshots_path", self.directory.name))
+        for patch in self.patches:
+            patch.start()
+        self.reviewer_data_path = paths["reviewer_data_path"]
+        recommender.reload_data_if_changed()
+
+    def tearDown(self):
+        for patch in self.patches:
+            patch.stop()
+        neural_network_recommender._base_data_frames_cache.clear()
+        MLPClassifierImplementationBase.use_base_data_frame_snapshots = False
+        recommender.reload_data_if_changed()
+        self.directory.cleanup()
+
+    def test_cached_data_frames_match_built_data_frames(self):
+        built = MLPClassifierImplementationBase._build_base_data_frames(self.repository)
+        cached = MLPClassifierImplementationBase.preprocess_into_pandas_data_frame(self.repository)
+        self.assertCountEqual(built.keys(), cached.keys())
+        for key in built.keys():
+            pandas.testing.assert_frame_equal(built[key], cached[key])
+        # Modifying the returned DataFrames should not modify the cached copy.
+        cached[common.TimePeriods.ALL_TIME.value]["Comments"] = 100
+        pandas.testing.assert_frame_equal(
+            built[common.TimePeriods.ALL_TIME.value],
+            MLPClassifierImplementationBase.preprocess_into_pandas_data_frame(self.repository)[common.TimePeriods.ALL_TIME.value]
+        )
+
+    def test_snapshot_round_trip(self):
+        MLPClassifierImplementationBase.use_base_data_frame_snapshots = True
+        built = MLPClassifierImplementationBase.preprocess_into_pandas_data_frame(self.repository)
+        snapshot_path = neural_network_recommender.get_base_data_frame_snapshot_path(self.repository)
+        self.assertTrue(os.path.exists(snapshot_path), "Snapshot should have been saved")
+        loaded = neural_network_recommender.load_base_data_frames_snapshot(snapshot_path, recommender.get_data_signature())
+        for key in built.keys():
+            pandas.testing.assert_frame_equal(built[key], loaded[key])
+        with numpy.load(snapshot_path) as arrays:
+            self.assertFalse(any(arrays[name].dtype == object for name in arrays.files),
+                             "The snapshot should load without pickle")
+        self.assertIsNone(
+            neural_network_recommender.load_base_data_frames_snapshot(snapshot_path, (0, 0, 0)),
+            "Snapshot built from different data should not be loaded"
+        )
+
+    def test_rebuilt_when_data_changes(self):
+        before = MLPClassifierImplementationBase.preprocess_into_pandas_data_frame(self.repository)
+        self.assertIn("Test User", before[common.TimePeriods.ALL_TIME.value].index)
+        json.dump({self.repository: {
+            time_period.value: {"New User": {"Approved": 1.0, "Voted": 1.0}} for time_period in common.TimePeriods
+        }}, open(self.reviewer_data_path, "w"))
+        os.utime(self.reviewer_data_path, ns=(1, 1))
+        after = MLPClassifierImplementationBase.preprocess_into_pandas_data_frame(self.repository)
+        self.assertIn("New User", after[common.TimePeriods.ALL_TIME.value].index)
+
+    def test_least_recently_used_repository_removed(self):
+        with mock.patch.object(MLPClassifierImplementationBase, "_build_base_data_frames", return_value={}) as build, \
+                mock.patch.object(MLPClassifierImplementationBase, "base_data_frames_cache_size", 2):
+            for repository in ["first", "second", "first", "third", "first"]:
+                MLPClassifierImplementationBase.preprocess_into_pandas_data_frame(repository)
+            self.assertEqual(3, build.call_count, "The most recently used repository should be kept")
+            self.assertListEqual(["third", "first"], [key[0] for key in neural_network_recommender._base_data_frames_cache.keys()])  # noqa
@@ -0,0 +1,48 @@
+import unittest
+
+from evaluation import evaluate_changes, EvaluationMetric, TopKMetric, MRRMetric
+from recommender import Recommendations
+
+
+class TestEvaluation(unittest.TestCase):
+    def setUp(self):
+        self.changes = [
+            {'id': 'first', 'code_review_votes': [{'name': 'Approver', 'value': 2}, {'name': 'Voter', 'value': 1}], 'reviewers': []},
+            {'id': 'second', 'code_review_votes': [{'name': 'Voter', 'value': 1}], 'reviewers': []},
+        ]
+        self.recommended_changes = []
+
+    def recommend(self, change_info: dict) -> Recommendations:
+        self.assertNotIn('code_review_votes', change_info, "The actual votes should be removed")
+        self.recommended_changes.append(change_info['id'])
+        recommendations = Recommendations()
+        for score, name in enumerate(['Approver', 'Other', 'Voter']):
+            recommendations.get_reviewer_by_name_or_create_new(name).score = score
+        return recommendations
+
+    def test_metrics_use_the_same_recommendations(self):
+        top_k, mrr = TopKMetric(), MRRMetric()
+        self.assertTrue(evaluate_changes(self.recommend, self.changes, 2, [top_k, mrr]))
+        self.assertListEqual(['first', 'second'], self.recommended_changes, "Each change should be recommended for once")
+        # Ordered by score the recommendations are Voter, Other and then Approver.
+        self.assertDictEqual(
+            {'approved': {1: 0, 3: 0.5, 5: 0.5, 10: 0.5}, 'voted': {1: 1, 3: 1, 5: 1, 10: 1}}, top_k.get_result(2)
+        )
+        # The MRR ranks use the order the recommendations were added in.
+        self.assertDictEqual({'approved': (1 + 1 / 3) / 2, 'voted': (1 + 1 / 3) / 2}, mrr.get_result(2))
+
+    def test_only_num_changes_are_evaluated(self):
+        top_k = TopKMetric()
+        evaluate_changes(self.recommend, self.changes, 1, [top_k])
+        self.assertListEqual(['first'], self.recommended_changes)
+        self.assertEqual(1, top_k.get_result(1)['approved'][3])
+
+    def test_metric_must_implement_all_methods(self):
+        class IncompleteMetric(EvaluationMetric):
+            name = "incomplete"
+
+            def add_change(self, recommendations, ordered_recommendations, actual_reviewers):
+                pass
+
+        with self.assertRaises(TypeError, msg="A metric without get_result should not be created"):
+            IncompleteMetric()
@@ -0,0 +1,50 @@
+import multiprocessing
+import unittest
+from concurrent.futures import ProcessPoolExecutor
+from unittest import mock
+
+from evaluation import scheduler
+from evaluation.scheduler import EvaluationCell, merge_results, run_cells
+from recommender import RecommenderImplementationBase
+from recommender.neural_network_recommender.neural_network_recommender import ModelMode, SelectionMode
+from recommender.rule_based_recommender import RuleBasedImplementation
+
+
+class TestEvaluationScheduler(unittest.TestCase):
+    def test_seed_for_each_cell(self):
+        cell = EvaluationCell('test/repo', 10, None, ModelMode.GENERIC, SelectionMode.RANDOM)
+        self.assertTupleEqual(('test/repo', 'generic', 'random'), cell.key)
+        self.assertEqual(cell.get_seed(1), EvaluationCell('test/repo', 20, None, ModelMode.GENERIC, SelectionMode.RANDOM).get_seed(1))
+        self.assertNotEqual(cell.get_seed(1), cell.get_seed(2))
+        self.assertNotEqual(cell.get_seed(1), EvaluationCell('test/repo', 10).get_seed(1))
+
+    def test_merge_results(self):
+        cells = [EvaluationCell('first', 10), EvaluationCell('second', 10), EvaluationCell('third', 10)]
+        merged = merge_results(cells, {
+            ('second',): ({'top-k': {'merged': {}}, 'mrr': {'merged': {'approved': 0.5}}}, 2.0),
+            ('first',): (None, 1.0),
+        })
+        self.assertDictEqual({'second': {'merged': {'approved': 0.5}}}, merged['mrr'])
+        self.assertDictEqual({'second': {'merged': {}}}, merged['top-k'])
+        self.assertListEqual(['first', 'second'], list(merged['timings'].keys()), "Timings should be in the order of the cells")
+
+    def test_run_cells_in_processes(self):
+        # Repositories with no test data are skipped, but still timed.
+        cells = [
+            EvaluationCell('test/no-test-data', 10, None, ModelMode.GENERIC, selection_mode)
+            for selection_mode in SelectionMode
+        ]
+        results = run_cells(cells, workers=2)
+        self.assertDictEqual({}, results['top-k'])
+        self.assertSetEqual({mode.value for mode in SelectionMode}, set(results['timings']['test/no-test-data']['generic'].keys()))
+
+    def test_options_copied_to_spawned_processes(self):
+        with mock.patch.object(RecommenderImplementationBase, 'use_signal_cache', True), \
+                mock.patch.object(RuleBasedImplementation, 'use_scoring_engine', True), \
+                mock.patch.object(RuleBasedImplementation, 'scoring_engine_top_n', 5):
+            options = scheduler._get_implementation_options()  # noqa
+            with ProcessPoolExecutor(
+                    max_workers=1, mp_context=multiprocessing.get_context('spawn'),
+                    initializer=scheduler._set_implementation_options, initargs=(options,)  # noqa
+            ) as executor:
+                self.assertListEqual(options, executor.submit(scheduler._get_implementation_options).result())  # noqa
@@ -0,0 +1,49 @@
+import unittest
+
+import numpy
+import pandas
+
+import common
+from recommender.neural_network_recommender import feature_builder
+
+
+def make_git_blame_info(authors: dict, committers: dict, names: dict) -> dict:
+    git_blame_info = {'authors': {}, 'committers': {}, 'names': names}
+    for time_period in common.TimePeriods:
+        key = time_period.value.replace(' ', '_') + '_lines_count'
+        git_blame_info['authors'][key] = authors
+        git_blame_info['committers'][key] = committers
+    return git_blame_info
+
+
+class TestFeatureBuilder(unittest.TestCase):
+    def setUp(self):
+        self.base_data_frame = pandas.DataFrame(
+            {'Approved': [0.5, numpy.nan], 'Can merge changes?': [True, False]},
+            index=pandas.Index(['Test User', 'Other'], dtype=object)
+        )
+
+    def test_rows_and_columns_order(self):
+        git_blame_info = make_git_blame_info(
+            {'test@test.com': 0.25, 'new@test.com': 0.75},
+            {'other@test.com': 1.0},
+            {'test@test.com': ['test user'], 'new@test.com': ['New User'], 'other@test.com': ['Other']}
+        )
+        data_frame = feature_builder.build_change_specific_data_frame(self.base_data_frame, git_blame_info)
+        self.assertListEqual(['Test User', 'Other', 'New User'], list(data_frame.index), "New users should be added after the base users")
+        self.assertListEqual(['Approved', 'Can merge changes?'] + feature_builder.git_blame_columns, list(data_frame.columns))
+        self.assertEqual(0.25, data_frame.at['Test User', 'all time author git blame percentage'], "Names should be matched by index format")
+        self.assertEqual(1.0, data_frame.at['Other', 'last month reviewer git blame percentage'])
+        self.assertEqual(0.0, data_frame.at['New User', 'Approved'], "New users should have zeros for the base columns")
+        self.assertTrue(numpy.isnan(data_frame.at['Other', 'Approved']), "Missing values should be kept for fillna")
+        self.assertEqual(1.0, data_frame.at['Test User', 'Can merge changes?'])
+
+    def test_vote_labels(self):
+        git_blame_info = make_git_blame_info({}, {}, {})
+        data_frame = feature_builder.build_training_data_frame(self.base_data_frame, git_blame_info, [
+            {'name': 'Test User', 'value': 2},
+            {'name': 'Voter', 'value': 1},
+        ])
+        self.assertListEqual(['Test User', 'Other', 'Voter'], list(data_frame.index))
+        self.assertListEqual([True, False, True], list(data_frame['Actually voted']))
+        self.assertListEqual([True, False, False], list(data_frame['Actually approved']))
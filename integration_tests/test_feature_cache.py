@@ -0,0 +1,39 @@
+import os
+import tempfile
+import unittest
+
+import numpy
+import pandas
+
+from recommender.neural_network_recommender import feature_cache
+from recommender.neural_network_recommender.feature_cache import ChangeFeatures
+
+
+class TestFeatureCache(unittest.TestCase):
+    def setUp(self):
+        self.data_frame = pandas.DataFrame(
+            {'Approved': [0.5, numpy.nan], 'Comments': [1.0, 2.0], 'Actually voted': [True, False], 'Actually approved': [True, False]},
+            index=pandas.Index(['Test User', 'Other'], dtype=object)
+        )
+
+    def test_change_features_from_data_frame(self):
+        change_features = ChangeFeatures.from_data_frame(self.data_frame)
+        self.assertListEqual(['Approved', 'Comments'], change_features.columns)
+        self.assertListEqual(['Test User', 'Other'], change_features.users)
+        self.assertListEqual([[0.5, 1.0], [0.0, 2.0]], change_features.features.tolist(), "NaN values should be replaced with zeros")
+        self.assertListEqual([True, False], list(change_features.approved))
+
+    def test_save_and_load(self):
+        self.assertIsNone(feature_cache.get_change_features_path('test/repo', {'id': 'test~master~I1'}))
+        path = feature_cache.get_change_features_path('test/repo', {'id': 'test~master~I1', 'current_revision': 'abc'})
+        self.assertTrue(path.endswith('abc.npz'))
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'test', 'change.npz')
+            feature_cache.save_change_features(path, ChangeFeatures.from_data_frame(self.data_frame), (1, 2, 3), 'all time')
+            loaded = feature_cache.load_change_features(path, (1, 2, 3), 'all time')
+            self.assertListEqual(['Test User', 'Other'], loaded.users)
+            self.assertListEqual(['Approved', 'Comments'], loaded.columns)
+            self.assertListEqual([[0.5, 1.0], [0.0, 2.0]], loaded.features.tolist())
+            self.assertListEqual([True, False], list(loaded.voted))
+            self.assertIsNone(feature_cache.load_change_features(path, (1, 2, 4), 'all time'), "Old data should not be loaded")
+            self.assertIsNone(feature_cache.load_change_features(path, (1, 2, 3), 'last year'))
@@ -0,0 +1,46 @@
+import unittest
+
+import numpy
+import pandas
+
+from recommender.neural_network_recommender.feature_store import FeatureStore, FeatureVocabulary
+
+
+class TestFeatureStore(unittest.TestCase):
+    def test_changes_are_stored_contiguously(self):
+        store = FeatureStore(initial_capacity=1)
+        for number_of_rows in [2, 3, 1]:
+            store.add(
+                numpy.arange(number_of_rows * 2).reshape(number_of_rows, 2), ['a', 'b'],
+                ['user ' + str(row) for row in range(number_of_rows)],
+                approved=[True] * number_of_rows, voted=[False] * number_of_rows
+            )
+        self.assertEqual(3, len(store))
+        self.assertListEqual([0, 2, 5, 6], list(store.offsets))
+        self.assertEqual(numpy.float32, store.features.dtype)
+        self.assertTrue(store.features.flags['C_CONTIGUOUS'])
+        self.assertListEqual([[0, 1], [2, 3], [4, 5]], store.get_features(1).tolist())
+        self.assertListEqual([True, True, True], list(store.get_labels('approved', 1)))
+        self.assertListEqual(['user 0', 'user 1', 'user 2'], store.get_users(1))
+        self.assertListEqual([0, 1, 0, 1, 2, 0], list(store.user_ids), "User IDs should be shared between changes")
+
+    def test_columns_are_aligned_to_the_shared_vocabulary(self):
+        vocabulary = FeatureVocabulary()
+        first_store = FeatureStore(vocabulary=vocabulary)
+        second_store = FeatureStore(["voted"], vocabulary)
+        first_store.add_data_frame(pandas.DataFrame({'a': [1.0], 'b': [2.0]}, index=['x']), approved=[True], voted=[True])
+        second_store.add_data_frame(pandas.DataFrame({'b': [3.0], 'c': [4.0]}, index=['y']), voted=[False])
+        self.assertListEqual(['a', 'b'], vocabulary.columns)
+        self.assertListEqual([[0.0, 3.0]], second_store.get_features(0).tolist(), "Missing columns should be zero and unknown columns dropped")
+        self.assertListEqual(['x', 'y'], vocabulary.users)
+
+    def test_data_frame_is_a_view(self):
+        store = FeatureStore(["approved"])
+        store.add(numpy.ones((2, 2)), ['a', 'b'], ['x', 'y'], approved=[True, False])
+        data_frame = store.get_data_frame(0)
+        self.assertListEqual(['x', 'y'], list(data_frame.index))
+        self.assertListEqual(['a', 'b'], list(data_frame.columns))
+        store.get_features(0)[:] = 5
+        self.assertEqual(5, data_frame.at['x', 'a'], "The DataFrame should not copy the features")
+        store.trim()
+        self.assertEqual(2, len(store.features))
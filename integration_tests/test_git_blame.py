@@ -1,3 +1,5 @@
+import datetime
+import time
 import unittest
 from git import GitCommandError
 import common
@@ -26,6 +28,27 @@ class TestGitBlame(unittest.TestCase):
             "File did not exist so no blame info should have been returned"
         )
 
+    def test_parallel_blame_matches_serial_blame(self):
+        # Test that blaming the files in parallel produces the same stats as blaming them one after another
+        files = ["extension.json", "src/No-such-file.phpx", "README", "COPYING"]
+        for per_file in [True, False]:
+            self.assertDictEqual(
+                git_blame.git_blame_stats_for_head_of_branch(files, "mediawiki/extensions/CheckUser",
+                                                             per_file=per_file, use_cache=False),
+                git_blame.git_blame_stats_for_head_of_branch(files, "mediawiki/extensions/CheckUser",
+                                                             per_file=per_file, use_cache=False, max_workers=3),
+                "Parallel git blame should return the same stats as serial git blame"
+            )
+
+    def test_blame_with_parent_sha_does_not_move_head(self):
+        # Test that blaming against a commit leaves the HEAD of the bare repo unchanged
+        repo = git_blame.get_bare_repo("mediawiki/extensions/CheckUser")
+        head_reference = repo.head.reference
+        parent_commit_sha = repo.head.commit.parents[0].hexsha
+        git_blame.git_blame_stats_for_head_of_branch("extension.json", "mediawiki/extensions/CheckUser",
+                                                     parent_commit_sha=parent_commit_sha, use_cache=False)
+        self.assertEqual(head_reference, repo.head.reference, "Blaming against a commit should not move the HEAD")
+
     def test_get_bare_repo(self):
         repo = git_blame.get_bare_repo("mediawiki/extensions/CheckUser")
         # Check that the repo is actually a bare repo
@@ -52,5 +75,25 @@ class TestGitBlame(unittest.TestCase):
         with self.assertRaises(GitCommandError):
             git_blame.get_bare_repo("mediawiki/test/non-existing-repo")
 
+class TestBlameStatsAccumulator(unittest.TestCase):
+    def test_lines_counted_per_time_period(self):
+        now = datetime.datetime.now()
+        accumulator = git_blame.BlameStatsAccumulator(now)
+        accumulator.add("Test", "test@test.com", time.mktime((now - datetime.timedelta(days=1)).timetuple()), 5)
+        accumulator.add("Test 2", "test@test.com", time.mktime((now - datetime.timedelta(days=200)).timetuple()), 3)
+        stats = accumulator.to_dict()
+        self.assertListEqual(["test@test.com"], list(stats.keys()), "Stats should be grouped by email")
+        self.assertListEqual(["Test", "Test 2"], stats["test@test.com"]["names"], "Names should be kept in the order found")
+        self.assertEqual(8, stats["test@test.com"]["all_time_lines_count"], "All lines should be counted for all time")
+        self.assertEqual(5, stats["test@test.com"]["last_three_months_lines_count"],
+                         "Only lines from the last three months should be counted")
+
+    def test_bots_are_excluded(self):
+        accumulator = git_blame.BlameStatsAccumulator()
+        accumulator.add("TrainBranchBot", "trainbranchbot@test.com", 0, 5)
+        accumulator.add("Test", "l10n-bot@translatewiki.net", 0, 5)
+        accumulator.add("Test", "test@test.com", 0, 1)
+        self.assertListEqual(["test@test.com"], list(accumulator.to_dict().keys()), "Bots should not have line counts")
+
 if __name__ == '__main__':
     unittest.main()
\ No newline at end of file
@@ -0,0 +1,56 @@
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+from data_collection.git_blame import blame_cache
+from data_collection.git_blame.blame_cache import GitBlameCache
+
+
+class TestGitBlameCache(unittest.TestCase):
+    def setUp(self):
+        self.cache_directory = tempfile.TemporaryDirectory()
+        self.cache_path = os.path.join(self.cache_directory.name, "cache.sqlite3")
+
+    def tearDown(self):
+        self.cache_directory.cleanup()
+
+    def test_get_missing_entry(self):
+        cache = GitBlameCache(self.cache_path)
+        self.assertIsNone(cache.get("mediawiki/core", "a" * 40, "index.php"), "Nothing should be cached yet")
+
+    def test_put_and_get(self):
+        cache = GitBlameCache(self.cache_path)
+        entries = [[3, "Test", "test@test.com", 1600000000, "Other", "other@test.com", 1600000100]]
+        cache.put("mediawiki/core", "a" * 40, "index.php", entries)
+        self.assertListEqual(entries, cache.get("mediawiki/core", "a" * 40, "index.php"), "Cached entries should be returned")
+        self.assertIsNone(cache.get("mediawiki/core", "b" * 40, "index.php"), "Entries are specific to the commit")
+        # Check that the entries persist when the cache is opened again.
+        self.assertListEqual(entries, GitBlameCache(self.cache_path).get("mediawiki/core", "a" * 40, "index.php"),
+                             "Cached entries should persist")
+
+    def test_least_recently_used_evicted(self):
+        cache = GitBlameCache(self.cache_path)
+        entries = [[i, "Test " + str(i), str(i) + "@test.com", 1600000000 + i, "Other", "other@test.com", 1600000000] for i in range(50)]
+        cache.put("mediawiki/core", "a" * 40, "first.php", entries)
+        cache.put("mediawiki/core", "a" * 40, "second.php", entries)
+        # Use the first entry so that the second is the least recently used.
+        cache.get("mediawiki/core", "a" * 40, "first.php")
+        cache.max_size_bytes = cache.size()
+        cache.put("mediawiki/core", "a" * 40, "third.php", entries)
+        self.assertLessEqual(cache.size(), cache.max_size_bytes, "Cache should have been shrunk below the maximum size")
+        self.assertIsNone(cache.get("mediawiki/core", "a" * 40, "second.php"), "Least recently used entry should be evicted")
+        self.assertIsNotNone(cache.get("mediawiki/core", "a" * 40, "third.php"), "Newest entry should not be evicted")
+
+    def test_shared_cache_not_used_after_fork(self):
+        with mock.patch.object(blame_cache, "_git_blame_cache", None), \
+                mock.patch.object(blame_cache, "GitBlameCache", side_effect=lambda: mock.Mock()), \
+                mock.patch("os.getpid", return_value=1):
+            cache = blame_cache.get_git_blame_cache()
+            self.assertIs(cache, blame_cache.get_git_blame_cache())
+            with mock.patch("os.getpid", return_value=2):
+                self.assertIsNot(cache, blame_cache.get_git_blame_cache(),
+                                 "A process should not use the connection opened by the process it was forked from")
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,51 @@
+import os
+import tempfile
+import unittest
+
+import numpy
+import pandas
+from sklearn.neural_network import MLPClassifier
+from sklearn.preprocessing import StandardScaler
+
+from recommender.neural_network_recommender.inference import InferenceBundle, InferenceEngine
+
+
+class TestInference(unittest.TestCase):
+    def setUp(self):
+        random = numpy.random.default_rng(0)
+        self.X = pandas.DataFrame(random.random((200, 3)) * [1, 10, 100], columns=['a', 'b', 'c'])
+        self.models_and_scalers = []
+        for target, activation in [(self.X['a'] > 0.5, 'relu'), (self.X['b'] > 5, 'relu'), (self.X['c'] > 50, 'tanh')]:
+            scaler = StandardScaler().fit(self.X)
+            model = MLPClassifier((8, 4), activation=activation, max_iter=50, random_state=0)
+            model.fit(pandas.DataFrame(scaler.transform(self.X), columns=self.X.columns), target)
+            self.models_and_scalers.append((model, scaler))
+
+    def expected_predictions(self, model, scaler):
+        return model.predict(pandas.DataFrame(scaler.transform(self.X), columns=self.X.columns))
+
+    def test_predictions_match_sklearn(self):
+        with tempfile.TemporaryDirectory() as directory:
+            bundles = []
+            for number, (model, scaler) in enumerate(self.models_and_scalers):
+                path = os.path.join(directory, str(number) + '.npz')
+                InferenceBundle.from_model(model, scaler).save(path)
+                bundles.append(InferenceBundle.load(path))
+        for bundle, (model, scaler) in zip(bundles, self.models_and_scalers):
+            self.assertListEqual(['a', 'b', 'c'], bundle.feature_names)
+            self.assertListEqual(list(self.expected_predictions(model, scaler)), list(bundle.predict(self.X.to_numpy(), self.X.columns)))
+        # The first two heads have the same shape so are evaluated together.
+        engine = InferenceEngine(bundles[:2])
+        self.assertIsNotNone(engine._stacked)  # noqa
+        for predictions, (model, scaler) in zip(engine.predict(self.X.to_numpy()), self.models_and_scalers):
+            self.assertListEqual(list(self.expected_predictions(model, scaler)), list(predictions))
+        # The last head uses a different activation function so can't be stacked.
+        engine = InferenceEngine(bundles[1:])
+        self.assertIsNone(engine._stacked)  # noqa
+        for predictions, (model, scaler) in zip(engine.predict(self.X.to_numpy()), self.models_and_scalers[1:]):
+            self.assertListEqual(list(self.expected_predictions(model, scaler)), list(predictions))
+
+    def test_feature_names_are_checked(self):
+        bundle = InferenceBundle.from_model(*self.models_and_scalers[0])
+        with self.assertRaises(ValueError):
+            bundle.predict(self.X.to_numpy(), ['a', 'c', 'b'])
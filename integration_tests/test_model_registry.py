@@ -0,0 +1,80 @@
+import os
+import pickle
+import tempfile
+import unittest
+
+import numpy
+import pandas
+from sklearn.neural_network import MLPClassifier
+from sklearn.preprocessing import StandardScaler
+
+from recommender.neural_network_recommender.model_registry import ModelRegistry
+
+
+class TestModelRegistry(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+        self.models_directory = os.path.join(self.directory.name, 'models')
+        self.scalers_directory = os.path.join(self.directory.name, 'scalers')
+        os.makedirs(self.models_directory)
+        os.makedirs(self.scalers_directory)
+        random = numpy.random.default_rng(0)
+        self.X = pandas.DataFrame(random.random((100, 3)), columns=['a', 'b', 'c'])
+        self.expected_predictions = {}
+        for number, name in enumerate(['first_approved', 'first_voted', 'second_approved', 'second_voted']):
+            scaler = StandardScaler().fit(self.X)
+            model = MLPClassifier((8, 4), max_iter=50, random_state=number)
+            model.fit(pandas.DataFrame(scaler.transform(self.X), columns=self.X.columns), self.X.iloc[:, number % 3] > 0.5)
+            pickle.dump(model, open(os.path.join(self.models_directory, name + '_clf.pickle'), 'wb'))
+            pickle.dump(scaler, open(os.path.join(self.scalers_directory, name + '_scaler.pickle'), 'wb'))
+            self.expected_predictions[name] = list(model.predict(pandas.DataFrame(scaler.transform(self.X), columns=self.X.columns)))
+
+    def make_registry(self, memory_budget: int = 1024 * 1024, memory_map: bool = False) -> ModelRegistry:
+        return ModelRegistry(
+            memory_budget, memory_map, self.models_directory, self.scalers_directory,
+            os.path.join(self.directory.name, 'inference_bundles')
+        )
+
+    def test_models_are_indexed_and_cached(self):
+        registry = self.make_registry()
+        self.assertListEqual(['first_approved', 'first_voted', 'second_approved', 'second_voted'], registry.get_model_names())
+        self.assertIs(registry.get_model('first_approved'), registry.get_model('first_approved'))
+        self.assertEqual(1, registry.hits)
+        self.assertEqual(1, registry.misses)
+        with self.assertRaises(Exception):
+            registry.get_model('missing')
+
+    def test_inference_engines_are_evicted_within_the_budget(self):
+        registry = self.make_registry()
+        engine_size = registry.get_inference_engine(('first_approved', 'first_voted')).get_memory_used()
+        # Only allow one engine to be cached.
+        registry = self.make_registry(engine_size)
+        for names in [('first_approved', 'first_voted'), ('second_approved', 'second_voted'), ('first_approved', 'first_voted')]:
+            engine = registry.get_inference_engine(names)
+            for name, predictions in zip(names, engine.predict(self.X.to_numpy(), self.X.columns)):
+                self.assertListEqual(self.expected_predictions[name], list(predictions))
+        self.assertEqual(0, registry.hits)
+        self.assertEqual(3, registry.misses)
+        self.assertEqual(2, registry.evictions)
+        self.assertLessEqual(registry.memory_used, engine_size)
+        self.assertListEqual([('first_approved', 'first_voted'), ('second_approved', 'second_voted')], registry.get_most_used(2))
+
+    def test_memory_mapped_inference_engine(self):
+        registry = self.make_registry(memory_map=True)
+        engine = registry.get_inference_engine(('first_approved', 'first_voted'))
+        self.assertIsInstance(engine.bundles[0].coefs[0], numpy.memmap)
+        for name, predictions in zip(['first_approved', 'first_voted'], engine.predict(self.X.to_numpy(), self.X.columns)):
+            self.assertListEqual(self.expected_predictions[name], list(predictions))
+        self.assertLess(engine.get_memory_used(), 1024, "Memory-mapped weights should not be counted")
+
+    def test_prefetch_and_invalidate(self):
+        registry = self.make_registry()
+        registry.prefetch([('first_approved', 'first_voted'), ('missing_approved', 'missing_voted')], background=False)
+        self.assertEqual(2, registry.prefetches)
+        registry.get_inference_engine(('first_approved', 'first_voted'))
+        self.assertEqual(1, registry.hits)
+        self.assertEqual(0, registry.misses)
+        registry.invalidate('first_voted')
+        registry.get_inference_engine(('first_approved', 'first_voted'))
+        self.assertEqual(1, registry.misses)
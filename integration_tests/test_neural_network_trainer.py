@@ -0,0 +1,109 @@
+import unittest
+import warnings
+from unittest import mock
+
+import numpy
+import pandas
+
+from recommender.neural_network_recommender.neural_network_recommender import ModelMode
+from recommender.neural_network_recommender.neural_network_recommender_trainer import MLPClassifierTrainer, TrainingMode
+from recommender.neural_network_recommender.under_sampling import UnderSamplingMode
+
+
+def make_change_data_frame(random: numpy.random.Generator, number_of_users: int = 20) -> pandas.DataFrame:
+    # Users with a high first feature voted and approved, so the targets can be learnt.
+    features = random.random((number_of_users, 3))
+    data_frame = pandas.DataFrame(features, index=['user ' + str(user) for user in range(number_of_users)], columns=['a', 'b', 'c'])
+    data_frame['Actually voted'] = features[:, 0] > 0.5
+    data_frame['Actually approved'] = features[:, 0] > 0.5
+    return data_frame
+
+
+class TestNeuralNetworkTrainer(unittest.TestCase):
+    def test_mini_batch_training(self):
+        random = numpy.random.default_rng(0)
+        numpy.random.seed(0)
+        trainer = MLPClassifierTrainer(
+            [ModelMode.GENERIC], False, TrainingMode.MINI_BATCH, batch_size=16, epochs=20, early_stopping_patience=5
+        )
+        for _ in range(10):
+            trainer.add_training_data('test/repo', 'merged', make_change_data_frame(random))
+        for _ in range(3):
+            trainer.add_testing_data('test/repo', 'merged', make_change_data_frame(random))
+        trainer.perform_training()
+        results = trainer.perform_testing()
+        self.assertListEqual(['generic_approved', 'generic_voted'], sorted(results.keys()))
+        self.assertGreater(results['generic_approved']['accuracy_score']['average'], 0.8)
+        self.assertGreater(results['generic_voted']['accuracy_score']['average'], 0.8)
+
+    def test_scaler_is_fitted_on_all_training_changes(self):
+        random = numpy.random.default_rng(0)
+        trainer = MLPClassifierTrainer([ModelMode.GENERIC], False)
+        data_frames = [make_change_data_frame(random) * (change + 1) for change in range(5)]
+        for data_frame in data_frames:
+            trainer.add_training_data('test/repo', 'merged', data_frame)
+        with warnings.catch_warnings():
+            # The scaler should be given the feature names when fitted and when transforming.
+            warnings.simplefilter("error")
+            trainer.scale_data()
+        scaler = trainer._generic_approved.scaler
+        all_features = pandas.concat(data_frames).iloc[:, :-2]
+        numpy.testing.assert_allclose(all_features.mean().to_numpy(), scaler.mean_, rtol=1e-5)
+        self.assertListEqual(['a', 'b', 'c'], list(scaler.feature_names_in_))
+        scaled_features = trainer._generic_approved.training_data.features
+        numpy.testing.assert_allclose(numpy.zeros(3), scaled_features.mean(axis=0), atol=1e-5)
+
+    def test_training_using_processes(self):
+        random = numpy.random.default_rng(0)
+        numpy.random.seed(0)
+        trainer = MLPClassifierTrainer(
+            [ModelMode.GENERIC, ModelMode.REPO_SPECIFIC], False, TrainingMode.MINI_BATCH, batch_size=16, epochs=20,
+            early_stopping_patience=5, workers=2
+        )
+        for _ in range(10):
+            trainer.add_training_data('test/repo', 'merged', make_change_data_frame(random))
+        for _ in range(3):
+            trainer.add_testing_data('test/repo', 'merged', make_change_data_frame(random))
+        trainer.perform_training()
+        self.assertEqual(0, len(trainer._repo_specific_approved['test/repo'].training_data), "Trained models should replace the originals")
+        results = trainer.perform_testing()
+        self.assertListEqual(
+            ['generic_approved', 'generic_voted', 'test-repo_approved', 'test-repo_voted'], sorted(results.keys())
+        )
+        for name, result in results.items():
+            self.assertGreater(result['accuracy_score']['average'], 0.8, name)
+
+    def test_mini_batch_training_reproducible(self):
+        def train():
+            random = numpy.random.default_rng(0)
+            trainer = MLPClassifierTrainer(
+                [ModelMode.GENERIC], False, TrainingMode.MINI_BATCH, batch_size=16, epochs=3,
+                under_sampling_mode=UnderSamplingMode.RANDOM, random_state=1
+            )
+            for _ in range(5):
+                trainer.add_training_data('test/repo', 'merged', make_change_data_frame(random))
+            trainer.perform_training()
+            return trainer._generic_approved.model.coefs_
+
+        for first, second in zip(train(), train()):
+            numpy.testing.assert_array_equal(first, second)
+
+    def test_mini_batch_training_failure(self):
+        random = numpy.random.default_rng(0)
+        trainer = MLPClassifierTrainer([ModelMode.GENERIC], False, TrainingMode.MINI_BATCH)
+        trainer.add_training_data('test/repo', 'merged', make_change_data_frame(random))
+        with mock.patch.object(MLPClassifierTrainer, "_train_model_using_mini_batches", side_effect=ValueError("Test")), \
+                mock.patch.object(MLPClassifierTrainer, "_save_model") as save_model:
+            trainer.perform_training(save_models=True)
+        save_model.assert_not_called()
+        self.assertSetEqual({'generic_approved', 'generic_voted'}, trainer._failed_models,  # noqa
+                            "Models that failed to train should not be saved")
+
+    def test_training_data_cleared_when_training_using_processes_fails(self):
+        random = numpy.random.default_rng(0)
+        trainer = MLPClassifierTrainer([ModelMode.GENERIC], False, TrainingMode.MINI_BATCH, workers=2)
+        trainer.add_training_data('test/repo', 'merged', make_change_data_frame(random))
+        with mock.patch.object(MLPClassifierTrainer, "_train_model_using_mini_batches", side_effect=ValueError("Test")):
+            trainer.perform_training()
+        self.assertSetEqual({'generic_approved', 'generic_voted'}, trainer._failed_models)  # noqa
+        self.assertEqual(0, len(trainer._generic_approved.training_data), "The training data of failed models should be freed")
@@ -0,0 +1,128 @@
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+from git import Repo
+
+import common
+from data_collection import git_blame
+from data_collection.git_blame import ownership_index
+from data_collection.git_blame.ownership_index import OwnershipIndex
+
+
+class TestOwnershipIndex(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.repo = Repo.init(os.path.join(self.directory.name, "repo"), initial_branch="master")
+        with self.repo.config_writer() as config:
+            config.set_value("user", "name", "Test")
+            config.set_value("user", "email", "test@test.com")
+        self.index = OwnershipIndex(os.path.join(self.directory.name, "index.sqlite3"))
+        self.first_commit = self.commit({'a.txt': "a\n", 'b.txt': "b\n"}, "First")
+
+    def tearDown(self):
+        self.repo.close()
+        self.directory.cleanup()
+
+    def commit(self, files: dict, message: str, parent_commits=None):
+        for file, content in files.items():
+            path = os.path.join(self.repo.working_tree_dir, file)
+            if content is None:
+                self.repo.index.remove([file], working_tree=True)
+                continue
+            with open(path, 'w') as f:
+                f.write(content)
+            self.repo.index.add([file])
+        return self.repo.index.commit(message, parent_commits=parent_commits)
+
+    def assertEntriesAreBlameAt(self, commit, entries: dict):
+        for file, file_entries in entries.items():
+            self.assertListEqual(git_blame._blame_file(self.repo, commit, file), file_entries)  # noqa
+
+    def test_build(self):
+        self.index.build(self.repo, "test/repo", "master")
+        self.assertTupleEqual(("master", self.first_commit.hexsha), self.index.get_indexed_commit("test/repo"))
+        entries = self.index.get_entries(self.repo, "test/repo", self.first_commit.hexsha, ['a.txt', 'b.txt', 'missing.txt'])
+        self.assertSetEqual({'a.txt', 'b.txt'}, set(entries.keys()))
+        self.assertEntriesAreBlameAt(self.first_commit, entries)
+
+    def test_update_after_new_commits(self):
+        self.index.build(self.repo, "test/repo", "master")
+        self.commit({'a.txt': "a\nmore a\n", 'c.txt': "c\n"}, "Second")
+        third_commit = self.commit({'b.txt': None}, "Third")
+        self.index.update(self.repo, "test/repo")
+        self.assertTupleEqual(("master", third_commit.hexsha), self.index.get_indexed_commit("test/repo"))
+        entries = self.index.get_entries(self.repo, "test/repo", third_commit.hexsha, ['a.txt', 'b.txt', 'c.txt'])
+        self.assertSetEqual({'a.txt', 'c.txt'}, set(entries.keys()), "Deleted files should be removed from the index")
+        self.assertEntriesAreBlameAt(third_commit, entries)
+
+    def test_files_changed_since_indexed_commit_not_used(self):
+        self.index.build(self.repo, "test/repo", "master")
+        second_commit = self.commit({'a.txt': "a\nmore a\n"}, "Second")
+        self.assertSetEqual(
+            {'b.txt'}, set(self.index.get_entries(self.repo, "test/repo", second_commit.hexsha, ['a.txt', 'b.txt']).keys()),
+            "Files modified after the indexed commit should be blamed live"
+        )
+        # The same applies when blaming at a commit before the indexed commit.
+        self.index.update(self.repo, "test/repo")
+        self.assertSetEqual(
+            {'b.txt'}, set(self.index.get_entries(self.repo, "test/repo", self.first_commit.hexsha, ['a.txt', 'b.txt']).keys())
+        )
+
+    def test_files_changed_and_reverted_not_used(self):
+        self.commit({'a.txt': "changed a\n"}, "Change")
+        revert_commit = self.commit({'a.txt': "a\n"}, "Revert")
+        self.index.build(self.repo, "test/repo", "master")
+        self.assertEqual("", self.repo.git.diff(self.first_commit.hexsha, revert_commit.hexsha))
+        self.assertSetEqual(
+            {'b.txt'}, set(self.index.get_entries(self.repo, "test/repo", self.first_commit.hexsha, ['a.txt', 'b.txt']).keys()),
+            "Files changed and then reverted since the requested commit should be blamed live"
+        )
+
+    def test_files_changed_by_merge_commit_not_used(self):
+        self.repo.create_head("feature")
+        self.commit({'c.txt': "c\n"}, "Master")
+        self.index.build(self.repo, "test/repo", "master")
+        self.repo.heads.feature.checkout()
+        self.commit({'b.txt': "feature b\n"}, "Feature")
+        self.repo.heads.master.checkout()
+        # Resolve the merge with a change to a.txt, which neither branch modified.
+        self.repo.git.merge("feature", "--no-ff", "--no-commit", "-s", "ours")
+        merge_commit = self.commit({'a.txt': "merged a\n"}, "Merge", [self.repo.heads.master.commit, self.repo.heads.feature.commit])
+        self.assertEqual(2, len(merge_commit.parents))
+        entries = self.index.get_entries(self.repo, "test/repo", self.repo.head.commit.hexsha, ['a.txt', 'b.txt', 'c.txt'])
+        self.assertNotIn('a.txt', entries, "Files changed only by a merge commit should be blamed live")
+        # The merge commit is compared with both of its parents, so files which differ between
+        #  the branches are also blamed live.
+        self.assertDictEqual({}, entries)
+
+    def test_diverged_branches_not_used(self):
+        self.repo.create_head("other")
+        self.commit({'a.txt': "a\nmore a\n"}, "Master")
+        self.index.build(self.repo, "test/repo", "master")
+        self.repo.heads.other.checkout()
+        other_commit = self.commit({'c.txt': "c\n"}, "Other")
+        self.assertDictEqual({}, self.index.get_entries(self.repo, "test/repo", other_commit.hexsha, ['a.txt', 'b.txt']),
+                             "The index should not be used for a commit on a diverged branch")
+        # Updating when the indexed commit is no longer on the branch rebuilds the index.
+        self.repo.git.branch("-f", "master", "other")
+        self.index.update(self.repo, "test/repo")
+        self.assertTupleEqual(("master", other_commit.hexsha), self.index.get_indexed_commit("test/repo"))
+        self.assertEntriesAreBlameAt(other_commit, self.index.get_entries(self.repo, "test/repo", other_commit.hexsha, ['a.txt', 'c.txt']))
+
+    def test_get_bare_repo_updates_index(self):
+        bare_repo_path = os.path.join(self.directory.name, "bare")
+        Repo.clone_from(self.repo.git_dir, bare_repo_path, bare=True).close()
+        bare_repo = Repo(bare_repo_path)
+        self.index.build(bare_repo, "test/repo", "master")
+        second_commit = self.commit({'a.txt': "a\nmore a\n"}, "Second")
+        with mock.patch.object(git_blame, "get_bare_repo_path", return_value=bare_repo_path), \
+                mock.patch.object(git_blame, "get_remote_url", return_value=self.repo.git_dir), \
+                mock.patch.object(common, "get_main_branch_for_repository", return_value="master"), \
+                mock.patch.object(ownership_index, "_ownership_index", self.index), \
+                mock.patch.object(ownership_index, "_ownership_index_process_id", os.getpid()):
+            git_blame.get_bare_repo("test/repo", update_heads=True).close()
+        self.assertTupleEqual(("master", second_commit.hexsha), self.index.get_indexed_commit("test/repo"),
+                              "Fetching new commits should update the ownership index")
+        bare_repo.close()
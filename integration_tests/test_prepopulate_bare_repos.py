@@ -0,0 +1,47 @@
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+from git import Repo
+
+import common
+from data_collection import git_blame
+from data_collection.git_blame import prepopulate_bare_repos
+
+
+class TestPrepopulateBareRepos(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        # Create a local mirror with one repository in it.
+        source = Repo.init(os.path.join(self.directory.name, "source"), initial_branch="master")
+        with open(os.path.join(source.working_tree_dir, "README"), "w") as file:
+            file.write("Test\n")
+        source.index.add(["README"])
+        source.index.commit("First")
+        Repo.clone_from(source.git_dir, os.path.join(self.directory.name, "mirror", "test", "repo.git"), bare=True).close()
+        source.close()
+        self.patches = [
+            mock.patch.object(common, "git_remote_url_prefix", "file://" + os.path.join(self.directory.name, "mirror") + "/"),
+            mock.patch.object(git_blame, "get_bare_repo_path", lambda repository: os.path.join(self.directory.name, "bare", repository)),
+        ]
+        for patch in self.patches:
+            patch.start()
+
+    def tearDown(self):
+        for patch in self.patches:
+            patch.stop()
+        self.directory.cleanup()
+
+    def test_local_remote_not_limited(self):
+        self.assertEqual("file://" + os.path.join(self.directory.name, "mirror", "test", "repo.git"), git_blame.get_remote_url("test/repo"))
+        self.assertDictEqual({}, prepopulate_bare_repos.get_host_semaphores(["test/repo"], 2))
+        with mock.patch.object(common, "git_remote_url_prefix", common.gerrit_url_prefix):
+            self.assertListEqual(["gerrit.wikimedia.org"], list(prepopulate_bare_repos.get_host_semaphores(["test/repo", "test/other"], 2).keys()))
+
+    def test_recently_fetched_repositories_skipped(self):
+        self.assertListEqual(["test/repo", "test/other"], prepopulate_bare_repos.get_repositories_to_process(["test/repo", "test/other"]))
+        self.assertTrue(prepopulate_bare_repos.prepopulate_bare_repo("test/repo", {}), "The repository should be cloned from the local mirror")
+        self.assertTrue(os.path.exists(os.path.join(git_blame.get_bare_repo_path("test/repo"), "FETCH_HEAD")))
+        self.assertListEqual(["test/other"], prepopulate_bare_repos.get_repositories_to_process(["test/repo", "test/other"]),
+                             "A repository fetched in the last two hours should be skipped")
@@ -0,0 +1,59 @@
+import unittest
+from unittest import mock
+
+import requests
+
+from data_collection import git_blame
+from recommender import Recommendations, RecommenderImplementation
+
+
+class _TestImplementation(RecommenderImplementation):
+    def __init__(self):
+        super().__init__('test/repo')
+        self.recommended = []
+
+    def get_change_info(self, change_id: str, branch: str = '') -> dict:
+        if change_id == 'missing':
+            response = requests.Response()
+            response.status_code = 404
+            raise requests.HTTPError(response=response)
+        return {'id': change_id, 'branch': branch, 'files': {}}
+
+    def recommend_using_change_info(self, change_info: dict) -> Recommendations:
+        self.recommended.append(change_info['id'])
+        recommendations = Recommendations()
+        recommendations.get_reviewer_by_name_or_create_new(change_info['id'] + ' reviewer')
+        return recommendations
+
+
+class TestRecommendMany(unittest.TestCase):
+    def test_order_kept_with_errors(self):
+        implementation = _TestImplementation()
+        results = implementation.recommend_many_change_ids(['first', 'missing', 'second'], ['master', 'master', 'REL1_39'])
+        self.assertEqual(3, len(results))
+        self.assertIn('first reviewer', results[0].recommendations[0].names)
+        self.assertIsInstance(results[1], requests.HTTPError, "The error should be returned in place of the recommendations")
+        self.assertEqual(404, results[1].response.status_code)
+        self.assertIn('second reviewer', results[2].recommendations[0].names)
+        self.assertListEqual(['first', 'second'], implementation.recommended)
+
+    def test_branch_for_each_change_required(self):
+        with self.assertRaises(ValueError):
+            _TestImplementation().recommend_many_change_ids(['first', 'second'], ['master'])
+
+    def test_prewarm_groups_by_parent(self):
+        def change_info(parent: str, *files: str) -> dict:
+            return {'parent_shas': [parent], 'branch': 'master', 'files': {file: {'size': 10, 'size_delta': 1} for file in files}}
+        change_infos = [
+            change_info('a' * 40, 'one.php', 'two.php'),
+            change_info('b' * 40, 'three.php'),
+            change_info('a' * 40, 'two.php', 'four.php'),
+            # No lines changed, so not blamed.
+            {'parent_shas': ['b' * 40], 'branch': 'master', 'files': {'five.php': {'size': 10, 'size_delta': 0}}},
+        ]
+        with mock.patch.object(git_blame, 'git_blame_stats_for_head_of_branch') as git_blame_stats:
+            RecommenderImplementation.prewarm_git_blame_cache('test/repo', change_infos)
+        # Only the parent shared by more than one change is blamed, once for the files of all its changes.
+        git_blame_stats.assert_called_once_with(
+            ['one.php', 'two.php', 'four.php'], 'test/repo', 'master', 'a' * 40, per_file=True, max_workers=1
+        )
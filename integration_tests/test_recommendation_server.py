@@ -0,0 +1,99 @@
+import http.client
+import json
+import os
+import tempfile
+import threading
+import unittest
+from unittest import mock
+
+from recommender import recommendation_server
+
+
+class TestRecommendationServer(unittest.TestCase):
+    def setUp(self):
+        self.server = recommendation_server.make_server(port=0)
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def request(self, method: str, path: str, body: bytes = None):
+        connection = http.client.HTTPConnection("127.0.0.1", self.server.server_address[1])
+        connection.request(method, path, body=body)
+        response = connection.getresponse()
+        return response.status, json.loads(response.read())
+
+    def test_health(self):
+        self.assertEqual((200, {"status": "ok"}), self.request("GET", "/health"), "Server should report it is running")
+
+    def test_unknown_path(self):
+        status, _ = self.request("POST", "/rule-based/unknown", b'{}')
+        self.assertEqual(404, status, "Unknown paths should return a 404")
+
+    def test_invalid_request_body(self):
+        status, _ = self.request("POST", "/rule-based/change-info", b'not json')
+        self.assertEqual(400, status, "Invalid JSON should return a 400")
+        status, _ = self.request("POST", "/rule-based/change-info", b'{"repository": "mediawiki/core"}')
+        self.assertEqual(400, status, "Missing change info should return a 400")
+
+
+class TestGetImplementation(unittest.TestCase):
+    def setUp(self):
+        self.patches = [
+            mock.patch.object(recommendation_server, "_implementations", recommendation_server.OrderedDict()),
+            mock.patch.dict(recommendation_server._implementation_locks, clear=True),  # noqa
+            mock.patch.object(recommendation_server, "max_implementations", 2),
+        ]
+        for patch in self.patches:
+            patch.start()
+
+    def tearDown(self):
+        for patch in self.patches:
+            patch.stop()
+
+    def test_other_repositories_not_blocked_while_creating(self):
+        creating = threading.Event()
+        finish_creating = threading.Event()
+
+        def create(repository):
+            if repository == "slow":
+                creating.set()
+                finish_creating.wait(5)
+            return mock.Mock(repository=repository)
+
+        with mock.patch.object(recommendation_server, "RuleBasedImplementation", side_effect=create):
+            thread = threading.Thread(target=recommendation_server.get_implementation, args=("rule-based", "slow", {}))
+            thread.start()
+            self.assertTrue(creating.wait(5))
+            self.assertEqual("fast", recommendation_server.get_implementation("rule-based", "fast", {}).repository,
+                             "Creating an instance should not block requests for other repositories")
+            finish_creating.set()
+            thread.join()
+
+    def test_least_recently_used_removed(self):
+        with mock.patch.object(recommendation_server, "RuleBasedImplementation", side_effect=lambda repository: mock.Mock()) as create:
+            first = recommendation_server.get_implementation("rule-based", "first", {})
+            recommendation_server.get_implementation("rule-based", "second", {})
+            self.assertIs(first, recommendation_server.get_implementation("rule-based", "first", {}))
+            recommendation_server.get_implementation("rule-based", "third", {})
+            self.assertEqual(3, create.call_count)
+            self.assertListEqual(
+                [("rule-based", "first"), ("rule-based", "third")], list(recommendation_server._implementations.keys()),  # noqa
+                "The least recently used instance should be removed"
+            )
+
+
+class TestSaveHotModels(unittest.TestCase):
+    def test_nothing_saved_when_disabled(self):
+        with tempfile.TemporaryDirectory() as directory, \
+                mock.patch.object(recommendation_server, "hot_models_path", os.path.join(directory, "hot_models.json")), \
+                mock.patch.object(recommendation_server.MLPClassifierImplementation, "model_registry") as model_registry:
+            model_registry.get_most_used.side_effect = lambda number: [["model"]] * number
+            recommendation_server.save_hot_models(0)
+            self.assertFalse(os.path.exists(recommendation_server.hot_models_path), "Nothing should be saved if prefetching is disabled")
+            recommendation_server.save_hot_models(5)
+            model_registry.get_most_used.assert_called_once_with(5)
+            with open(recommendation_server.hot_models_path) as file:
+                self.assertEqual(5, len(json.load(file)))
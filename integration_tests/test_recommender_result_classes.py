@@ -195,6 +195,14 @@ class TestRecommendedReviewerClass(unittest.TestCase):
             "String representation of the recommendation was not as expected"
         )
 
+    def test_to_dict(self):
+        recommendation = recommender.RecommendedReviewer("test@test.com", "Test", 5, has_rights_to_merge=True)
+        self.assertDictEqual(
+            {'names': ['Test'], 'emails': ['test@test.com'], 'score': 5, 'has_rights_to_merge': True},
+            recommendation.to_dict(),
+            "Dictionary representation of the recommendation was not as expected"
+        )
+
 class TestNamesClass(unittest.TestCase):
     def test_properties(self):
         names = recommender.Names(names=["Test", "Testing"], parent_weak_ref=weakref.ref(recommender.RecommendedReviewer(emails=["test@test.com"])))
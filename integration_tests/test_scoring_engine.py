@@ -0,0 +1,135 @@
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+import numpy
+
+from recommender import rule_based_recommender
+from recommender.rule_based_recommender import RuleBasedImplementation, RuleBasedWeightings
+from recommender.scoring_engine import IdentityIndex, RuleBasedScoringEngine, StaticScores
+
+
+class TestScoringEngine(unittest.TestCase):
+    def setUp(self):
+        self.weightings = RuleBasedWeightings()
+        self.weightings.lines_count = {'authors': {'all time': 2}, 'committers': {'all time': 1}}
+        self.weightings.votes = {'+2 code review votes': {'all time': 3}}
+        self.weightings.comments = {'all time': 0.5}
+        self.git_blame_stats = {
+            'names': {'test@test.com': ['Test User']},
+            'authors': {'all_time_lines_count': {'test@test.com': 0.5, 'other@test.com': 0.25}},
+            'committers': {'all_time_lines_count': {'test@test.com': 0.5}},
+        }
+        self.reviewer_votes = {'all time': {'test-user': {'+2 code review votes': 0.1}, 'Reviewer': {'+2 code review votes': 0.2}}}
+        self.comments = {'all time': {'Reviewer': 0.4, 'Owner': 1}}
+        self.members = [{'username': 'Reviewer', 'email': 'reviewer@test.com'}]
+
+    def test_identities_joined(self):
+        identity_index = IdentityIndex()
+        email = identity_index.add_email('Test@Test.com')
+        name = identity_index.add_name('Test User')
+        self.assertNotEqual(identity_index.find(email), identity_index.find(name))
+        identity_index.union(name, email)
+        self.assertEqual(identity_index.find(email), identity_index.find(identity_index.add_name('test_user')),
+                         "Names should be matched using the index format")
+        node_identities, identities = identity_index.resolve()
+        self.assertListEqual([(['Test User'], ['Test@Test.com'])], identities)
+
+    def test_scores(self):
+        engine = RuleBasedScoringEngine(self.weightings)
+        static_scores = engine.build_static_scores(self.reviewer_votes, self.comments, self.members)
+        recommendations = engine.recommend(self.git_blame_stats, static_scores, exclude_names=['Owner'])
+        self.assertListEqual(['test@test.com', 'reviewer@test.com', 'other@test.com'],
+                             [reviewer.emails[0] for reviewer in recommendations.ordered_by_score()])
+        # The blame and vote signals for the same user should be added together.
+        self.assertAlmostEqual(0.5 * 2 + 0.5 + 0.1 * 3, recommendations['test@test.com'].score)
+        self.assertAlmostEqual(0.2 * 3 + 0.4 * 0.5, recommendations['Reviewer'].score)
+        self.assertTrue(recommendations['Reviewer'].has_rights_to_merge)
+        self.assertFalse(recommendations['test@test.com'].has_rights_to_merge)
+        self.assertNotIn('Owner', [name for reviewer in recommendations.recommendations for name in reviewer.names],
+                         "Excluded users should not be recommended")
+
+    def test_top_n(self):
+        engine = RuleBasedScoringEngine(self.weightings)
+        static_scores = engine.build_static_scores(self.reviewer_votes, self.comments, self.members)
+        recommendations = engine.recommend(self.git_blame_stats, static_scores, exclude_names=['Test User'], top_n=1)
+        self.assertEqual(1, len(recommendations), "Excluded users should not take up a place in the top N")
+        self.assertIn('Reviewer', recommendations.recommendations[0].names)
+
+    def test_static_scores_saved(self):
+        engine = RuleBasedScoringEngine(self.weightings)
+        static_scores = engine.build_static_scores(self.reviewer_votes, self.comments, self.members)
+        self.assertEqual(1, static_scores.has_rights_to_merge.sum())
+        version = engine.get_static_scores_version((1, 2, 3))
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "static_scores", "test.npz")
+            static_scores.save(path, version)
+            loaded = StaticScores.load(path, version)
+            self.assertListEqual(static_scores.identities, loaded.identities)
+            numpy.testing.assert_array_equal(static_scores.scores, loaded.scores)
+            numpy.testing.assert_array_equal(static_scores.has_rights_to_merge, loaded.has_rights_to_merge)
+            self.assertIsNone(StaticScores.load(path, engine.get_static_scores_version((1, 2, 4))),
+                              "Static scores built from other data should not be loaded")
+            self.weightings.comments = {'all time': 1}
+            self.assertIsNone(StaticScores.load(path, RuleBasedScoringEngine(self.weightings).get_static_scores_version((1, 2, 3))),
+                              "Static scores built with other weightings should not be loaded")
+            # The loaded scores should give the same recommendations.
+            self.assertListEqual(
+                [reviewer.to_dict() for reviewer in engine.recommend(self.git_blame_stats, static_scores).ordered_by_score()],
+                [reviewer.to_dict() for reviewer in engine.recommend(self.git_blame_stats, loaded).ordered_by_score()]
+            )
+
+
+class TestScoringEngineParity(unittest.TestCase):
+    def setUp(self):
+        self.git_blame_stats = {
+            'names': {'alice@test.com': ['Alice']},
+            'authors': {'all_time_lines_count': {'alice@test.com': 0.75, 'eve@test.com': 0.25}},
+            'committers': {'all_time_lines_count': {'alice@test.com': 1.0}},
+        }
+        self.reviewer_votes = {'all time': {
+            'Alice': {'+2 code review votes': 0.1}, 'Bob': {'+2 code review votes': 0.5}, 'Carol': {'+2 code review votes': 0.25}
+        }}
+        self.comments = {'all time': {'Carol': 0.5, 'Owner': 1}}
+        self.members = [{'username': 'Carol'}, {'email': 'eve@test.com'}]
+        self.patches = [
+            mock.patch.object(rule_based_recommender, 'get_reviewer_data', lambda: {'test/parity': self.reviewer_votes}),
+            mock.patch.object(rule_based_recommender, 'get_comment_data', lambda: {'test/parity': self.comments}),
+            mock.patch.object(rule_based_recommender, 'get_members_of_repo', lambda repository: self.members),
+            mock.patch.object(RuleBasedImplementation, 'get_change_git_blame_info', lambda *args: self.git_blame_stats),
+            mock.patch.dict(rule_based_recommender._static_scores_cache, clear=True),  # noqa
+        ]
+        for patch in self.patches:
+            patch.start()
+
+    def tearDown(self):
+        for patch in self.patches:
+            patch.stop()
+
+    def recommend(self, use_scoring_engine: bool) -> dict:
+        implementation = RuleBasedImplementation('test/parity')
+        implementation.weightings.lines_count = {'authors': {'all time': 2}, 'committers': {'all time': 1}}
+        implementation.weightings.votes = {'+2 code review votes': {'all time': 3}}
+        implementation.weightings.comments = {'all time': 0.5}
+        implementation.scoring_engine = RuleBasedScoringEngine(implementation.weightings)
+        with mock.patch.object(RuleBasedImplementation, 'use_scoring_engine', use_scoring_engine):
+            recommendations = implementation.recommend_using_change_info({'owner': {'username': 'Owner'}})
+        return {
+            (frozenset(reviewer.names), frozenset(reviewer.emails)): (round(reviewer.score, 9), reviewer.has_rights_to_merge)
+            for reviewer in recommendations.recommendations
+        }
+
+    def test_same_scores_as_rule_based_implementation(self):
+        self.assertDictEqual(self.recommend(False), self.recommend(True))
+
+    def test_users_found_under_several_names_are_summed(self):
+        # The rule based implementation averages the score of a user with the score of a new
+        #  entry when it finds that they are the same user, which halves the score of members
+        #  listed with an email and a name. The scoring engine sums the signals instead.
+        self.members.append({'email': 'bob@test.com', 'username': 'Bob'})
+        key = (frozenset(['Bob']), frozenset(['bob@test.com']))
+        rule_based_score = self.recommend(False)[key][0]
+        scoring_engine_score = self.recommend(True)[key][0]
+        self.assertAlmostEqual(0.5 * 3, scoring_engine_score)
+        self.assertAlmostEqual(scoring_engine_score / 2, rule_based_score)
@@ -0,0 +1,75 @@
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+import recommender
+from recommender import RecommenderImplementationBase
+from recommender.signal_cache import SignalCache
+
+
+class TestSignalCache(unittest.TestCase):
+    def setUp(self):
+        self.cache_directory = tempfile.TemporaryDirectory()
+        self.cache_path = os.path.join(self.cache_directory.name, "signal_cache.sqlite3")
+        self.change_info = {'id': 'test~master~I1234', 'current_revision': 'a' * 40}
+        self.computed = 0
+
+    def tearDown(self):
+        self.cache_directory.cleanup()
+
+    def compute(self):
+        self.computed += 1
+        return {'authors': {'test@test.com': 0.5}, 'names': ('Test',)}
+
+    def test_put_and_get(self):
+        cache = SignalCache(self.cache_path)
+        self.assertIsNone(cache.get("git blame", "test", "I1234", "a" * 40, ""), "Nothing should be cached yet")
+        cache.put("git blame", "test", "I1234", "a" * 40, "", {'authors': {}})
+        self.assertDictEqual({'authors': {}}, SignalCache(self.cache_path).get("git blame", "test", "I1234", "a" * 40, ""),
+                             "Cached signals should persist")
+        self.assertIsNone(cache.get("git blame", "test", "I1234", "b" * 40, ""), "Signals are specific to the revision")
+        self.assertIsNone(cache.get("git blame", "test", "I1234", "a" * 40, "2"), "Signals with another version are missing")
+
+    def test_get_or_compute_for_change(self):
+        cache = SignalCache(self.cache_path)
+        first = cache.get_or_compute_for_change("git blame", "test", self.change_info, "1", self.compute)
+        second = cache.get_or_compute_for_change("git blame", "test", self.change_info, "1", self.compute)
+        self.assertEqual(1, self.computed, "The signals should only be computed once")
+        self.assertDictEqual({'authors': {'test@test.com': 0.5}, 'names': ['Test']}, first,
+                             "The computed signals should be returned as they are read from the cache")
+        self.assertDictEqual(first, second)
+        self.assertEqual((1, 1), (cache.hits, cache.misses))
+        cache.get_or_compute_for_change("git blame", "test", self.change_info, "2", self.compute)
+        self.assertEqual(2, self.computed, "The signals should be computed again for a new version")
+
+    def test_change_without_revision_not_cached(self):
+        cache = SignalCache(self.cache_path)
+        for _ in range(2):
+            cache.get_or_compute_for_change("git blame", "test", {'id': 'I1234'}, "", self.compute)
+        self.assertEqual(2, self.computed, "Signals without a revision should not be cached")
+        self.assertEqual((0, 0), (cache.hits, cache.misses))
+
+    def test_repository_signals_kept_in_memory(self):
+        cache = SignalCache(self.cache_path)
+        first = cache.get_or_compute("votes", "test", "", "", "1", self.compute)
+        self.assertIs(first, cache.get_or_compute("votes", "test", "", "", "1", self.compute),
+                      "Signals about a repository should be read from the database once")
+        self.assertEqual(1, self.computed)
+        cache.clear()
+        cache.get_or_compute("votes", "test", "", "", "1", self.compute)
+        self.assertEqual(2, self.computed, "Signals should be computed again after the cache is cleared")
+
+    def test_git_blame_info_computed_again_on_another_day(self):
+        cache = SignalCache(self.cache_path)
+        with mock.patch.object(recommender, "get_signal_cache", return_value=cache), \
+                mock.patch.object(RecommenderImplementationBase, "use_signal_cache", True), \
+                mock.patch.object(RecommenderImplementationBase, "_build_change_git_blame_info", lambda *args: self.compute()), \
+                mock.patch.object(recommender, "time") as time:
+            time.strftime.return_value = "2022-01-01"
+            for _ in range(2):
+                RecommenderImplementationBase.get_change_git_blame_info("test", self.change_info)
+            self.assertEqual(1, self.computed)
+            time.strftime.return_value = "2022-01-02"
+            RecommenderImplementationBase.get_change_git_blame_info("test", self.change_info)
+            self.assertEqual(2, self.computed, "The time periods of the git blame stats depend on the current date")
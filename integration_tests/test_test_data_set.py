@@ -0,0 +1,89 @@
+import json
+import os
+import tempfile
+import shutil
+import unittest
+from unittest import mock
+
+import common
+
+
+class TestTestDataSetIndex(unittest.TestCase):
+    def setUp(self):
+        self.test_data_set = [
+            {"mediawiki/core": {"last month": {"merged": {"1": {"subject": "Fix \"}\" in {braces} [and] \\ slashes"}}}}},
+            {"mediawiki/extensions/CheckUser": {"all time": {"merged": {}, "open": {"2": {"files": {"a/b.php": {}}}}}}},
+            {"mediawiki/extensions/Empty": {}},
+            {"mediawiki/core": {"all time": {"merged": {}}}},
+        ]
+        file_descriptor, self.data_set_path = tempfile.mkstemp(suffix=".json")
+        with os.fdopen(file_descriptor, 'w') as f:
+            json.dump(self.test_data_set, f, indent=1)
+
+    def tearDown(self):
+        os.remove(self.data_set_path)
+
+    def test_index_byte_ranges_contain_item(self):
+        index = common.build_test_data_set_index(self.data_set_path)
+        with open(self.data_set_path, 'rb') as f:
+            data = f.read()
+        for repository, (start, end) in index.items():
+            item = json.loads(data[start:end])
+            self.assertListEqual([repository], list(item.keys()), "Byte range should cover only the item for the repository")
+
+    def test_index_uses_first_item_for_repository(self):
+        index = common.build_test_data_set_index(self.data_set_path)
+        self.assertCountEqual(
+            ["mediawiki/core", "mediawiki/extensions/CheckUser", "mediawiki/extensions/Empty"],
+            index.keys(),
+            "Every repository in the data set should be indexed once"
+        )
+        with open(self.data_set_path, 'rb') as f:
+            f.seek(index["mediawiki/core"][0])
+            item = json.loads(f.read(index["mediawiki/core"][1] - index["mediawiki/core"][0]))
+        self.assertDictEqual(self.test_data_set[0], item, "The first item for a repository should be indexed")
+
+    def test_index_of_empty_file(self):
+        open(self.data_set_path, 'w').close()
+        self.assertDictEqual({}, common.build_test_data_set_index(self.data_set_path), "Empty data set should have an empty index")
+
+class TestShardedTestDataSet(unittest.TestCase):
+    def setUp(self):
+        self.shards_path = tempfile.mkdtemp()
+        self.patches = [
+            mock.patch.object(common, 'test_data_set_shards_path', self.shards_path),
+            mock.patch.object(common, 'test_data_set_shards_manifest_path', os.path.join(self.shards_path, 'manifest.json')),
+        ]
+        for patch in self.patches:
+            patch.start()
+        common.get_test_data_for_repo.cache_clear()
+
+    def tearDown(self):
+        for patch in self.patches:
+            patch.stop()
+        common.get_test_data_for_repo.cache_clear()
+        shutil.rmtree(self.shards_path)
+
+    def test_shard_round_trip(self):
+        test_data = {"merged": {"1": {"branch": "master"}, "2": {"branch": "master"}}, "open": {}, "abandoned": {"3": {}}}
+        common.write_test_data_shards_manifest({
+            "mediawiki/core": common.write_test_data_shard("mediawiki/core", "last year", test_data)
+        })
+        self.assertTupleEqual(
+            ("last year", test_data),
+            common.get_test_data_for_repo("mediawiki/core"),
+            "Data read from the shard should match the data written"
+        )
+        self.assertDictEqual(
+            {"time_period": "last year", "counts": {"merged": 2, "open": 0, "abandoned": 1}},
+            common.get_test_data_header_for_repo("mediawiki/core"),
+            "Header should have the time period and change counts for each status"
+        )
+
+    def test_repository_not_in_manifest(self):
+        common.write_test_data_shards_manifest({})
+        self.assertIsNone(common.get_test_data_for_repo("mediawiki/core"), "Repository without a shard should have no data")
+        self.assertIsNone(common.get_test_data_header_for_repo("mediawiki/core"), "Repository without a shard should have no header")
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,39 @@
+import unittest
+
+import numpy
+
+from recommender.neural_network_recommender.feature_store import FeatureStore
+from recommender.neural_network_recommender.under_sampling import UnderSamplingMode, under_sample
+
+
+class TestUnderSampling(unittest.TestCase):
+    def setUp(self):
+        self.training_data = FeatureStore(["approved"])
+        # The first change has one approver out of four users and the second change has no approvers.
+        self.training_data.add(numpy.arange(8).reshape(4, 2), ['a', 'b'], approved=[False, True, False, False])
+        self.training_data.add(numpy.arange(4).reshape(2, 2), ['a', 'b'], approved=[False, False])
+        self.training_data.add(numpy.arange(6).reshape(3, 2) + 10, ['a', 'b'], approved=[True, False, True])
+
+    def test_random_under_sampling_is_stratified_by_change(self):
+        under_sampled_training_data = FeatureStore(["approved"])
+        under_sample(self.training_data, "approved", under_sampled_training_data, UnderSamplingMode.RANDOM, random_state=0)
+        self.assertEqual(2, len(under_sampled_training_data), "Changes without both classes should be skipped")
+        first_change = under_sampled_training_data.get_features(0)
+        self.assertEqual(2, len(first_change))
+        self.assertListEqual([2, 3], first_change[under_sampled_training_data.get_labels("approved", 0)][0].tolist())
+        # The only user that didn't approve the last change should be kept along with one of the approvers.
+        second_change = under_sampled_training_data.get_features(1)
+        self.assertListEqual([12, 13], second_change[~under_sampled_training_data.get_labels("approved", 1)][0].tolist())
+        self.assertEqual(1, under_sampled_training_data.get_labels("approved", 1).sum())
+
+    def test_under_sampling_per_model(self):
+        for mode in [UnderSamplingMode.CLUSTER_CENTROIDS_PER_MODEL, UnderSamplingMode.NONE]:
+            under_sampled_training_data = FeatureStore(["approved"])
+            under_sample(self.training_data, "approved", under_sampled_training_data, mode)
+            self.assertEqual(1, len(under_sampled_training_data), mode)
+            approved = under_sampled_training_data.labels("approved")
+            self.assertEqual(3, approved.sum(), mode)
+            if mode == UnderSamplingMode.NONE:
+                self.assertEqual(7, len(approved))
+            else:
+                self.assertEqual(6, len(approved))
@@ -6,7 +6,7 @@ from functools import lru_cache
 from weakref import ReferenceType
 from collections.abc import Iterable, Sized
 import logging
-from typing import List, Union, Optional, Iterator, Any, Tuple
+from typing import List, Union, Optional, Iterator, Any, Tuple, Callable
 import itertools
 import urllib.parse
 import requests
@@ -15,6 +15,7 @@ from data_collection import git_blame
 from data_collection.preprocessing import reviewer_votes_to_percentages, comment_counts_to_percentages
 import common
 import time
+from recommender.signal_cache import get_signal_cache
 
 class WeightingsBase:
     def __init__(self, weightings_file):
@@ -25,13 +26,18 @@ class WeightingsBase:
     def __iter__(self):
         return iter(self._weightings)
 
+members_of_mediawiki_repos_path = common.path_relative_to_root('data_collection/raw_data/members_of_mediawiki_repos.json')
+
+reviewer_data_path = common.path_relative_to_root('data_collection/raw_data/reviewer_vote_percentages_for_repos.json')
+
+comment_data_path = common.path_relative_to_root('data_collection/raw_data/comment_count_percentages_by_author_for_repo.json')
+
 @lru_cache(maxsize=1)
 def load_members_of_mediawiki_repos() -> dict:
     """
     Load the data set of members of groups that have access to mediawiki repos.
     """
-    members_list = common.path_relative_to_root('data_collection/raw_data/members_of_mediawiki_repos.json')
-    return json.load(open(members_list, 'r'))
+    return json.load(open(members_of_mediawiki_repos_path, 'r'))
 
 @lru_cache(maxsize=5)
 def get_members_of_repo(repository: str) -> List[dict[str, Any]]:
@@ -73,7 +79,7 @@ def get_reviewer_data():
     """
     Load and return the code review percentages data
     """
-    percentage_list = common.path_relative_to_root('data_collection/raw_data/reviewer_vote_percentages_for_repos.json')
+    percentage_list = reviewer_data_path
     if not os.path.exists(percentage_list):
         comment_counts_to_percentages.convert_data_to_percentages()
     return json.load(open(percentage_list, 'r'))
@@ -83,11 +89,44 @@ def get_comment_data():
     """
     Load and return the comment percentages data
     """
-    percentage_list = common.path_relative_to_root('data_collection/raw_data/comment_count_percentages_by_author_for_repo.json')
+    percentage_list = comment_data_path
     if not os.path.exists(percentage_list):
         reviewer_votes_to_percentages.convert_data_to_percentages()
     return json.load(open(percentage_list, 'r'))
 
+_loaded_data_signature = None
+"""The data signature when the data sets were last loaded by the functions above."""
+
+def get_data_signature() -> Tuple[int, int, int]:
+    """
+    Get the modification times of the reviewer vote, comment and members data sets. This
+    changes when any of these data sets are regenerated, so can be used to invalidate data
+    derived from them. A data set that doesn't exist has a modification time of 0.
+    """
+    return tuple(
+        os.stat(path).st_mtime_ns if os.path.exists(path) else 0
+        for path in [reviewer_data_path, comment_data_path, members_of_mediawiki_repos_path]
+    )
+
+def reload_data_if_changed() -> Tuple[int, int, int]:
+    """
+    Clear the loaded reviewer vote, comment and members data sets if any of them have changed
+    since they were loaded, so that the next call to the functions above loads the new data.
+
+    :returns: The current data signature as returned by ::get_data_signature
+    """
+    global _loaded_data_signature
+    data_signature = get_data_signature()
+    if data_signature != _loaded_data_signature:
+        if _loaded_data_signature is not None:
+            logging.info("Data sets have changed. Clearing the loaded data.")
+            load_members_of_mediawiki_repos.cache_clear()
+            get_members_of_repo.cache_clear()
+            get_reviewer_data.cache_clear()
+            get_comment_data.cache_clear()
+        _loaded_data_signature = data_signature
+    return data_signature
+
 class RecommendedReviewer:
     def __init__(self, emails: Optional[Union[str, 'Names', List[str]]] = None, names: Union[str, 'Names', List[str]] = None, score: float = 0, parent: Optional[ReferenceType] = None, has_rights_to_merge: Optional[bool] = None):
         """
@@ -155,6 +194,17 @@ class RecommendedReviewer:
             return NotImplemented
         return self.score > other.score
 
+    def to_dict(self) -> dict:
+        """
+        Get the recommendation as a dictionary that can be serialised to JSON.
+        """
+        return {
+            'names': list(self.names),
+            'emails': list(self.emails),
+            'score': self.score,
+            'has_rights_to_merge': self.has_rights_to_merge
+        }
+
     def __str__(self):
         return_string = "Recommending"
         if len(self.emails or ''):
@@ -546,6 +596,28 @@ class Recommendations(Sized):
         raise KeyError("Item is neither a defined emails or name in this recommendations list.")
 
 class RecommenderImplementationBase:
+    git_blame_workers = 1
+    """The maximum number of files in a change to run git blame on at the same time."""
+    use_signal_cache = False
+    """
+    Store the git blame stats for each change (and other signals used to make recommendations) in the
+    signal cache, and read them from it instead of computing them again. See signal_cache.py.
+    """
+
+    @classmethod
+    def get_repository_signals(cls, kind: str, repository: str, compute: Callable[[], Any]) -> Any:
+        """
+        Get signals that are the same for every change on the repository, such as the vote percentages.
+        If the signal cache is used, these are read from the cache while the data sets are unchanged.
+
+        :param kind: The type of signals
+        :param repository: The repository the signals are for
+        :param compute: Computes the signals from the data sets
+        """
+        if not cls.use_signal_cache:
+            return compute()
+        return get_signal_cache().get_or_compute(kind, repository, "", "", str(get_data_signature()), compute)
+
     @staticmethod
     def _make_git_blame_stats(git_blame_stats: dict, change_info: dict, return_dictionary: dict,
                               total_delta_over_all_files: int, file_aliases: dict, git_blame_type: str) -> None:
@@ -608,34 +680,19 @@ class RecommenderImplementationBase:
                         (file_size_delta / total_delta_over_all_files)
 
     @classmethod
-    def get_change_git_blame_info(cls, repository: str, change_info: dict):
+    def _get_git_blame_arguments(cls, repository: str, change_info: dict) -> Tuple[dict, dict]:
         """
-        Get the git blame info for the change.
+        Build the arguments to git_blame.git_blame_stats_for_head_of_branch for the files modified by the change.
 
         :param repository: The repository this change is on
         :param change_info: The change info associated with the change.
+        :returns: The arguments, and the old names of files that have been moved in this change mapped to the new names
         """
-        return_dictionary = {
-            "authors": {},
-            "committers": {},
-            "_emails_to_names_index": {},
-            "_names_to_emails_index": {},
-            "names": {}
-        }
-        total_delta_over_all_files = sum(
-            [abs(info['size_delta']) for info in change_info['files'].values()])
-        time_period_to_key = {y.value: y.value.replace(' ', '_') + "_lines_count" for y in common.TimePeriods}
-        # Fill out the result dictionary with empty dictionaries.
-        for git_blame_type_dictionary in [return_dictionary["authors"], return_dictionary["committers"]]:
-            git_blame_type_dictionary.update(dict((key, {}) for key in time_period_to_key.values()))
-        if total_delta_over_all_files == 0:
-            # Return early as no calculations needed because no files were modified (0 for all is fine)
-            return return_dictionary
-        # Build the arguments to the git blame function.
         git_blame_arguments = {
             'repository': repository,
             'files': [],
-            'per_file': True
+            'per_file': True,
+            'max_workers': cls.git_blame_workers
         }
         if 'parent_shas' in change_info and len(change_info['parent_shas']):
             # Use the parent sha if available as this will perform stats on the code that was
@@ -668,6 +725,58 @@ class RecommenderImplementationBase:
                         #  or copy would make sense here.
                         git_blame_arguments['files'].append(info['old_path'])
                         file_aliases[info['old_path']] = filename
+        return git_blame_arguments, file_aliases
+
+    @classmethod
+    def get_change_git_blame_info(cls, repository: str, change_info: dict):
+        """
+        Get the git blame info for the change. If the signal cache is used, this is read from the cache
+        if it was computed for the same revision of the change on the same day.
+
+        :param repository: The repository this change is on
+        :param change_info: The change info associated with the change.
+        """
+        if cls.use_signal_cache:
+            return get_signal_cache().get_or_compute_for_change(
+                "git blame", repository, change_info, cls._get_git_blame_info_version(),
+                lambda: cls._build_change_git_blame_info(repository, change_info)
+            )
+        return cls._build_change_git_blame_info(repository, change_info)
+
+    @staticmethod
+    def _get_git_blame_info_version() -> str:
+        """
+        Get the version the git blame info is stored in the signal cache with. The lines counts for
+        each time period depend on the current date, so this is the current date. Stats cached on a
+        previous day are then computed again instead of using the old time period cutoffs.
+        """
+        return time.strftime("%Y-%m-%d")
+
+    @classmethod
+    def _build_change_git_blame_info(cls, repository: str, change_info: dict):
+        """
+        Build the git blame info for the change by running git blame over the files it modifies.
+
+        :param repository: The repository this change is on
+        :param change_info: The change info associated with the change.
+        """
+        return_dictionary = {
+            "authors": {},
+            "committers": {},
+            "_emails_to_names_index": {},
+            "_names_to_emails_index": {},
+            "names": {}
+        }
+        total_delta_over_all_files = sum(
+            [abs(info['size_delta']) for info in change_info['files'].values()])
+        time_period_to_key = {y.value: y.value.replace(' ', '_') + "_lines_count" for y in common.TimePeriods}
+        # Fill out the result dictionary with empty dictionaries.
+        for git_blame_type_dictionary in [return_dictionary["authors"], return_dictionary["committers"]]:
+            git_blame_type_dictionary.update(dict((key, {}) for key in time_period_to_key.values()))
+        if total_delta_over_all_files == 0:
+            # Return early as no calculations needed because no files were modified (0 for all is fine)
+            return return_dictionary
+        git_blame_arguments, file_aliases = cls._get_git_blame_arguments(repository, change_info)
         # Get the git blame stats using the arguments that were built above.
         git_blame_stats = git_blame.git_blame_stats_for_head_of_branch(**git_blame_arguments)
         logging.debug("Git blame files from base: " + str(git_blame_stats))
@@ -681,6 +790,37 @@ class RecommenderImplementationBase:
         del return_dictionary["_names_to_emails_index"]
         return return_dictionary
 
+    @classmethod
+    def prewarm_git_blame_cache(cls, repository: str, change_infos: List[dict]) -> None:
+        """
+        Run git blame once over the files modified by all the provided changes which share
+        the same parent commit (or branch if there is no parent commit). The results are stored
+        in the git blame cache, so that ::get_change_git_blame_info for each change reads the
+        files from the cache instead of blaming files shared between the changes more than once.
+
+        :param repository: The repository these changes are on
+        :param change_infos: The change info associated with each change.
+        """
+        files_for_base = {}
+        changes_for_base = {}
+        for change_info in change_infos:
+            if not sum([abs(info['size_delta']) for info in change_info['files'].values()]):
+                # No git blame stats are needed for this change.
+                continue
+            git_blame_arguments, _ = cls._get_git_blame_arguments(repository, change_info)
+            base = (git_blame_arguments.get('parent_commit_sha'), git_blame_arguments['branch'])
+            # Use a dictionary as an ordered set of files.
+            files_for_base.setdefault(base, {}).update(dict.fromkeys(git_blame_arguments['files']))
+            changes_for_base[base] = changes_for_base.get(base, 0) + 1
+        for (parent_commit_sha, branch), files in files_for_base.items():
+            if changes_for_base[(parent_commit_sha, branch)] < 2 or not len(files):
+                # Nothing is shared with another change, so blame the files when recommending.
+                continue
+            logging.debug("Pre-warming git blame cache for " + str(len(files)) + " files at " + str(parent_commit_sha or branch))
+            git_blame.git_blame_stats_for_head_of_branch(
+                list(files), repository, branch, parent_commit_sha, per_file=True, max_workers=cls.git_blame_workers
+            )
+
 class RecommenderImplementation(RecommenderImplementationBase, ABC):
     def __init__(self, repository: str):
         """
@@ -701,13 +841,13 @@ class RecommenderImplementation(RecommenderImplementationBase, ABC):
         """
         return NotImplemented
 
-    def recommend_using_change_id(self, change_id: str, branch: str = '') -> Recommendations:
+    def get_change_info(self, change_id: str, branch: str = '') -> dict:
         """
-        Recommend reviewers for a patch using a Change-ID and (optionally) a branch
+        Get the change info for the latest revision of a patch using a Change-ID and (optionally) a branch
 
         :param change_id: The Change-ID for this patch (as detailed on gerrit)
         :param branch: The branch this change is on (required if change exists on multiple branches)
-        :return: The recommended reviewers in a Recommendations object
+        :return: The change info, with the files modified by the latest revision under the 'files' key
         :raises HTTPError: If information provided does not match a change or multiple patches match
         """
         # Rate-limiting
@@ -729,4 +869,53 @@ class RecommenderImplementation(RecommenderImplementationBase, ABC):
         logging.debug("Returned change info: " + str(change_info))
         latest_revision_sha = list(change_info['revisions'].keys())[0]
         change_info['files'] = change_info['revisions'][latest_revision_sha]['files']
-        return self.recommend_using_change_info(change_info)
\ No newline at end of file
+        return change_info
+
+    def recommend_using_change_id(self, change_id: str, branch: str = '') -> Recommendations:
+        """
+        Recommend reviewers for a patch using a Change-ID and (optionally) a branch
+
+        :param change_id: The Change-ID for this patch (as detailed on gerrit)
+        :param branch: The branch this change is on (required if change exists on multiple branches)
+        :return: The recommended reviewers in a Recommendations object
+        :raises HTTPError: If information provided does not match a change or multiple patches match
+        """
+        return self.recommend_using_change_info(self.get_change_info(change_id, branch))
+
+    def recommend_many(self, change_infos: List[dict]) -> List[Recommendations]:
+        """
+        Recommend reviewers for several patches on this repository using pre-downloaded change information.
+
+        The git blame work is shared between changes with the same parent commit.
+
+        :param change_infos: Change information for each patch
+        :return: The recommendations for each patch in the same order as the change information
+        """
+        self.prewarm_git_blame_cache(self.repository, change_infos)
+        return [self.recommend_using_change_info(change_info) for change_info in change_infos]
+
+    def recommend_many_change_ids(self, change_ids: List[str], branches: Union[str, List[str]] = '') -> List[Union[Recommendations, requests.HTTPError]]:
+        """
+        Recommend reviewers for several patches on this repository using their Change-IDs.
+
+        :param change_ids: The Change-IDs for the patches (as detailed on gerrit)
+        :param branches: The branch the changes are on, or a list of the branch for each change.
+        :return: The recommendations for each patch in the same order as the Change-IDs. If the
+         change info for a patch could not be fetched, the HTTPError is returned in place of the
+         recommendations for that patch.
+        :raises ValueError: If a list of branches is given which is not the same length as the Change-IDs
+        """
+        if isinstance(branches, str):
+            branches = [branches] * len(change_ids)
+        if len(branches) != len(change_ids):
+            raise ValueError("The same number of branches as Change-IDs must be provided.")
+        results = []
+        change_infos = []
+        for change_id, branch in zip(change_ids, branches):
+            try:
+                change_infos.append(self.get_change_info(change_id, branch))
+                results.append(None)
+            except requests.HTTPError as e:
+                results.append(e)
+        recommendations = iter(self.recommend_many(change_infos))
+        return [next(recommendations) if result is None else result for result in results]
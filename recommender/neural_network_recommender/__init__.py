@@ -1,11 +1,91 @@
-import itertools
+import json
 import logging
-from typing import List, Union
+import os
+import threading
+from collections import OrderedDict
+from typing import Optional, Tuple
 
+import numpy
 import pandas
 import common
 from recommender import get_reviewer_data, get_comment_data, get_members_of_repo, RecommenderImplementation, \
-    RecommenderImplementationBase
+    RecommenderImplementationBase, reload_data_if_changed
+from recommender.neural_network_recommender.feature_builder import build_change_specific_data_frame
+
+base_data_frame_snapshots_path = common.path_relative_to_root("data_collection/raw_data/base_data_frame_snapshots/")
+
+_base_data_frames_cache = OrderedDict()
+"""
+The base DataFrames for the most recently used repositories, keyed by the repository and the data
+signature they were built from. The least recently used entry is removed first.
+"""
+
+_base_data_frames_cache_lock = threading.Lock()
+
+def get_base_data_frame_snapshot_path(repository: str) -> str:
+    """
+    Gets the path to the on-disk snapshot of the base DataFrames for the repository.
+    """
+    return os.path.join(base_data_frame_snapshots_path, common.get_sanitised_filename(repository) + ".npz")
+
+def save_base_data_frames_snapshot(path: str, data_frames: dict[str, pandas.DataFrame], data_signature: Tuple[int, ...]) -> None:
+    """
+    Save the base DataFrames to disk with each column stored as a separate array.
+
+    :param path: The path to save the snapshot to
+    :param data_frames: The DataFrames for each time period
+    :param data_signature: The data signature the DataFrames were built from
+    """
+    arrays = {'data_signature': numpy.array(data_signature, dtype=numpy.int64)}
+    metadata = []
+    for data_frame_number, (key, data_frame) in enumerate(data_frames.items()):
+        metadata.append({
+            'key': key,
+            'index_dtype': str(data_frame.index.dtype),
+            'columns': list(data_frame.columns),
+            'dtypes': [str(dtype) for dtype in data_frame.dtypes]
+        })
+        arrays[str(data_frame_number) + '_index'] = _to_array_without_objects(data_frame.index.to_numpy())
+        for column_number, column in enumerate(data_frame.columns):
+            arrays[str(data_frame_number) + '_' + str(column_number)] = _to_array_without_objects(data_frame.iloc[:, column_number].to_numpy())
+    arrays['metadata'] = numpy.array(json.dumps(metadata))
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    # Write to a temporary file first so that other processes never read a partially written snapshot.
+    with open(path + '.tmp', 'wb') as file:
+        numpy.savez(file, **arrays)
+    os.replace(path + '.tmp', path)
+
+def _to_array_without_objects(values: numpy.ndarray) -> numpy.ndarray:
+    """
+    Convert object arrays, such as the usernames in the index, to string arrays so that
+    the snapshot can be loaded without pickle.
+    """
+    if values.dtype == object:
+        return numpy.asarray(values, dtype=str)
+    return numpy.asarray(values)
+
+def load_base_data_frames_snapshot(path: str, data_signature: Tuple[int, ...]) -> Optional[dict[str, pandas.DataFrame]]:
+    """
+    Load the base DataFrames saved by ::save_base_data_frames_snapshot.
+
+    :param path: The path to the snapshot
+    :param data_signature: The current data signature
+    :returns: The DataFrames for each time period, or None if the snapshot doesn't exist or was
+     built from different data.
+    """
+    if not os.path.exists(path):
+        return None
+    with numpy.load(path) as arrays:
+        if tuple(arrays['data_signature']) != tuple(data_signature):
+            return None
+        data_frames = {}
+        for data_frame_number, metadata in enumerate(json.loads(str(arrays['metadata']))):
+            index = pandas.Index(arrays[str(data_frame_number) + '_index'], dtype=metadata['index_dtype'])
+            data_frames[metadata['key']] = pandas.DataFrame({
+                column: pandas.array(arrays[str(data_frame_number) + '_' + str(column_number)], dtype=dtype)
+                for column_number, (column, dtype) in enumerate(zip(metadata['columns'], metadata['dtypes']))
+            }, index=index, columns=metadata['columns'])
+    return data_frames
 
 class MLPClassifierImplementationBase(RecommenderImplementationBase):
     """
@@ -13,15 +93,54 @@ class MLPClassifierImplementationBase(RecommenderImplementationBase):
     and also the class that uses the trained models to produce recommendations. Allows
     access to common methods.
     """
+    use_base_data_frame_snapshots = False
+    """Whether to store the base DataFrames on disk, so that other processes can load them instead of building them."""
+    base_data_frames_cache_size = 4
+    """The number of repositories to keep the base DataFrames for in memory."""
+
     @staticmethod
     def preprocess_into_pandas_data_frame(repository: str) -> dict[str, pandas.DataFrame]:
         """
         Process the repo-specific data into a pandas DataFrame to be used for either training
         or making recommendations.
 
+        The DataFrames are built once for each repository and kept until the reviewer vote,
+        comment or members data sets change, or until they are the least recently used of more
+        than ::base_data_frames_cache_size repositories. If ::use_base_data_frame_snapshots is True, they are
+        also stored on disk. Copies are returned so that callers can modify them.
+
         :param repository: The repository this DataFrame should be generated for.
         :return: The pandas DataFrame.
         """
+        data_signature = reload_data_if_changed()
+        with _base_data_frames_cache_lock:
+            data_frames = _base_data_frames_cache.get((repository, data_signature))
+            if data_frames is not None:
+                _base_data_frames_cache.move_to_end((repository, data_signature))
+        if data_frames is None:
+            snapshot_path = get_base_data_frame_snapshot_path(repository)
+            if MLPClassifierImplementationBase.use_base_data_frame_snapshots:
+                data_frames = load_base_data_frames_snapshot(snapshot_path, data_signature)
+            if data_frames is None:
+                data_frames = MLPClassifierImplementationBase._build_base_data_frames(repository)
+                if MLPClassifierImplementationBase.use_base_data_frame_snapshots:
+                    save_base_data_frames_snapshot(snapshot_path, data_frames, data_signature)
+            with _base_data_frames_cache_lock:
+                # Remove the DataFrames built from old data for this repository.
+                for key in [key for key in _base_data_frames_cache.keys() if key[0] == repository]:
+                    del _base_data_frames_cache[key]
+                _base_data_frames_cache[(repository, data_signature)] = data_frames
+                while len(_base_data_frames_cache) > MLPClassifierImplementationBase.base_data_frames_cache_size:
+                    _base_data_frames_cache.popitem(last=False)
+        return {key: data_frame.copy(deep=True) for key, data_frame in data_frames.items()}
+
+    @staticmethod
+    def _build_base_data_frames(repository: str) -> dict[str, pandas.DataFrame]:
+        """
+        Build the DataFrames returned by ::preprocess_into_pandas_data_frame from the data sets.
+
+        :param repository: The repository this DataFrame should be generated for.
+        """
         return_data = {}
         # Collate the code review vote percentages data into a DataFrame.
         reviewer_data = get_reviewer_data()[repository]
@@ -91,66 +210,7 @@ class MLPClassifierImplementationBase(RecommenderImplementationBase):
         :param repository: The repository the DataFrame and change are for
         :param change_info: The change info associated with the change
         :param data_frame: The DataFrame generated by ::preprocess_into_pandas_data_frame for the
-         repository in the repository argument.
+         repository in the repository argument. This is not modified.
         """
-        # Make a copy as this will modify the DataFrame and cause the master repo-specific copy to be modified too.
-        data_frame = data_frame.copy(True)
-        time_period_to_key = {y.value: y.value.replace(' ', '_') + "_lines_count" for y in common.TimePeriods}
-        index_form_to_data_frame_username = {
-            common.convert_name_to_index_format(name): name for name in data_frame.index
-        }
         git_blame_info = cls.get_change_git_blame_info(repository, change_info)
-        # Add columns for the author and reviewer git blame percentages
-        for name in itertools.chain.from_iterable([
-            [y.value + x for y in common.TimePeriods] for x in
-            [" author git blame percentage", " reviewer git blame percentage"]
-        ]):
-            data_frame[name] = 0
-        def is_a_name_used_in_data_frame(names: Union[List[str], str]):
-            """
-            Helper function that returns a Truthy value if
-            the name is already used in the DataFrame otherwise
-            returns False.
-
-            :param names: The username(s) that are being checked.
-            """
-            if isinstance(names, str):
-                names = [names]
-            for name in names:
-                # De-duplicate by using index format to find similar usernames that
-                #  are almost certainly the same person.
-                name_index_form = common.convert_name_to_index_format(name)
-                if name_index_form in index_form_to_data_frame_username.keys():
-                    return index_form_to_data_frame_username[name_index_form]
-            return False
-        # Process the author git blame percentages
-        for time_period, column in {y.value: y.value + " author git blame percentage" for y in
-                                    common.TimePeriods}.items():
-            for author_email, percentage in git_blame_info["authors"][time_period_to_key[time_period]].items():
-                if author_email in git_blame_info["names"] and len(git_blame_info["names"][author_email]):
-                    data_frame_name = is_a_name_used_in_data_frame(git_blame_info["names"][author_email])
-                    if not data_frame_name:
-                        # If the data frame doesn't have any of the names, then use the first name
-                        data_frame_name = git_blame_info["names"][author_email][0]
-                else:
-                    # Shouldn't occur, but use email if no name was given for the commit.
-                    data_frame_name = author_email
-                if data_frame_name not in data_frame.index.values:
-                    data_frame.loc[data_frame_name, :] = 0
-                data_frame.at[data_frame_name, column] = percentage
-        # Process the reviewer git blame percentages
-        for time_period, column in {y.value: y.value + " reviewer git blame percentage" for y in
-                                    common.TimePeriods}.items():
-            for committer_email, percentage in git_blame_info["committers"][time_period_to_key[time_period]].items():
-                if committer_email in git_blame_info["names"] and len(git_blame_info["names"][committer_email]):
-                    data_frame_name = is_a_name_used_in_data_frame(git_blame_info["names"][committer_email])
-                    if not data_frame_name:
-                        # If the data frame doesn't have any of the names, then use the first name
-                        data_frame_name = git_blame_info["names"][committer_email][0]
-                else:
-                    # Shouldn't occur, but use email if no name was given for the commit.
-                    data_frame_name = committer_email
-                if data_frame_name not in data_frame.index.values:
-                    data_frame.loc[data_frame_name, :] = 0
-                data_frame.at[data_frame_name, column] = percentage
-        return data_frame
\ No newline at end of file
+        return build_change_specific_data_frame(data_frame, git_blame_info)
@@ -0,0 +1,141 @@
+"""
+Builds the input features (and for training the target values) for a change from the base DataFrame
+for the repository and the git blame info for the change.
+
+Adding rows to a DataFrame one at a time with .loc and setting cells one at a time with .at reallocates
+the DataFrame on every insertion. Instead the rows for new users are found first using a map of
+names to rows, and then the feature matrix is allocated once and filled using NumPy.
+
+The rows and columns are in the same order as the DataFrames that the scalers and models were trained on:
+* The rows of the base DataFrame, followed by the users only found in the git blame info, in the order
+  they were found, followed by (when training) the users that only voted on the change.
+* The columns of the base DataFrame, followed by the git blame percentage columns from
+  ::git_blame_columns, followed by (when training) the "Actually voted" and "Actually approved" columns.
+"""
+import itertools
+from typing import List, Tuple
+
+import numpy
+import pandas
+
+import common
+
+_time_period_to_key = {y.value: y.value.replace(' ', '_') + "_lines_count" for y in common.TimePeriods}
+
+git_blame_columns = list(itertools.chain.from_iterable([
+    [y.value + x for y in common.TimePeriods] for x in
+    [" author git blame percentage", " reviewer git blame percentage"]
+]))
+"""The names of the git blame percentage columns added to the base DataFrame, in order."""
+
+def build_change_specific_features(base_data_frame: pandas.DataFrame, git_blame_info: dict) -> Tuple[List[str], List[str], numpy.ndarray]:
+    """
+    Build the features for a change.
+
+    :param base_data_frame: The DataFrame generated by ::preprocess_into_pandas_data_frame for the repository
+    :param git_blame_info: The git blame info for the change as returned by ::get_change_git_blame_info
+    :returns: The names for each row, the names of each column and the feature matrix. Values missing
+     from the base DataFrame are kept as NaN.
+    """
+    names = list(base_data_frame.index.values)
+    row_for_name = {name: row for row, name in enumerate(names)}
+    # Only names in the base DataFrame are used to de-duplicate by index format. Users added from
+    #  the git blame info are found by their exact name.
+    index_form_to_data_frame_username = {common.convert_name_to_index_format(name): name for name in names}
+    # The git blame percentage for each cell, with later values for the same cell replacing earlier values.
+    git_blame_values = {}
+    for column, (git_blame_type, column_suffix) in enumerate(itertools.product(
+            ["authors", "committers"], [time_period.value for time_period in common.TimePeriods])):
+        for email, percentage in git_blame_info[git_blame_type][_time_period_to_key[column_suffix]].items():
+            if email in git_blame_info["names"] and len(git_blame_info["names"][email]):
+                # De-duplicate by using index format to find similar usernames that
+                #  are almost certainly the same person.
+                data_frame_name = next((
+                    index_form_to_data_frame_username[name_index_form] for name_index_form in
+                    map(common.convert_name_to_index_format, git_blame_info["names"][email])
+                    if name_index_form in index_form_to_data_frame_username
+                ), False)
+                if not data_frame_name:
+                    # If the data frame doesn't have any of the names, then use the first name
+                    data_frame_name = git_blame_info["names"][email][0]
+            else:
+                # Shouldn't occur, but use email if no name was given for the commit.
+                data_frame_name = email
+            if data_frame_name not in row_for_name:
+                row_for_name[data_frame_name] = len(names)
+                names.append(data_frame_name)
+            git_blame_values[(row_for_name[data_frame_name], column)] = percentage
+    # Allocate the matrix once now the number of rows is known.
+    number_of_base_rows, number_of_base_columns = base_data_frame.shape
+    features = numpy.zeros((len(names), number_of_base_columns + len(git_blame_columns)), dtype=numpy.float64)
+    features[:number_of_base_rows, :number_of_base_columns] = base_data_frame.to_numpy(dtype=numpy.float64, na_value=numpy.nan)
+    if git_blame_values:
+        cells = numpy.array(list(git_blame_values.keys()))
+        features[cells[:, 0], number_of_base_columns + cells[:, 1]] = list(git_blame_values.values())
+    return names, list(base_data_frame.columns) + git_blame_columns, features
+
+def build_vote_labels(names: List[str], votes: List[dict]) -> Tuple[List[str], numpy.ndarray, numpy.ndarray]:
+    """
+    Build whether each user actually voted on and approved the change.
+
+    Votes are matched to a row by the index format of the 'name', 'display_name' or 'username' of
+    the voter. The vote is then recorded under the 'name' of the voter, which adds a row for that
+    name if it doesn't exist.
+
+    :param names: The names for each row as returned by ::build_change_specific_features
+    :param votes: The code review votes on the change
+    :returns: The names of the rows added for voters, and whether the user for each row (including
+     the added rows) actually voted and actually approved.
+    """
+    row_for_name = {name: row for row, name in enumerate(names)}
+    index_names_to_name = {common.convert_name_to_index_format(name): name for name in names}
+    added_names = []
+    voted_rows = set()
+    approved_rows = set()
+    def get_row(name: str) -> int:
+        if name not in row_for_name:
+            row_for_name[name] = len(names) + len(added_names)
+            added_names.append(name)
+        return row_for_name[name]
+    for vote in votes:
+        found = any(
+            key in vote and common.convert_name_to_index_format(vote[key]) in index_names_to_name
+            for key in ['name', 'display_name', 'username']
+        )
+        row = get_row(vote['name'])
+        if not found:
+            # No matching name found. Add the name under the key 'name'. If a row was already
+            #  added for this exact name by an earlier vote, it is reset as if it was added again.
+            index_names_to_name[common.convert_name_to_index_format(vote['name'])] = vote['name']
+            voted_rows.discard(row)
+            approved_rows.discard(row)
+        voted_rows.add(row)
+        if vote['value'] == 2:
+            # Was an approval vote
+            approved_rows.add(row)
+    voted = numpy.zeros(len(names) + len(added_names), dtype=bool)
+    voted[list(voted_rows)] = True
+    approved = numpy.zeros(len(names) + len(added_names), dtype=bool)
+    approved[list(approved_rows)] = True
+    return added_names, voted, approved
+
+def build_change_specific_data_frame(base_data_frame: pandas.DataFrame, git_blame_info: dict) -> pandas.DataFrame:
+    """
+    Build the DataFrame of features for a change. See ::build_change_specific_features.
+    """
+    names, columns, features = build_change_specific_features(base_data_frame, git_blame_info)
+    return pandas.DataFrame(features, index=pandas.Index(names, dtype=base_data_frame.index.dtype), columns=columns)
+
+def build_training_data_frame(base_data_frame: pandas.DataFrame, git_blame_info: dict, votes: List[dict]) -> pandas.DataFrame:
+    """
+    Build the DataFrame of features for a change along with the "Actually voted" and "Actually approved"
+    columns used as the targets when training and testing.
+    """
+    names, columns, features = build_change_specific_features(base_data_frame, git_blame_info)
+    added_names, voted, approved = build_vote_labels(names, votes)
+    if added_names:
+        features = numpy.concatenate([features, numpy.zeros((len(added_names), features.shape[1]))])
+    data_frame = pandas.DataFrame(features, index=pandas.Index(names + added_names, dtype=base_data_frame.index.dtype), columns=columns)
+    data_frame["Actually voted"] = voted
+    data_frame["Actually approved"] = approved
+    return data_frame
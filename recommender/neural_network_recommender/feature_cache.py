@@ -0,0 +1,126 @@
+"""
+A persistent cache of the features and target values for the changes in the training and testing
+data set, so that the models can be retrained (for example with different hyperparameters)
+without running git blame and building the DataFrames for every change again.
+
+The features for each change are stored in a compressed NumPy file keyed by the repository, the
+change ID and the current revision of the change. Each file also records the data signature and
+time period the features were built from, so features built from old vote, comment or members
+data sets are rebuilt.
+
+The cache is filled by featurise.py, or by the training script when run with --use-feature-cache.
+"""
+import os
+from typing import List, Optional, Tuple
+
+import numpy
+import pandas
+
+import common
+from recommender import get_data_signature
+from recommender.neural_network_recommender import MLPClassifierImplementationBase
+from recommender.neural_network_recommender.feature_builder import build_training_data_frame
+
+feature_cache_path = common.path_relative_to_root("data_collection/raw_data/feature_cache/")
+
+class ChangeFeatures:
+    """
+    The input features for a change along with whether each user actually voted on and approved the change.
+    """
+    def __init__(self, features: numpy.ndarray, columns: List[str], users: List[str], approved: numpy.ndarray, voted: numpy.ndarray):
+        self.features = features
+        """The features with one row for each user. Missing values are replaced with zeros."""
+        self.columns = columns
+        """The names of the columns in the features"""
+        self.users = users
+        """The name of the user for each row"""
+        self.approved = approved
+        """Whether the user for each row actually approved the change"""
+        self.voted = voted
+        """Whether the user for each row actually voted on the change"""
+
+    @classmethod
+    def from_data_frame(cls, data_frame: pandas.DataFrame) -> "ChangeFeatures":
+        """
+        Create from a DataFrame generated by ::build_training_data_frame, which has the
+        "Actually voted" and "Actually approved" columns last.
+        """
+        # Replace NaN values with zeros.
+        features = data_frame.iloc[:, :-2].fillna(0).to_numpy(dtype=numpy.float32)
+        return cls(
+            features, list(data_frame.columns[:-2]), list(data_frame.index),
+            data_frame.loc[:, "Actually approved"].to_numpy(dtype=bool), data_frame.loc[:, "Actually voted"].to_numpy(dtype=bool)
+        )
+
+def get_change_features_path(repository: str, change_info: dict) -> Optional[str]:
+    """
+    Get the path to the cached features for the change.
+
+    :returns: The path, or None if the change info has no current revision to key the cache with.
+    """
+    if not change_info.get('current_revision'):
+        return None
+    change_id = change_info.get('id', change_info.get('change_id'))
+    return os.path.join(
+        feature_cache_path, common.get_sanitised_filename(repository),
+        common.get_sanitised_filename(change_id) + "-" + change_info['current_revision'] + ".npz"
+    )
+
+def save_change_features(path: str, change_features: ChangeFeatures, data_signature: Tuple[int, ...], time_period: str) -> None:
+    """
+    Save the features for a change to the cache.
+
+    :param path: The path returned by ::get_change_features_path
+    :param change_features: The features to save
+    :param data_signature: The data signature the features were built from
+    :param time_period: The time period of the base DataFrame the features were built from
+    """
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    # Write to a temporary file first so that other processes never read a partially written file.
+    with open(path + '.tmp', 'wb') as file:
+        numpy.savez_compressed(
+            file, features=change_features.features, columns=numpy.array(change_features.columns, dtype=str),
+            users=numpy.array(change_features.users, dtype=str), approved=change_features.approved,
+            voted=change_features.voted, data_signature=numpy.array(data_signature, dtype=numpy.int64),
+            time_period=numpy.array(time_period)
+        )
+    os.replace(path + '.tmp', path)
+
+def load_change_features(path: str, data_signature: Tuple[int, ...], time_period: str) -> Optional[ChangeFeatures]:
+    """
+    Load the features for a change from the cache.
+
+    :returns: The features, or None if they are not cached or were built from different data.
+    """
+    if not os.path.exists(path):
+        return None
+    with numpy.load(path) as arrays:
+        if tuple(arrays['data_signature']) != tuple(data_signature) or str(arrays['time_period']) != time_period:
+            return None
+        return ChangeFeatures(
+            arrays['features'], arrays['columns'].tolist(), arrays['users'].tolist(), arrays['approved'], arrays['voted']
+        )
+
+def get_change_features(repository: str, change_info: dict, time_period: str, rebuild: bool = False) -> ChangeFeatures:
+    """
+    Get the features for a change from the cache, building and caching them if they are not cached.
+
+    :param repository: The repository the change is on
+    :param change_info: The change information dictionary associated with the change
+    :param time_period: The time period used for the base DataFrame of the repository
+    :param rebuild: Build the features even if they are cached
+    """
+    data_signature = get_data_signature()
+    path = get_change_features_path(repository, change_info)
+    if path is not None and not rebuild:
+        change_features = load_change_features(path, data_signature, time_period)
+        if change_features is not None:
+            return change_features
+    base_data_frame_for_repo = MLPClassifierImplementationBase.preprocess_into_pandas_data_frame(repository)[time_period]
+    change_features = ChangeFeatures.from_data_frame(build_training_data_frame(
+        base_data_frame_for_repo, MLPClassifierImplementationBase.get_change_git_blame_info(repository, change_info),
+        change_info['code_review_votes']
+    ))
+    if path is not None:
+        save_change_features(path, change_features, data_signature, time_period)
+    return change_features
@@ -0,0 +1,232 @@
+"""
+Stores the input features and target values for many changes in contiguous NumPy arrays,
+instead of keeping a separate pandas DataFrame for each change.
+
+The rows for every change are stored one after another in a single float32 matrix. The
+row at which each change starts is kept in an offsets array, so the rows for a change are
+a view of the matrix that doesn't need to be copied. The names of the columns and users are
+kept once in a FeatureVocabulary that can be shared between stores, with each row storing
+the ID of its user instead of the name.
+
+DataFrames (for example to pass to the scalers and models so that they keep the feature names)
+are only created for a change when needed using ::FeatureStore.get_data_frame, which wraps the
+view without copying the values.
+"""
+import logging
+from typing import List, Optional, Iterable, Iterator
+
+import numpy
+import pandas
+
+class FeatureVocabulary:
+    """
+    The names of the feature columns and the users, shared between the FeatureStore objects
+    that hold features for the same models.
+    """
+    def __init__(self, columns: Optional[List[str]] = None):
+        self.columns = list(columns) if columns is not None else None
+        """The names of the feature columns in the order they are stored. Set by the first features added if None."""
+        self.users = []
+        """The names of the users. The ID for a user is the index in this list."""
+        self._user_ids = {}
+        """The names of the users mapped to their ID."""
+
+    def get_user_ids(self, users: Iterable[str]) -> numpy.ndarray:
+        """
+        Get the IDs for the users, adding any users not already in the vocabulary.
+        """
+        user_ids = []
+        for user in users:
+            if user not in self._user_ids:
+                self._user_ids[user] = len(self.users)
+                self.users.append(user)
+            user_ids.append(self._user_ids[user])
+        return numpy.array(user_ids, dtype=numpy.int32)
+
+    def get_column_indexer(self, columns: List[str]) -> Optional[numpy.ndarray]:
+        """
+        Get where each vocabulary column is in the provided columns.
+
+        :param columns: The columns of the features being added
+        :returns: None if the columns are the same as the vocabulary columns. Otherwise, an
+         array with the position in the provided columns for each vocabulary column, with -1
+         for vocabulary columns that are not in the provided columns.
+        """
+        if self.columns is None:
+            self.columns = list(columns)
+        if list(columns) == self.columns:
+            return None
+        unknown_columns = set(columns).difference(self.columns)
+        if unknown_columns:
+            logging.warning("Dropping columns not in the feature vocabulary: " + str(sorted(unknown_columns)))
+        return pandas.Index(columns).get_indexer(self.columns)
+
+class FeatureStore:
+    """
+    The input features for many changes stored in one contiguous float32 matrix,
+    along with the named target values for each row.
+    """
+    def __init__(self, label_names: Iterable[str] = ("approved", "voted"), vocabulary: Optional[FeatureVocabulary] = None,
+                 initial_capacity: int = 1024):
+        """
+        :param label_names: The names of the target values stored for each row
+        :param vocabulary: The vocabulary to use. If None a new vocabulary is used by this store.
+        :param initial_capacity: The number of rows to allocate space for when the first features are added
+        """
+        self.vocabulary = vocabulary if vocabulary is not None else FeatureVocabulary()
+        """The names of the columns and users for this store."""
+        self.label_names = list(label_names)
+        """The names of the target values stored for each row."""
+        self._initial_capacity = max(1, initial_capacity)
+        self._matrix = None
+        """The buffer holding the features. Only the first ::number_of_rows rows are used."""
+        self._user_ids = numpy.empty(0, dtype=numpy.int32)
+        self._labels = {label_name: numpy.empty(0, dtype=bool) for label_name in self.label_names}
+        self._offsets = [0]
+        """The row each change starts at, followed by the number of rows used."""
+
+    def __len__(self) -> int:
+        """The number of changes in the store."""
+        return len(self._offsets) - 1
+
+    @property
+    def number_of_rows(self) -> int:
+        return self._offsets[-1]
+
+    @property
+    def features(self) -> numpy.ndarray:
+        """The features for all the changes. Modifying this view modifies the store."""
+        if self._matrix is None:
+            return numpy.empty((0, len(self.vocabulary.columns or [])), dtype=numpy.float32)
+        return self._matrix[:self.number_of_rows]
+
+    @property
+    def offsets(self) -> numpy.ndarray:
+        """The row each change starts at, followed by the total number of rows."""
+        return numpy.array(self._offsets, dtype=numpy.int64)
+
+    @property
+    def user_ids(self) -> numpy.ndarray:
+        """The ID of the user for each row, or -1 if the row has no user."""
+        return self._user_ids[:self.number_of_rows]
+
+    def labels(self, label_name: str) -> numpy.ndarray:
+        """The target values with the given name for all the changes."""
+        return self._labels[label_name][:self.number_of_rows]
+
+    def add(self, features: numpy.ndarray, columns: List[str], users: Optional[Iterable[str]] = None,
+            change_lengths: Optional[Iterable[int]] = None, **labels) -> int:
+        """
+        Add the features and target values for a change, or for several changes at once if the
+        number of rows for each change is given.
+
+        :param features: The features for the change with one row for each user
+        :param columns: The names of the columns in the features
+        :param users: The name of the user for each row. None if the rows are not for a user
+         (such as under-sampled rows)
+        :param change_lengths: The number of rows for each change if the features are for more than one change
+        :param labels: The target values for each row for each of the ::label_names
+        :returns: The index of the (last) change in this store.
+        """
+        features = numpy.asarray(features)
+        indexer = self.vocabulary.get_column_indexer(columns)
+        if indexer is not None:
+            # Put the columns in the vocabulary order, with zeros for columns that are missing.
+            aligned_features = numpy.zeros((features.shape[0], len(indexer)), dtype=numpy.float32)
+            aligned_features[:, indexer != -1] = features[:, indexer[indexer != -1]]
+            features = aligned_features
+        start = self.number_of_rows
+        end = start + features.shape[0]
+        self._reserve(end)
+        self._matrix[start:end] = features
+        self._user_ids[start:end] = self.vocabulary.get_user_ids(users) if users is not None else -1
+        for label_name in self.label_names:
+            self._labels[label_name][start:end] = labels[label_name]
+        if change_lengths is None:
+            self._offsets.append(end)
+        else:
+            offsets = start + numpy.cumsum(list(change_lengths), dtype=numpy.int64)
+            if not len(offsets) or offsets[-1] != end:
+                raise ValueError("The number of rows for each change must add up to the number of rows in the features.")
+            self._offsets.extend(offsets.tolist())
+        return len(self) - 1
+
+    def add_data_frame(self, data_frame: pandas.DataFrame, **labels) -> int:
+        """
+        Add the features for a change from a DataFrame with the users as the index.
+        See ::add for the other parameters.
+        """
+        return self.add(data_frame.to_numpy(dtype=numpy.float32), list(data_frame.columns), data_frame.index, **labels)
+
+    def get_features(self, change: int) -> numpy.ndarray:
+        """
+        Get the features for the change as a view of the store.
+        """
+        return self._matrix[self._offsets[change]:self._offsets[change + 1]]
+
+    def get_labels(self, label_name: str, change: int) -> numpy.ndarray:
+        """
+        Get the target values with the given name for the change as a view of the store.
+        """
+        return self._labels[label_name][self._offsets[change]:self._offsets[change + 1]]
+
+    def get_users(self, change: int) -> List[Optional[str]]:
+        """
+        Get the names of the users for each row of the change.
+        """
+        return [
+            self.vocabulary.users[user_id] if user_id != -1 else None
+            for user_id in self._user_ids[self._offsets[change]:self._offsets[change + 1]]
+        ]
+
+    def get_data_frame(self, change: int) -> pandas.DataFrame:
+        """
+        Get the features for the change as a DataFrame that wraps the view of the store
+        with the vocabulary columns. The index is the users if the rows have users.
+        """
+        user_ids = self._user_ids[self._offsets[change]:self._offsets[change + 1]]
+        index = None
+        if len(user_ids) and (user_ids != -1).all():
+            index = pandas.Index([self.vocabulary.users[user_id] for user_id in user_ids], dtype=object)
+        return pandas.DataFrame(self.get_features(change), index=index, columns=self.vocabulary.columns, copy=False)
+
+    def iter_chunks(self, rows_per_chunk: int) -> Iterator[numpy.ndarray]:
+        """
+        Iterate over the features for all the changes in views of at most the given number of rows.
+        Modifying the views modifies the store.
+        """
+        features = self.features
+        for start in range(0, len(features), max(1, rows_per_chunk)):
+            yield features[start:start + rows_per_chunk]
+
+    def trim(self) -> None:
+        """
+        Release the space allocated for rows that have not been used.
+        """
+        if self._matrix is not None and len(self._matrix) > self.number_of_rows:
+            self._matrix = self._matrix[:self.number_of_rows].copy()
+            self._user_ids = self._user_ids[:self.number_of_rows].copy()
+            self._labels = {label_name: labels[:self.number_of_rows].copy() for label_name, labels in self._labels.items()}
+
+    def _reserve(self, number_of_rows: int) -> None:
+        """
+        Make sure the buffers have space for the given number of rows. The capacity is
+        doubled when it runs out, so that adding a change is amortised constant time.
+        """
+        if self._matrix is None:
+            capacity = max(self._initial_capacity, number_of_rows)
+            self._matrix = numpy.empty((capacity, len(self.vocabulary.columns)), dtype=numpy.float32)
+        elif number_of_rows > len(self._matrix):
+            capacity = max(len(self._matrix) * 2, number_of_rows)
+            matrix = numpy.empty((capacity, self._matrix.shape[1]), dtype=numpy.float32)
+            matrix[:self.number_of_rows] = self._matrix[:self.number_of_rows]
+            self._matrix = matrix
+        else:
+            return
+        user_ids = numpy.full(capacity, -1, dtype=numpy.int32)
+        user_ids[:self.number_of_rows] = self._user_ids[:self.number_of_rows]
+        self._user_ids = user_ids
+        for label_name, labels in self._labels.items():
+            new_labels = numpy.zeros(capacity, dtype=bool)
+            new_labels[:self.number_of_rows] = labels[:self.number_of_rows]
+            self._labels[label_name] = new_labels
@@ -0,0 +1,71 @@
+"""
+Builds the features for every change in the training and testing data set and stores them in
+the feature cache (see feature_cache.py). The training script can then be run with
+--use-feature-cache to load the features instead of running git blame and building the
+DataFrames for every change on every run.
+
+Changes that are already in the cache are skipped, so the script can be re-run to resume
+after being stopped.
+"""
+import argparse
+import json
+import logging
+import time
+
+import common
+from common import get_test_data_for_repo
+from recommender.neural_network_recommender import MLPClassifierImplementationBase
+from recommender.neural_network_recommender.feature_cache import get_change_features
+
+def featurise_repository(repository: str, rebuild: bool = False) -> tuple[int, int]:
+    """
+    Build and cache the features for every change in the training and testing data set for the repository.
+
+    :param repository: The repository to featurise
+    :param rebuild: Rebuild the features for changes that are already cached
+    :returns: The number of changes featurised and the number of changes that failed.
+    """
+    test_data = get_test_data_for_repo(repository)
+    if test_data is None:
+        return 0, 0
+    time_period, test_data = test_data
+    number_featurised = 0
+    number_failed = 0
+    for status, sub_test_data in test_data.items():
+        for change_id, change_info in sub_test_data.items():
+            change_info["id"] = change_id
+            try:
+                get_change_features(repository, change_info, time_period, rebuild)
+                number_featurised += 1
+            except BaseException as e:
+                if isinstance(e, KeyboardInterrupt):
+                    raise e
+                logging.error("Unable to featurise " + change_id + " on " + repository, exc_info=e)
+                number_failed += 1
+    return number_featurised, number_failed
+
+if __name__ == "__main__":
+    logging.basicConfig(
+        filename=common.path_relative_to_root("logs/featurise.log.txt"),
+        level=logging.INFO
+    )
+    argument_parser = argparse.ArgumentParser(
+        description="Builds and caches the features for the changes in the training and testing data set")
+    argument_parser.add_argument('repositories', nargs='*', help="The repositories to featurise. None for all repositories.")
+    argument_parser.add_argument('--rebuild', action='store_true', help="Rebuild the features for changes that are already cached")
+    argument_parser.add_argument('--blame-workers', type=int, default=1, help="The number of files in a change to run git blame on at the same time.")
+    command_line_arguments = argument_parser.parse_args()
+    MLPClassifierImplementationBase.git_blame_workers = max(1, command_line_arguments.blame_workers)
+    MLPClassifierImplementationBase.use_base_data_frame_snapshots = True
+    repositories = command_line_arguments.repositories
+    if not repositories:
+        repositories = list(json.load(open(
+            common.path_relative_to_root("data_collection/raw_data/members_of_mediawiki_repos.json")
+        ))['groups_for_repository'].keys())
+    start_time = time.time()
+    for number_processed, repository in enumerate(repositories, start=1):
+        number_featurised, number_failed = featurise_repository(repository, command_line_arguments.rebuild)
+        print(
+            "Featurised", number_featurised, "changes on", repository, "with", number_failed, "failures.",
+            "Processed", number_processed, "out of", len(repositories), "repos. Elapsed: %ds" % (time.time() - start_time)
+        )
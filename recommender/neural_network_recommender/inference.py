@@ -0,0 +1,237 @@
+"""
+A lightweight inference path for the trained models that only uses NumPy.
+
+Each trained model and its associated scaler are exported to an inference bundle, which is
+an .npz file holding the scaler mean and scale along with the weights and biases of each
+layer of the MLP classifier. Loading a bundle doesn't unpickle the sklearn objects, so
+sklearn doesn't need to be imported to make recommendations.
+
+The forward pass performs the same operations as sklearn (scale, then for each layer
+multiply by the weights, add the biases and apply the activation function), so the
+predictions are the same as calling predict on the sklearn model. When the approved and
+voted models have the same shape, both are evaluated together using batched matrix
+multiplications.
+
+The bundles are saved uncompressed, so the weights can be memory-mapped instead of read into memory.
+"""
+import os
+import struct
+import zipfile
+from typing import List, Optional, Sequence, TYPE_CHECKING
+
+import numpy
+
+if TYPE_CHECKING:
+    from sklearn.neural_network import MLPClassifier
+    from sklearn.preprocessing import StandardScaler
+
+def _logistic(x: numpy.ndarray) -> numpy.ndarray:
+    with numpy.errstate(over='ignore'):
+        return numpy.divide(1, numpy.add(1, numpy.exp(numpy.negative(x, out=x), out=x), out=x), out=x)
+
+_activation_functions = {
+    'identity': lambda x: x,
+    'relu': lambda x: numpy.maximum(x, 0, out=x),
+    'tanh': lambda x: numpy.tanh(x, out=x),
+    'logistic': _logistic,
+}
+"""The activation functions supported by MLPClassifier. Each modifies the array in place."""
+
+def _memory_map_arrays(path: str, names: Sequence[str]) -> dict[str, numpy.ndarray]:
+    """
+    Memory-map the arrays with the given names from an uncompressed .npz file.
+    """
+    arrays = {}
+    with zipfile.ZipFile(path) as archive, open(path, 'rb') as file:
+        for name in names:
+            info = archive.getinfo(name + '.npy')
+            if info.compress_type != zipfile.ZIP_STORED:
+                raise ValueError("Only arrays in an uncompressed .npz file can be memory-mapped.")
+            # The data for the member starts after the local file header, which has a fixed size of 30
+            #  bytes followed by the file name and extra field.
+            file.seek(info.header_offset)
+            file_name_length, extra_field_length = struct.unpack('<HH', file.read(30)[26:30])
+            file.seek(info.header_offset + 30 + file_name_length + extra_field_length)
+            version = numpy.lib.format.read_magic(file)
+            if version == (1, 0):
+                shape, fortran_order, dtype = numpy.lib.format.read_array_header_1_0(file)
+            else:
+                shape, fortran_order, dtype = numpy.lib.format.read_array_header_2_0(file)
+            arrays[name] = numpy.memmap(
+                path, dtype=dtype, mode='r', offset=file.tell(), shape=shape, order='F' if fortran_order else 'C'
+            )
+    return arrays
+
+class InferenceBundle:
+    """
+    The arrays needed to make predictions using a trained model and its associated scaler.
+    """
+    def __init__(self, mean: numpy.ndarray, scale: numpy.ndarray, coefs: List[numpy.ndarray], intercepts: List[numpy.ndarray],
+                 activation: str, classes: numpy.ndarray, feature_names: Optional[List[str]] = None):
+        self.mean = mean
+        """The mean subtracted from each feature by the scaler"""
+        self.scale = scale
+        """The amount each feature is divided by after the mean is subtracted"""
+        self.coefs = coefs
+        """The weights for each layer of the model"""
+        self.intercepts = intercepts
+        """The biases for each layer of the model"""
+        if activation not in _activation_functions:
+            raise ValueError("Unsupported activation function " + activation)
+        self.activation = activation
+        """The activation function used by the hidden layers. The output layer uses the logistic function."""
+        self.classes = classes
+        """The class for a negative and a positive prediction"""
+        self.feature_names = feature_names
+        """The names of the features the model was trained on, if known."""
+
+    @classmethod
+    def from_model(cls, model: "MLPClassifier", scaler: "StandardScaler") -> "InferenceBundle":
+        """
+        Create the inference bundle for a trained binary MLPClassifier and its associated StandardScaler.
+
+        :raises NotFittedError: If the model or scaler has not been trained
+        :raises ValueError: If the model is not a binary classifier
+        """
+        if not hasattr(model, 'coefs_') or not hasattr(scaler, 'n_features_in_'):
+            from sklearn.exceptions import NotFittedError
+            raise NotFittedError("The model or scaler has not been trained.")
+        if model.out_activation_ != 'logistic' or len(model.classes_) != 2:
+            raise ValueError("Only binary classifiers can be exported to an inference bundle.")
+        number_of_features = scaler.n_features_in_
+        feature_names = getattr(scaler, 'feature_names_in_', getattr(model, 'feature_names_in_', None))
+        return cls(
+            scaler.mean_ if scaler.mean_ is not None else numpy.zeros(number_of_features),
+            scaler.scale_ if scaler.scale_ is not None else numpy.ones(number_of_features),
+            list(model.coefs_), list(model.intercepts_), model.activation, numpy.asarray(model.classes_),
+            list(feature_names) if feature_names is not None else None
+        )
+
+    def save(self, path: str) -> None:
+        """
+        Save the inference bundle to the given path.
+        """
+        arrays = {
+            'mean': self.mean, 'scale': self.scale, 'activation': numpy.array(self.activation), 'classes': self.classes,
+            'number_of_layers': numpy.array(len(self.coefs))
+        }
+        if self.feature_names is not None:
+            arrays['feature_names'] = numpy.array(self.feature_names, dtype=str)
+        for layer, (coefs, intercepts) in enumerate(zip(self.coefs, self.intercepts)):
+            arrays['coefs_' + str(layer)] = coefs
+            arrays['intercepts_' + str(layer)] = intercepts
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Write to a temporary file first so that other processes never read a partially written bundle.
+        with open(path + '.tmp', 'wb') as file:
+            numpy.savez(file, **arrays)
+        os.replace(path + '.tmp', path)
+
+    @classmethod
+    def load(cls, path: str, memory_map: bool = False) -> "InferenceBundle":
+        """
+        Load the inference bundle saved at the given path.
+
+        :param path: The path to the bundle
+        :param memory_map: Memory-map the weights and biases instead of reading them into memory
+        """
+        with numpy.load(path) as arrays:
+            number_of_layers = int(arrays['number_of_layers'])
+            layer_names = [
+                prefix + str(layer) for prefix in ['coefs_', 'intercepts_'] for layer in range(number_of_layers)
+            ]
+            if memory_map:
+                layers = _memory_map_arrays(path, layer_names)
+            else:
+                layers = {name: arrays[name] for name in layer_names}
+            return cls(
+                arrays['mean'], arrays['scale'],
+                [layers['coefs_' + str(layer)] for layer in range(number_of_layers)],
+                [layers['intercepts_' + str(layer)] for layer in range(number_of_layers)],
+                str(arrays['activation']), arrays['classes'],
+                arrays['feature_names'].tolist() if 'feature_names' in arrays else None
+            )
+
+    def check_feature_names(self, feature_names: Optional[Sequence[str]]) -> None:
+        """
+        :raises ValueError: If the feature names are not the ones the model was trained on.
+        """
+        if feature_names is not None and self.feature_names is not None and list(feature_names) != self.feature_names:
+            raise ValueError("The feature names should match those that were passed during fit.")
+
+    def predict(self, X: numpy.ndarray, feature_names: Optional[Sequence[str]] = None) -> numpy.ndarray:
+        """
+        Predict the class for each row of the unscaled features.
+
+        :param X: The unscaled features with one row for each user
+        :param feature_names: The names of the columns of X, which are checked against the names the model was trained on
+        """
+        return InferenceEngine([self]).predict(X, feature_names)[0]
+
+class InferenceEngine:
+    """
+    Makes predictions using several inference bundles (the "heads") on the same features.
+    """
+    def __init__(self, bundles: List[InferenceBundle], stack: bool = True):
+        """
+        :param bundles: The inference bundles for each head
+        :param stack: Evaluate the heads together when they have the same shape. This copies the weights
+         of each head into one array, so memory-mapped bundles are no longer read from the mapped files.
+        """
+        self.bundles = bundles
+        """The inference bundles for each head"""
+        self._stacked = None
+        """The scalers, weights and biases of all the heads stacked, or None if the heads can't be evaluated together."""
+        shapes = {(tuple(coefs.shape for coefs in bundle.coefs), bundle.activation, bundle.coefs[0].dtype) for bundle in bundles}
+        if stack and len(bundles) > 1 and len(shapes) == 1:
+            self._stacked = (
+                numpy.stack([bundle.mean for bundle in bundles])[:, numpy.newaxis, :],
+                numpy.stack([bundle.scale for bundle in bundles])[:, numpy.newaxis, :],
+                [numpy.stack(coefs) for coefs in zip(*[bundle.coefs for bundle in bundles])],
+                [numpy.stack(intercepts)[:, numpy.newaxis, :] for intercepts in zip(*[bundle.intercepts for bundle in bundles])],
+            )
+
+    def get_memory_used(self) -> int:
+        """
+        Get the number of bytes used by the arrays held in memory. Memory-mapped arrays are not counted.
+        """
+        arrays = [array for bundle in self.bundles for array in [bundle.mean, bundle.scale, *bundle.coefs, *bundle.intercepts]]
+        if self._stacked is not None:
+            means, scales, coefs, intercepts = self._stacked
+            arrays += [means, scales, *coefs, *intercepts]
+        return sum(array.nbytes for array in arrays if not isinstance(array, numpy.memmap))
+
+    def predict(self, X: numpy.ndarray, feature_names: Optional[Sequence[str]] = None) -> List[numpy.ndarray]:
+        """
+        Predict the class for each row of the unscaled features using each head.
+
+        :param X: The unscaled features with one row for each user
+        :param feature_names: The names of the columns of X, which are checked against the names the models were trained on
+        :returns: The predictions for each head, in the order of the bundles.
+        """
+        for bundle in self.bundles:
+            bundle.check_feature_names(feature_names)
+        X = numpy.asarray(X, dtype=numpy.float64)
+        if self._stacked is not None:
+            means, scales, coefs, intercepts = self._stacked
+            activations = self._forward((X[numpy.newaxis, :, :] - means) / scales, coefs, intercepts, self.bundles[0].activation)
+            probabilities = [activations[head, :, 0] for head in range(len(self.bundles))]
+        else:
+            probabilities = [
+                self._forward((X - bundle.mean) / bundle.scale, bundle.coefs, bundle.intercepts, bundle.activation)[:, 0]
+                for bundle in self.bundles
+            ]
+        # As for sklearn, a probability above 0.5 is a positive prediction.
+        return [bundle.classes[(probability > 0.5).astype(int)] for bundle, probability in zip(self.bundles, probabilities)]
+
+    @staticmethod
+    def _forward(activations: numpy.ndarray, coefs: List[numpy.ndarray], intercepts: List[numpy.ndarray], activation: str) -> numpy.ndarray:
+        """
+        Perform the forward pass through the layers, returning the output of the final layer.
+        """
+        hidden_activation = _activation_functions[activation]
+        for layer, (layer_coefs, layer_intercepts) in enumerate(zip(coefs, intercepts)):
+            activations = numpy.matmul(activations, layer_coefs)
+            activations += layer_intercepts
+            if layer != len(coefs) - 1:
+                activations = hidden_activation(activations)
+        return _logistic(activations)
@@ -0,0 +1,264 @@
+"""
+Keeps the trained models, scalers and inference engines loaded between recommendations.
+
+The registry indexes the model and scaler files when it is created, and loads each one the
+first time it is used. Loaded objects are kept in a least recently used cache which is
+bounded by an estimate of the memory they use rather than the number of objects, so serving
+recommendations for many repositories with repo-specific models doesn't repeatedly unpickle
+the same models or hold every model in memory.
+"""
+import logging
+import os
+import pickle
+import threading
+import time
+from collections import Counter, OrderedDict
+from typing import Any, Callable, Iterable, List, Optional, Tuple
+
+import common
+from recommender.neural_network_recommender.inference import InferenceBundle, InferenceEngine
+
+models_path = common.path_relative_to_root("recommender/neural_network_recommender/models/")
+scalers_path = common.path_relative_to_root("recommender/neural_network_recommender/scalers/")
+inference_bundles_path = common.path_relative_to_root("recommender/neural_network_recommender/inference_bundles/")
+
+class ModelRegistry:
+    """
+    Loads the models, scalers and inference engines when first used and caches them within a memory budget.
+    """
+    def __init__(self, memory_budget: int = 512 * 1024 * 1024, memory_map: bool = False,
+                 models_directory: str = models_path, scalers_directory: str = scalers_path,
+                 inference_bundles_directory: str = inference_bundles_path):
+        """
+        :param memory_budget: The number of bytes the cached objects can use before the least recently used are evicted
+        :param memory_map: Memory-map the weights in the inference bundles instead of reading them into memory
+        :param models_directory: The directory the models are pickled to
+        :param scalers_directory: The directory the scalers are pickled to
+        :param inference_bundles_directory: The directory the inference bundles are saved to
+        """
+        self.memory_budget = memory_budget
+        """The number of bytes the cached objects can use before the least recently used are evicted"""
+        self.memory_map = memory_map
+        """Whether to memory-map the weights in the inference bundles"""
+        self.models_directory = models_directory
+        self.scalers_directory = scalers_directory
+        self.inference_bundles_directory = inference_bundles_directory
+        self.hits = 0
+        """The number of times a requested object was already loaded"""
+        self.misses = 0
+        """The number of times a requested object had to be loaded"""
+        self.evictions = 0
+        """The number of objects evicted to keep within the memory budget"""
+        self.prefetches = 0
+        """The number of objects loaded by ::prefetch before they were requested"""
+        self.memory_used = 0
+        """The estimated number of bytes used by the cached objects"""
+        self._cache = OrderedDict()
+        """The cached objects and their estimated size keyed by the type of object and its name, in least recently used order."""
+        self._uses = Counter()
+        """The number of times each object has been requested"""
+        self._lock = threading.Lock()
+        self._loading_locks = {}
+        """Locks held while an object is loaded, so that the same object isn't loaded twice at the same time."""
+        self._indexed_names = set()
+        """The names of the models which have a model file"""
+        self.refresh_index()
+
+    def refresh_index(self) -> None:
+        """
+        Index the names of the models that have been saved.
+        """
+        suffix = "_clf.pickle"
+        names = set()
+        if os.path.isdir(self.models_directory):
+            names = {file[:-len(suffix)] for file in os.listdir(self.models_directory) if file.endswith(suffix)}
+        with self._lock:
+            self._indexed_names = names
+
+    def get_model_names(self) -> List[str]:
+        """
+        Get the names of the models found when the registry was last indexed.
+        """
+        return sorted(self._indexed_names)
+
+    def __contains__(self, name: str) -> bool:
+        return common.sanitize_filename(name) in self._indexed_names
+
+    def get_model_path(self, name: str) -> str:
+        """
+        Gets the filepath for a model with the given name.
+        """
+        return os.path.join(self.models_directory, common.sanitize_filename(name) + "_clf.pickle")
+
+    def get_scaler_path(self, name: str) -> str:
+        """
+        Gets the filepath for a scaler with a given name.
+        """
+        return os.path.join(self.scalers_directory, common.sanitize_filename(name) + "_scaler.pickle")
+
+    def get_inference_bundle_path(self, name: str) -> str:
+        """
+        Gets the filepath for the inference bundle of the model with the given name.
+        """
+        return os.path.join(self.inference_bundles_directory, common.sanitize_filename(name) + ".npz")
+
+    def get_model(self, name: str):
+        """
+        Get the model with the given name, loading it if it isn't cached.
+        """
+        if name not in self:
+            # The model may have been saved since the registry was indexed.
+            self.refresh_index()
+            if name not in self:
+                raise Exception("Model with this name does not exist. Try training it first.")
+        path = self.get_model_path(name)
+        return self._get(('model', name), lambda: (self._load_pickle(path), os.path.getsize(path)))
+
+    def get_scaler(self, name: str):
+        """
+        Get the scaler with the given name, loading it if it isn't cached.
+        """
+        path = self.get_scaler_path(name)
+        if not os.path.exists(path):
+            raise Exception("Scaler with this name does not exist. Try training it first.")
+        return self._get(('scaler', name), lambda: (self._load_pickle(path), os.path.getsize(path)))
+
+    def get_inference_engine(self, names: Tuple[str, ...]) -> InferenceEngine:
+        """
+        Get the inference engine which makes predictions using the models with the given names,
+        loading the inference bundles if the engine isn't cached.
+        """
+        return self._get(('inference engine', tuple(names)), lambda: self._load_inference_engine(names))
+
+    def load_inference_bundle(self, name: str) -> InferenceBundle:
+        """
+        Loads the inference bundle for the model with the given name without caching it. The bundle
+        is exported from the model and associated scaler if it doesn't exist or is older than either of them.
+        """
+        path = self.get_inference_bundle_path(name)
+        if os.path.exists(path) and all(
+            not os.path.exists(source_path) or os.path.getmtime(source_path) <= os.path.getmtime(path)
+            for source_path in [self.get_model_path(name), self.get_scaler_path(name)]
+        ):
+            return InferenceBundle.load(path, self.memory_map)
+        # The pickled model and scaler are only needed to export the bundle, so they aren't cached.
+        for source_path in [self.get_model_path(name), self.get_scaler_path(name)]:
+            if not os.path.exists(source_path):
+                raise Exception("Model or scaler with this name does not exist. Try training it first.")
+        self.export_inference_bundle(
+            name, self._load_pickle(self.get_model_path(name)), self._load_pickle(self.get_scaler_path(name))
+        )
+        return InferenceBundle.load(path, self.memory_map)
+
+    def export_inference_bundle(self, name: str, model, scaler) -> InferenceBundle:
+        """
+        Export the inference bundle for the model and associated scaler with the given name.
+        """
+        inference_bundle = InferenceBundle.from_model(model, scaler)
+        inference_bundle.save(self.get_inference_bundle_path(name))
+        return inference_bundle
+
+    def invalidate(self, name: str) -> None:
+        """
+        Remove the model, scaler and inference engines with the given name from the cache, so that
+        they are loaded again from the files when next used. Called when a model is saved.
+        """
+        with self._lock:
+            self._indexed_names.add(common.sanitize_filename(name))
+            for key in [key for key in self._cache if key[1] == name or (isinstance(key[1], tuple) and name in key[1])]:
+                self.memory_used -= self._cache.pop(key)[1]
+
+    def prefetch(self, names: Iterable[Tuple[str, ...]], background: bool = True) -> Optional[threading.Thread]:
+        """
+        Load the inference engines for the models with the given names before they are requested.
+        Models which can't be loaded are logged and skipped.
+
+        :param names: The names of the models for each inference engine, as passed to ::get_inference_engine
+        :param background: Load the engines in a separate thread
+        :returns: The thread loading the engines if loading in the background
+        """
+        def load_all() -> None:
+            for engine_names in names:
+                key = ('inference engine', tuple(engine_names))
+                if key in self._cache:
+                    continue
+                try:
+                    self._get(key, lambda: self._load_inference_engine(engine_names), prefetch=True)
+                except Exception as e:
+                    logging.warning("Unable to prefetch " + str(engine_names), exc_info=e)
+        if not background:
+            load_all()
+            return None
+        thread = threading.Thread(target=load_all, name="model-registry-prefetch", daemon=True)
+        thread.start()
+        return thread
+
+    def _load_inference_engine(self, names: Tuple[str, ...]) -> Tuple[InferenceEngine, int]:
+        inference_engine = InferenceEngine([self.load_inference_bundle(name) for name in names], stack=not self.memory_map)
+        return inference_engine, inference_engine.get_memory_used()
+
+    def get_most_used(self, number: int) -> List[Tuple[str, ...]]:
+        """
+        Get the names of the models for the inference engines that have been requested the most.
+        These can be passed to ::prefetch after the registry is restarted.
+        """
+        return [key[1] for key, uses in self._uses.most_common() if key[0] == 'inference engine'][:number]
+
+    def get_statistics(self) -> dict:
+        """
+        Get the number of cache hits and misses along with the memory used by the cache.
+        """
+        with self._lock:
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'prefetches': self.prefetches,
+                'cached': len(self._cache),
+                'indexed models': len(self._indexed_names),
+                'memory used': self.memory_used,
+                'memory budget': self.memory_budget,
+            }
+
+    def _get(self, key: Tuple[str, Any], load: Callable[[], Tuple[Any, int]], prefetch: bool = False) -> Any:
+        """
+        Get the cached object for the key, calling load to load it and estimate its size if it isn't cached.
+        """
+        with self._lock:
+            if not prefetch:
+                self._uses[key] += 1
+            if key in self._cache:
+                self._cache.move_to_end(key)
+                self.hits += 1
+                return self._cache[key][0]
+            loading_lock = self._loading_locks.setdefault(key, threading.Lock())
+        with loading_lock:
+            with self._lock:
+                # Another thread may have loaded the object while waiting for the lock.
+                if key in self._cache:
+                    self._cache.move_to_end(key)
+                    self.hits += 1
+                    return self._cache[key][0]
+                if prefetch:
+                    self.prefetches += 1
+                else:
+                    self.misses += 1
+            start_time = time.perf_counter()
+            value, size = load()
+            logging.debug("Loaded " + str(key) + " in %.3fs" % (time.perf_counter() - start_time))
+            with self._lock:
+                self._cache[key] = (value, size)
+                self.memory_used += size
+                self._loading_locks.pop(key, None)
+                # Evict the least recently used objects, but always keep the object just loaded.
+                while self.memory_used > self.memory_budget and len(self._cache) > 1:
+                    evicted_key, (_, evicted_size) = self._cache.popitem(last=False)
+                    self.memory_used -= evicted_size
+                    self.evictions += 1
+                    logging.debug("Evicted " + str(evicted_key))
+            return value
+
+    @staticmethod
+    def _load_pickle(path: str) -> Any:
+        with open(path, 'rb') as file:
+            return pickle.load(file)
@@ -3,23 +3,27 @@ Uses the trained models that are trained by neural_network_recommender_trainer.p
 make recommendations.
 """
 import argparse
+import json
 import logging
 import os
-import pickle
 import random
 import sys
 from enum import Enum
-from functools import lru_cache
-from typing import Tuple, Union, List, Any, Optional
+from typing import Tuple, Union, List, Any, Optional, TYPE_CHECKING
 
 from requests import HTTPError
-from sklearn.exceptions import NotFittedError
-from sklearn.neural_network import MLPClassifier
-from sklearn.preprocessing import StandardScaler
 
 import common
-from recommender import RecommenderImplementation, Recommendations, get_members_of_repo
+from recommender import RecommenderImplementation, Recommendations, get_members_of_repo, get_data_signature
+from recommender.signal_cache import get_signal_cache
 from recommender.neural_network_recommender import MLPClassifierImplementationBase
+from recommender.neural_network_recommender.inference import InferenceBundle, InferenceEngine
+from recommender.neural_network_recommender.model_registry import ModelRegistry
+
+if TYPE_CHECKING:
+    # sklearn is only imported when a model is unpickled, as the inference bundles are used to recommend.
+    from sklearn.neural_network import MLPClassifier
+    from sklearn.preprocessing import StandardScaler
 
 
 class ModelMode(Enum):
@@ -58,6 +62,13 @@ class MLPClassifierImplementation(RecommenderImplementation, MLPClassifierImplem
     The class for the neural network (MLP classifier) implementation. Allows users to get recommendations
     by providing either a Change-ID or change information.
     """
+    use_inference_bundles = True
+    """
+    Make predictions using the inference bundles exported from the models (see inference.py) instead of
+    the sklearn models and scalers.
+    """
+    model_registry = ModelRegistry()
+    """Loads and caches the models, scalers and inference engines used by every instance."""
     def __init__(self, repository: str, model_type: ModelMode, selection_mode: Union[str, SelectionMode], approved_to_voted: int = 3, time_period: Optional[str] = None):
         super().__init__(repository)
         # Get the model name associated with the model_type and repository
@@ -75,20 +86,30 @@ class MLPClassifierImplementation(RecommenderImplementation, MLPClassifierImplem
         if time_period is None or not len(time_period):
             # Get the appropriate time period from the training and testing data set
             #  if it wasn't defined.
-            test_data_for_repo = common.get_test_data_for_repo(repository)
-            if test_data_for_repo is None:
+            test_data_header = common.get_test_data_header_for_repo(repository)
+            if test_data_header is None:
                 # Use all time if there is no test data for the repo
                 time_period = "all time"
             else:
-                time_period = test_data_for_repo[0]
-        self.approved_model = self.load_model(model_name + "_approved")
-        """The model for predicting who would approve a given change"""
-        self.approved_scaler = self.load_scaler(model_name + "_approved")
+                time_period = test_data_header['time_period']
+        self.approved_model = None
+        """The model for predicting who would approve a given change. None if the inference bundles are used."""
+        self.approved_scaler = None
         """The scaler used to scale input data before using it to predict with the approved model"""
-        self.voted_model = self.load_model(model_name + "_voted")
-        """The model for predicting who would vote on a given change"""
-        self.voted_scaler = self.load_scaler(model_name + "_voted")
+        self.voted_model = None
+        """The model for predicting who would vote on a given change. None if the inference bundles are used."""
+        self.voted_scaler = None
         """The scaler used to scale input data before using it to predict with the voted model"""
+        self._inference_engine_names = (model_name + "_approved", model_name + "_voted")
+        """The names of the models used by the inference engine"""
+        self._time_period = time_period
+        """The time period the data is selected from."""
+        if self.use_inference_bundles:
+            # Load the engine now so that missing or untrained models are reported when created.
+            self.model_registry.get_inference_engine(self._inference_engine_names)
+        else:
+            self.approved_model, self.approved_scaler = self.load_model_and_associated_scaler(model_name + "_approved")
+            self.voted_model, self.voted_scaler = self.load_model_and_associated_scaler(model_name + "_voted")
         self.base_data_frame = self.preprocess_into_pandas_data_frame(repository)[time_period]
         """Time period to select the data from."""
         if isinstance(selection_mode, str):
@@ -102,69 +123,141 @@ class MLPClassifierImplementation(RecommenderImplementation, MLPClassifierImplem
         """How many users who are predicted to approve should be recommended to every one user who will only vote but not approve."""
 
     @classmethod
-    @lru_cache(maxsize=5)
-    def load_model(cls, name: str) -> MLPClassifier:
+    def load_model(cls, name: str) -> "MLPClassifier":
         """
         Loads a model with the given name.
         """
-        if not os.path.exists(cls.get_model_path(name)):
-            raise Exception("Model with this name does not exist. Try training it first.")
-        return pickle.load(open(cls.get_model_path(name), 'rb'))
+        return cls.model_registry.get_model(name)
 
-    @staticmethod
-    @lru_cache(maxsize=20)
-    def get_model_path(name) -> str:
+    @classmethod
+    def get_model_path(cls, name: str) -> str:
         """
         Gets the filepath for a model with the given name.
         """
-        return common.path_relative_to_root("recommender/neural_network_recommender/models/" + common.sanitize_filename(name) + "_clf.pickle")
+        return cls.model_registry.get_model_path(name)
 
     @classmethod
-    @lru_cache(maxsize=5)
-    def load_scaler(cls, name: str) -> StandardScaler:
+    def load_scaler(cls, name: str) -> "StandardScaler":
         """
         Loads the scaler with the given name
         """
-        if not os.path.exists(cls.get_scaler_path(name)):
-            raise Exception("Scaler with this name does not exist. Try training it first.")
-        return pickle.load(open(cls.get_scaler_path(name), 'rb'))
+        return cls.model_registry.get_scaler(name)
 
-    @staticmethod
-    @lru_cache(maxsize=20)
-    def get_scaler_path(name: str) -> str:
+    @classmethod
+    def get_scaler_path(cls, name: str) -> str:
         """
         Gets the filepath for a scaler with a given name.
         """
-        return common.path_relative_to_root("recommender/neural_network_recommender/scalers/" + common.sanitize_filename(name) + "_scaler.pickle")
+        return cls.model_registry.get_scaler_path(name)
 
     @classmethod
-    def load_model_and_associated_scaler(cls, name: str) -> Tuple[MLPClassifier, StandardScaler]:
+    def load_model_and_associated_scaler(cls, name: str) -> Tuple["MLPClassifier", "StandardScaler"]:
         """
         Load the model and associated scaler with the given name.
         """
         return cls.load_model(name), cls.load_scaler(name)
 
+    @classmethod
+    def get_inference_bundle_path(cls, name: str) -> str:
+        """
+        Gets the filepath for the inference bundle of the model with the given name.
+        """
+        return cls.model_registry.get_inference_bundle_path(name)
+
+    @classmethod
+    def export_inference_bundle(cls, name: str, model: "MLPClassifier", scaler: "StandardScaler") -> InferenceBundle:
+        """
+        Export the inference bundle for the model and associated scaler with the given name.
+        """
+        return cls.model_registry.export_inference_bundle(name, model, scaler)
+
+    @classmethod
+    def load_inference_bundle(cls, name: str) -> InferenceBundle:
+        """
+        Loads the inference bundle for the model with the given name. The bundle is exported from
+        the model and associated scaler if it doesn't exist or is older than either of them.
+        """
+        return cls.model_registry.load_inference_bundle(name)
+
+    @property
+    def inference_engine(self) -> Optional[InferenceEngine]:
+        """
+        Predicts who would approve and who would vote on a given change. None if the inference bundles are not used.
+        The engine is got from the model registry each time, so that it can be evicted when not used.
+        """
+        if not self.use_inference_bundles:
+            return None
+        return self.model_registry.get_inference_engine(self._inference_engine_names)
+
     def recommend_using_change_info(self, change_info: dict) -> Recommendations:
         # Docstring is specified in RecommenderImplementation::recommend_using_change_info.
         #
+        # Get the users predicted to approve and vote on this change.
+        if self.use_signal_cache:
+            predicted_approvers, predicted_voters = get_signal_cache().get_or_compute_for_change(
+                "neural network predictions", self.repository, change_info, self._get_predictions_version(),
+                lambda: self.predict_approvers_and_voters(change_info)
+            )
+        else:
+            predicted_approvers, predicted_voters = self.predict_approvers_and_voters(change_info)
+        return self._recommend_using_predictions(change_info, predicted_approvers, predicted_voters)
+
+    def _get_predictions_version(self) -> str:
+        """
+        Get the version the predictions are stored in the signal cache with. This changes if
+        the models, the time period or the data sets used to make the predictions change.
+        """
+        model_modification_times = [
+            os.stat(self.get_model_path(name)).st_mtime_ns if os.path.exists(self.get_model_path(name)) else 0
+            for name in self._inference_engine_names
+        ]
+        return json.dumps([self._inference_engine_names, self._time_period, get_data_signature(), model_modification_times])
+
+    def predict_approvers_and_voters(self, change_info: dict) -> Tuple[List[str], List[str]]:
+        """
+        Predict the users who would approve and the users who would vote on the change using the models.
+
+        :param change_info: The change info associated with the change
+        :returns: The names of the users predicted to approve, and the names of the users predicted to vote.
+        """
         # Get the change specific data frame for this change.
         change_specific_data_frame = self.add_change_specific_attributes_to_data_frame(self.repository, change_info, self.base_data_frame)
         # Replace NaNs with 0s
         change_specific_data_frame = change_specific_data_frame.fillna(0)
-        # Copy the data frames so that they can be scaled.
-        voted_X = change_specific_data_frame.copy(deep=True)
-        approved_X = change_specific_data_frame.copy(deep=True)
-        # Scale the voted_X and approved_X data frames.
-        voted_X[voted_X.columns] = self.voted_scaler.transform(voted_X[voted_X.columns])
-        approved_X[approved_X.columns] = self.approved_scaler.transform(approved_X[approved_X.columns])
-        try:
-            # Ask the model for the predictions
-            predicted_approvers = [approved_X.index.values[i] for i, y in enumerate(self.approved_model.predict(approved_X)) if y]
-            predicted_voters = [voted_X.index.values[i] for i, y in enumerate(self.voted_model.predict(voted_X)) if y]
-        except NotFittedError as e:
-            # If the model is not fitted, then the recommendations cannot be produced.
-            logging.error("Model not fitted.", exc_info=e)
-            raise e
+        users = change_specific_data_frame.index.values
+        if self.inference_engine is not None:
+            # Predict using both models in one pass over the unscaled data.
+            approved_predictions, voted_predictions = self.inference_engine.predict(
+                change_specific_data_frame.to_numpy(dtype=float), change_specific_data_frame.columns
+            )
+        else:
+            from sklearn.exceptions import NotFittedError
+            # Copy the data frames so that they can be scaled.
+            voted_X = change_specific_data_frame.copy(deep=True)
+            approved_X = change_specific_data_frame.copy(deep=True)
+            # Scale the voted_X and approved_X data frames.
+            voted_X[voted_X.columns] = self.voted_scaler.transform(voted_X[voted_X.columns])
+            approved_X[approved_X.columns] = self.approved_scaler.transform(approved_X[approved_X.columns])
+            try:
+                # Ask the model for the predictions
+                approved_predictions = self.approved_model.predict(approved_X)
+                voted_predictions = self.voted_model.predict(voted_X)
+            except NotFittedError as e:
+                # If the model is not fitted, then the recommendations cannot be produced.
+                logging.error("Model not fitted.", exc_info=e)
+                raise e
+        predicted_approvers = [str(users[i]) for i, y in enumerate(approved_predictions) if y]
+        predicted_voters = [str(users[i]) for i, y in enumerate(voted_predictions) if y]
+        return predicted_approvers, predicted_voters
+
+    def _recommend_using_predictions(self, change_info: dict, predicted_approvers: List[str], predicted_voters: List[str]) -> Recommendations:
+        """
+        Make the recommendations for the change from the users predicted to approve and vote on it.
+
+        :param change_info: The change info associated with the change
+        :param predicted_approvers: The names of the users predicted to approve the change
+        :param predicted_voters: The names of the users predicted to vote on the change
+        """
         # Get the predicted voters who are also not predicted to have approved.
         predicted_voters_but_not_approvers = list(set(predicted_voters).difference(predicted_approvers))
         # Get the owner of the change (if noted in the change_info) and exclude this user
@@ -223,7 +316,7 @@ class MLPClassifierImplementation(RecommenderImplementation, MLPClassifierImplem
         for user in predicted_voters_but_not_approvers:
             recommendations.get_reviewer_by_name_or_create_new(user)
         # Mark the users who can approve changes in this repository
-        users_with_rights_to_merge = get_members_of_repo(self.repository)
+        users_with_rights_to_merge = self.get_repository_signals("members", self.repository, lambda: get_members_of_repo(self.repository))
         logging.debug("users with right to merge: " + str(users_with_rights_to_merge))
         for user in users_with_rights_to_merge:
             reviewer = None
@@ -294,6 +387,7 @@ if __name__ == '__main__':
     argument_parser.add_argument('--model-type', choices=["repo-specific", "generic", "open", "abandoned", "merged"], default="repo-specific", help="What model to use. The models selectable here have been trained over varying amounts of the testing data.")
     argument_parser.add_argument('--selection-mode', choices=["random", "semi-random", "in-order"], help="How to choose the users classified as predicted to vote or approve the change.", default="in-order", required=False)
     argument_parser.add_argument('--no-of-predicted-approvers-to-one-voter', type=int, help="How many predicted approved should be recommended to one predicted voter. 0 for recommendations prioritise all predicted approvers over voters.", default=3, required=False)
+    argument_parser.add_argument('--blame-workers', type=int, default=1, help="The number of files in a change to run git blame on at the same time.", required=False)
     change_ids_with_repo_and_branch = []
     command_line_arguments = None
     if not len(sys.argv) > 1:
@@ -347,6 +441,7 @@ if __name__ == '__main__':
         model_type = command_line_arguments.model_type
         selection_mode = command_line_arguments.selection_mode
         no_of_predicted_approvers_to_one_voter = command_line_arguments.no_of_predicted_approvers_to_one_voter
+        MLPClassifierImplementation.git_blame_workers = max(1, command_line_arguments.blame_workers)
         if len(repositories) != 1 and len(repositories) != len(change_ids):
             argument_parser.error("If specifying multiple repositories the same number of change IDs must be provided")
         if len(branches) > 1 and len(branches) != len(change_ids):
@@ -369,10 +464,21 @@ if __name__ == '__main__':
                 change_dictionary['branch'] = repositories[index]
             change_ids_with_repo_and_branch.append(change_dictionary)
     logging.info("Recommending with the following inputs: " + str(change_ids_with_repo_and_branch))
-    for change in change_ids_with_repo_and_branch:
-        # For each change, get the recommendations produced by the neural network implementation.
+    # Get the recommendations produced by the neural network implementation. The changes for each
+    #  repository are recommended together so that the models and data are only loaded once.
+    recommendations_for_changes = [None] * len(change_ids_with_repo_and_branch)
+    for repository in dict.fromkeys(change["repository"] for change in change_ids_with_repo_and_branch):
+        indexes_for_repository = [index for index, change in enumerate(change_ids_with_repo_and_branch) if change["repository"] == repository]
+        recommendations_for_repository = MLPClassifierImplementation(repository, ModelMode(model_type), selection_mode, no_of_predicted_approvers_to_one_voter).recommend_many_change_ids(
+            [change_ids_with_repo_and_branch[index]['change_id'] for index in indexes_for_repository],
+            [change_ids_with_repo_and_branch[index]['branch'] for index in indexes_for_repository]
+        )
+        for index, recommendations in zip(indexes_for_repository, recommendations_for_repository):
+            recommendations_for_changes[index] = recommendations
+    for change, recommended_reviewers in zip(change_ids_with_repo_and_branch, recommendations_for_changes):
         try:
-            recommended_reviewers = MLPClassifierImplementation(change["repository"], ModelMode(model_type), selection_mode, no_of_predicted_approvers_to_one_voter).recommend_using_change_id(change['change_id'], change["branch"])
+            if isinstance(recommended_reviewers, HTTPError):
+                raise recommended_reviewers
             logging.debug("Recommendations: " + str(recommended_reviewers))
             top_10_recommendations = recommended_reviewers.top_n(10)
             for recommendation in top_10_recommendations:
@@ -6,12 +6,13 @@ import json
 import logging
 import os
 import pickle
-from typing import List, Union, Tuple
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from typing import List, Union, Tuple, Optional
 
 import numpy
 import pandas
 from imblearn.under_sampling import ClusterCentroids
-from pandas import Series
 from sklearn.exceptions import NotFittedError
 from sklearn.preprocessing import StandardScaler
 from sklearn.metrics import accuracy_score, confusion_matrix
@@ -20,11 +21,60 @@ from sklearn.neural_network import MLPClassifier
 import common
 from common import get_test_data_for_repo
 from recommender.neural_network_recommender import MLPClassifierImplementationBase
+from recommender.neural_network_recommender.feature_builder import build_training_data_frame
+from recommender.neural_network_recommender.feature_cache import ChangeFeatures, get_change_features
+from recommender.neural_network_recommender.feature_store import FeatureStore, FeatureVocabulary
 from recommender.neural_network_recommender.neural_network_recommender import ModelMode, MLPClassifierImplementation
+from recommender.neural_network_recommender.under_sampling import UnderSamplingMode, under_sample
 import warnings
+from enum import Enum
 
 warnings.filterwarnings("ignore")
 
+class TrainingMode(Enum):
+    """
+    The different ways the models can be trained on the under-sampled training data.
+    """
+    PER_CHANGE = "per-change"
+    """Call fit on the model once for each change. Each call restarts the optimisation on the data for that change."""
+    MINI_BATCH = "mini-batch"
+    """
+    Shuffle the under-sampled data for all the changes into mini-batches and call partial_fit on
+    each batch for several epochs, stopping early when the accuracy on a held-out split stops improving.
+    """
+
+class TrainingOptions:
+    """
+    The options used when scaling the data for and training each model. These are kept separate
+    from the trainer so that they can be sent to the processes that train the models.
+    """
+    def __init__(self, training_mode: TrainingMode = TrainingMode.PER_CHANGE, batch_size: int = 256, epochs: int = 10,
+                 early_stopping_patience: int = 3, validation_fraction: float = 0.1, scaling_chunk_size: int = 65536,
+                 under_sampling_mode: UnderSamplingMode = UnderSamplingMode.DEFAULT, random_state: Optional[int] = None):
+        self.training_mode = training_mode
+        """How the models are trained on the under-sampled training data"""
+        self.batch_size = max(1, batch_size)
+        """The number of rows in each mini-batch when using TrainingMode.MINI_BATCH"""
+        self.epochs = max(1, epochs)
+        """The maximum number of passes over the training data when using TrainingMode.MINI_BATCH"""
+        self.early_stopping_patience = early_stopping_patience
+        """
+        The number of epochs without an improvement in accuracy on the held-out split before training
+        stops when using TrainingMode.MINI_BATCH. 0 to disable early stopping.
+        """
+        self.validation_fraction = validation_fraction
+        """The fraction of the under-sampled training data held-out for early stopping when using TrainingMode.MINI_BATCH"""
+        self.scaling_chunk_size = max(1, scaling_chunk_size)
+        """The number of rows that are fitted on or scaled by the scalers at once."""
+        self.under_sampling_mode = under_sampling_mode
+        """How the training data is under-sampled before training"""
+        self.random_state = random_state
+        """
+        The seed used to initialise the weights of the models and shuffle the rows when using
+        TrainingMode.MINI_BATCH, and to under-sample using UnderSamplingMode.RANDOM. None to use
+        the global random state.
+        """
+
 # This code is taken from https://stackoverflow.com/a/57915246
 #  which was written by Jie Yang
 class NpEncoder(json.JSONEncoder):
@@ -44,7 +94,7 @@ class ModelScalerAndData:
     This keeps the associated data together in a format that can be easily inspected
     and also allows type hints to specify this class as the type for an argument.
     """
-    def __init__(self, model: MLPClassifier, scaler: StandardScaler, name):
+    def __init__(self, model: MLPClassifier, scaler: StandardScaler, name, vocabulary: FeatureVocabulary = None):
         self.name = name
         """Name of the model"""
         self.model = model
@@ -55,28 +105,18 @@ class ModelScalerAndData:
         """Under-sampler for predicting voters"""
         self.approved_under_sampler = ClusterCentroids()
         """Under-sampler for predicting approvers"""
-        self.X_train = []
-        """The input features used for training"""
-        self.under_sampled_approved_X_train = []
-        """Under sampled X_train for predicting approvers"""
-        self.under_sampled_approved_train = []
-        """Under sampled actual classification values associated with under_sampled_approved_X_train."""
-        self.under_sampled_voted_X_train = []
-        """Under sampled X_train for predicting voters"""
-        self.under_sampled_voted_train = []
-        """Under sampled actual classification values associated with under_sampled_voted_X_train."""
-        self.approved_train = []
-        """Whether a user approved the change. Associated value is in X_train at the same index."""
-        self.voted_train = []
-        """Whether a user voted on the change. Associated value is in X_train at the same index."""
-        self.X_test = []
-        """Input features used for testing"""
-        self.X_test_scaled = []
-        """The scaled version of X_test"""
-        self.approved_test = []
-        """Actual approver classifications associated with X_test"""
-        self.voted_test = []
-        """Actual voter classifications associated with X_test"""
+        if vocabulary is None:
+            vocabulary = FeatureVocabulary()
+        self.training_data = FeatureStore(["approved", "voted"], vocabulary)
+        """The input features used for training along with whether each user approved and voted on the change."""
+        self.under_sampled_approved_training_data = FeatureStore(["approved"], vocabulary)
+        """Under sampled training data for predicting approvers"""
+        self.under_sampled_voted_training_data = FeatureStore(["voted"], vocabulary)
+        """Under sampled training data for predicting voters"""
+        self.testing_data = FeatureStore(["approved", "voted"], vocabulary)
+        """Input features used for testing along with the actual approver and voter classifications."""
+        self.scaled_testing_changes = []
+        """The indexes of the changes in testing_data that were successfully scaled."""
         self.scaler_has_been_trained = True
         """Whether the scaler has been trained."""
 
@@ -85,18 +125,47 @@ class MLPClassifierTrainer(MLPClassifierImplementationBase):
     This class is used to train the models and scalers that produce recommendations
     for the neural network implementation.
     """
-    def __init__(self, modes: List[ModelMode], train_existing_models: bool = True):
+    def __init__(self, modes: List[ModelMode], train_existing_models: bool = True,
+                 training_mode: TrainingMode = TrainingMode.PER_CHANGE, batch_size: int = 256, epochs: int = 10,
+                 early_stopping_patience: int = 3, validation_fraction: float = 0.1, workers: int = 1,
+                 under_sampling_mode: UnderSamplingMode = UnderSamplingMode.DEFAULT, random_state: Optional[int] = None):
+        """
+        :param modes: The model types to train
+        :param train_existing_models: Whether to train the existing models instead of creating new ones
+        :param training_mode: How the models are trained on the under-sampled training data
+        :param batch_size: The number of rows in each mini-batch when using TrainingMode.MINI_BATCH
+        :param epochs: The maximum number of passes over the training data when using TrainingMode.MINI_BATCH
+        :param early_stopping_patience: The number of epochs without an improvement in accuracy on the held-out
+         split before training stops when using TrainingMode.MINI_BATCH. 0 to disable early stopping.
+        :param validation_fraction: The fraction of the under-sampled training data held-out for early stopping
+         when using TrainingMode.MINI_BATCH.
+        :param workers: The number of processes used to scale the data for and train the models at the same time.
+         If 1 the models are trained one after another in this process.
+        :param under_sampling_mode: How the training data is under-sampled before training
+        :param random_state: The seed used to initialise the weights and shuffle the rows when using
+         TrainingMode.MINI_BATCH and to under-sample using UnderSamplingMode.RANDOM, so that training
+         can be reproduced. None to use the global random state.
+        """
         self._modes = modes
         self._train_existing_models = train_existing_models
+        self._training_options = TrainingOptions(
+            training_mode, batch_size, epochs, early_stopping_patience, validation_fraction,
+            under_sampling_mode=under_sampling_mode, random_state=random_state
+        )
+        self._workers = max(1, workers)
         self._data_scaled = False
+        self._failed_models = set()
+        """The names of the models that could not be trained. These are not tested or saved."""
+        # The column and user names are shared by the data for all the models.
+        self._vocabulary = FeatureVocabulary()
         if train_existing_models:
             # "generic" models
-            self._generic_approved = self.load_model("generic_approved")
-            self._generic_voted = self.load_model("generic_voted")
+            self._generic_approved = self.load_model("generic_approved", self._vocabulary)
+            self._generic_voted = self.load_model("generic_voted", self._vocabulary)
         else:
             # "generic" models
-            self._generic_approved = self._create_new_model("generic_approved")
-            self._generic_voted = self._create_new_model("generic_voted")
+            self._generic_approved = self._create_new_model("generic_approved", vocabulary=self._vocabulary)
+            self._generic_voted = self._create_new_model("generic_voted", vocabulary=self._vocabulary)
         # "repo-specific" models - loaded on the fly
         self._repo_specific_approved = {}
         self._repo_specific_voted = {}
@@ -125,26 +194,29 @@ class MLPClassifierTrainer(MLPClassifierImplementationBase):
                 return self._merged_approved, self._merged_voted
 
     @staticmethod
-    def _create_new_model(name: str, max_iter=300) -> ModelScalerAndData:
+    def _create_new_model(name: str, max_iter=300, vocabulary: FeatureVocabulary = None) -> ModelScalerAndData:
         """
         Create a ModelScalerAndData object for a new model
         """
-        new_model = ModelScalerAndData(MLPClassifier(max_iter=max_iter, hidden_layer_sizes=(500,250,100,50)), StandardScaler(), name)
+        new_model = ModelScalerAndData(MLPClassifier(max_iter=max_iter, hidden_layer_sizes=(500,250,100,50)), StandardScaler(), name, vocabulary)
         new_model.scaler_has_been_trained = False
         return new_model
 
-    def _add_data(self, repository: str, status: str, data_frame: pandas.DataFrame, training_data: bool) -> None:
+    def _add_data(self, repository: str, status: str, data_frame: Union[pandas.DataFrame, ChangeFeatures], training_data: bool) -> None:
         """
         Add training or testing data for use in training or testing.
 
         :param repository: The repository this training/testing data is on
         :param status: The status of the change associated with this training/testing data item
-        :param data_frame: The DataFrame for this training/testing data item
+        :param data_frame: The DataFrame or cached features for this training/testing data item
         :param training_data: True if this is training data. False is this is testing data.
         """
         if self._data_scaled:
             # If the data has been scaled, then more data cannot be added.
             raise Exception("Data has already been used to train or test. Cannot add more data as existing data has been scaled. Save the model and load it again to add more testing/training data.")
+        if isinstance(data_frame, pandas.DataFrame):
+            # Convert once instead of for each model the data is added to.
+            data_frame = ChangeFeatures.from_data_frame(data_frame)
         # Convert status to ModelMode enum
         status = ModelMode(status)
         # Load models (if needed) and then add the data to each of the ModelScalerAndData objects that exist.
@@ -174,102 +246,272 @@ class MLPClassifierTrainer(MLPClassifierImplementationBase):
                     self._add_data_to_model_dictionary(self._abandoned_voted, repository, "_%s_voted" % ModelMode.ABANDONED.value,
                                                        data_frame, training_data)
 
-    def add_training_data(self, repository: str, status: str, data_frame: pandas.DataFrame) -> "MLPClassifierTrainer":
+    def add_training_data(self, repository: str, status: str, data_frame: Union[pandas.DataFrame, ChangeFeatures]) -> "MLPClassifierTrainer":
         """
         Add training data to be used when training the models.
 
         :param repository: The repository this change is on
         :param status: The status of the change
-        :param data_frame: The DataFrame for this change
+        :param data_frame: The DataFrame or the cached features for this change
         """
         self._add_data(repository, status, data_frame, True)
         return self
 
-    def add_testing_data(self, repository: str, status: str, data_frame: pandas.DataFrame) -> "MLPClassifierTrainer":
+    def add_testing_data(self, repository: str, status: str, data_frame: Union[pandas.DataFrame, ChangeFeatures]) -> "MLPClassifierTrainer":
         """
         Add testing data to be used when testing the models.
 
         :param repository: The repository this change is on
         :param status: The status of the change
-        :param data_frame: The DataFrame for this change
+        :param data_frame: The DataFrame or the cached features for this change
         """
         self._add_data(repository, status, data_frame, False)
         return self
 
     @staticmethod
-    def load_model(name: str) -> ModelScalerAndData:
+    def load_model(name: str, vocabulary: FeatureVocabulary = None) -> ModelScalerAndData:
         """
         Load the model with the given name from the disk.
         """
         loaded_model = MLPClassifierImplementation.load_model_and_associated_scaler(name)
-        return ModelScalerAndData(loaded_model[0], loaded_model[1], name)
+        return ModelScalerAndData(loaded_model[0], loaded_model[1], name, vocabulary)
 
     def _add_data_to_model_dictionary(self, dictionary: dict, repository: str, appendix: str,
-                                      data_frame: pandas.DataFrame, training_data: bool) -> None:
+                                      change_features: ChangeFeatures, training_data: bool) -> None:
         # Load the model if it is not already loaded
         if repository and repository not in dictionary.keys():
             if self._train_existing_models and os.path.exists(MLPClassifierImplementation.get_model_path(common.get_sanitised_filename(repository) + appendix)):
-                dictionary[repository] = self.load_model(common.get_sanitised_filename(repository) + appendix)
+                dictionary[repository] = self.load_model(common.get_sanitised_filename(repository) + appendix, self._vocabulary)
             else:
-                dictionary[repository] = self._create_new_model(common.get_sanitised_filename(repository) + appendix)
+                dictionary[repository] = self._create_new_model(
+                    common.get_sanitised_filename(repository) + appendix, vocabulary=self._vocabulary
+                )
         # Add the model
-        self._add_data_to_model(dictionary[repository], data_frame, training_data)
+        self._add_data_to_model(dictionary[repository], change_features, training_data)
 
-    def _add_data_to_model(self, model: ModelScalerAndData, data_frame: pandas.DataFrame,
+    def _add_data_to_model(self, model: ModelScalerAndData, change_features: ChangeFeatures,
                            training_data: bool) -> None:
-        # Replace NaN values with zeros.
-        data_frame = data_frame.fillna(0)
-        # If this is training data add to the training data list, otherwise add to the testing data list.
-        if training_data:
-            model.X_train.append(data_frame.iloc[:, :-2])
-            model.approved_train.append(data_frame.loc[:, "Actually approved"].replace({0: False}))
-            model.voted_train.append(data_frame.loc[:, "Actually voted"].replace({0: False}))
-        else:
-            model.X_test.append(data_frame.iloc[:, :-2])
-            model.approved_test.append(data_frame.loc[:, "Actually approved"].replace({0: False}))
-            model.voted_test.append(data_frame.loc[:, "Actually voted"].replace({0: False}))
+        # If this is training data add to the training data store, otherwise add to the testing data store.
+        store = model.training_data if training_data else model.testing_data
+        store.add(
+            change_features.features, change_features.columns, change_features.users,
+            approved=change_features.approved, voted=change_features.voted
+        )
 
-    def perform_training(self) -> "MLPClassifierTrainer":
+    def get_models_to_train(self) -> List[Tuple[ModelMode, str, str, ModelScalerAndData]]:
         """
-        Train the models using the data added for the training via ::add_training_data.
+        Get the mode, target ("approved" or "voted"), repository and the model for each model being trained.
+        The repository is 'generic' for the generic models.
         """
-        # First scale the data
-        self._scale_data()
-        logging.debug("Training")
+        models_to_train = []
         for mode in ModelMode:
             if mode not in self._modes:
                 continue
             for models, target in zip(self._get_model_dictionaries(mode), ["approved", "voted"]):
-                # For each model that is being trained, use the changes added to be used for training
-                #  to train the models.
                 if isinstance(models, ModelScalerAndData):
                     # Handle "generic" with only one model for approved and one for voted.
                     models = {'generic': models}
-                for model in models.values():
-                    # Train the model using the training data
-                    if target == "approved":
-                        for X, approved in zip(model.under_sampled_approved_X_train,
-                                               model.under_sampled_approved_train):
-                            try:
-                                model.model.fit(X, approved)
-                            except ValueError as e:
-                                logging.error("Training failed for one data point for model " + model.name, exc_info=e)
-                    else:
-                        for X, voted in zip(model.under_sampled_voted_X_train,
-                                               model.under_sampled_voted_train):
-                            try:
-                                model.model.fit(X, voted)
-                            except ValueError as e:
-                                logging.error("Training failed for one data point for model " + model.name, exc_info=e)
+                for repository, model in models.items():
+                    models_to_train.append((mode, target, repository, model))
+        return models_to_train
+
+    def _set_model(self, mode: ModelMode, target: str, repository: str, model: ModelScalerAndData) -> None:
+        """
+        Replace the model for the given mode, target and repository.
+        """
+        if mode == ModelMode.GENERIC:
+            setattr(self, "_generic_" + target, model)
+        else:
+            approved_models, voted_models = self._get_model_dictionaries(mode)
+            (approved_models if target == "approved" else voted_models)[repository] = model
+
+    def perform_training(self, save_models: bool = False) -> "MLPClassifierTrainer":
+        """
+        Train the models using the data added for the training via ::add_training_data.
+
+        If the trainer was created with more than one worker, the data for each model is scaled
+        and under-sampled and the model trained in a separate process.
+
+        :param save_models: Save each model as soon as it has been trained instead of waiting for ::save_models
+        """
+        models_to_train = self.get_models_to_train()
+        if self._workers > 1 and len(models_to_train) > 1 and not self._data_scaled:
+            self._perform_training_using_processes(models_to_train, save_models)
+            return self
+        # First scale the data
+        self.scale_data()
+        logging.debug("Training")
+        start_time = time.time()
+        for number_trained, (mode, target, repository, model) in enumerate(models_to_train, start=1):
+            # For each model that is being trained, use the changes added to be used for training
+            #  to train the models.
+            if model.name not in self._failed_models:
+                try:
+                    self._train_model(model, target, self._training_options)
+                except Exception as e:
+                    logging.error("Training failed for model " + model.name, exc_info=e)
+                    self._failed_models.add(model.name)
+                else:
+                    if save_models:
+                        self._save_model(model)
+            self._print_training_progress(model.name, number_trained, len(models_to_train), start_time)
         return self
 
+    def _perform_training_using_processes(self, models_to_train: List[Tuple[ModelMode, str, str, ModelScalerAndData]],
+                                          save_models: bool) -> None:
+        """
+        Scale the data for, under-sample the data for and train each model in a pool of processes.
+        The trained models replace the models in this trainer as each one finishes. A model that
+        fails to train doesn't stop the other models from being trained.
+        """
+        self._data_scaled = True
+        logging.debug("Training using " + str(self._workers) + " processes")
+        start_time = time.time()
+        with ProcessPoolExecutor(max_workers=self._workers) as executor:
+            futures = {
+                executor.submit(MLPClassifierTrainer._scale_and_train_model, model, target, self._training_options):
+                    (mode, target, repository, model)
+                for mode, target, repository, model in models_to_train
+            }
+            # The executor keeps each model it was given until the model has been trained, so the
+            #  training data in this process is only freed as each model finishes. This is done by
+            #  replacing the model with the trained copy, or clearing the data if training failed.
+            for number_trained, future in enumerate(as_completed(futures), start=1):
+                mode, target, repository, model = futures[future]
+                name = model.name
+                try:
+                    trained_model = future.result()
+                except Exception as e:
+                    logging.error("Training failed for model " + name, exc_info=e)
+                    self._failed_models.add(name)
+                    MLPClassifierTrainer._clear_training_data(model)
+                else:
+                    self._set_model(mode, target, repository, trained_model)
+                    if save_models:
+                        self._save_model(trained_model)
+                self._print_training_progress(name, number_trained, len(futures), start_time)
+
+    @staticmethod
+    def _print_training_progress(name: str, number_trained: int, number_of_models: int, start_time: float) -> None:
+        elapsed = time.time() - start_time
+        eta = elapsed / number_trained * (number_of_models - number_trained)
+        print(
+            "Trained", number_trained, "models out of", str(number_of_models) + ".",
+            "Finished", name + ".", "Elapsed: %ds, ETA: %ds" % (elapsed, eta)
+        )
+        logging.info("Trained " + str(number_trained) + " models. Finished " + name)
+
+    @staticmethod
+    def _scale_and_train_model(model: ModelScalerAndData, target: str, options: TrainingOptions) -> ModelScalerAndData:
+        """
+        Scale the data for, under-sample the data for and train the model. This is run in the
+        processes used by ::perform_training.
+
+        :returns: The trained model with the scaled testing data. The training data is not
+         returned as it is no longer needed.
+        """
+        MLPClassifierTrainer._scale_model_data(model, target, options)
+        MLPClassifierTrainer._train_model(model, target, options)
+        MLPClassifierTrainer._clear_training_data(model)
+        return model
+
+    @staticmethod
+    def _clear_training_data(model: ModelScalerAndData) -> None:
+        """
+        Replace the training data and under-sampled training data for the model with empty stores.
+        """
+        model.training_data = FeatureStore(model.training_data.label_names, model.training_data.vocabulary)
+        model.under_sampled_approved_training_data = FeatureStore(["approved"], model.training_data.vocabulary)
+        model.under_sampled_voted_training_data = FeatureStore(["voted"], model.training_data.vocabulary)
+
+    @staticmethod
+    def _train_model(model: ModelScalerAndData, target: str, options: TrainingOptions) -> None:
+        """
+        Train the model using the under-sampled training data for the target.
+
+        :raises ValueError: If training using mini-batches fails. The model may be partially trained.
+        """
+        if target == "approved":
+            under_sampled_training_data = model.under_sampled_approved_training_data
+        else:
+            under_sampled_training_data = model.under_sampled_voted_training_data
+        if options.training_mode == TrainingMode.MINI_BATCH:
+            MLPClassifierTrainer._train_model_using_mini_batches(model, under_sampled_training_data, target, options)
+            return
+        for change in range(len(under_sampled_training_data)):
+            try:
+                model.model.fit(
+                    under_sampled_training_data.get_data_frame(change),
+                    under_sampled_training_data.get_labels(target, change)
+                )
+            except ValueError as e:
+                logging.error("Training failed for one data point for model " + model.name, exc_info=e)
+
+    @staticmethod
+    def _train_model_using_mini_batches(model: ModelScalerAndData, training_data: FeatureStore, target: str,
+                                        options: TrainingOptions) -> None:
+        """
+        Train the model by calling partial_fit on shuffled mini-batches of the rows for all the changes in
+        the training data. After each epoch the accuracy is checked on a held-out split of the rows. Training
+        stops once the accuracy has not improved for the early stopping patience, and the weights from the
+        epoch with the best accuracy are kept.
+
+        :param model: The model to train
+        :param training_data: The under-sampled training data for the target
+        :param target: The name of the target values in the training data ("approved" or "voted")
+        :param options: The batch size, number of epochs, early stopping options and random state
+        """
+        X = training_data.features
+        y = training_data.labels(target)
+        if not len(X):
+            return
+        columns = training_data.vocabulary.columns
+        random = numpy.random.default_rng(options.random_state)
+        if options.random_state is not None:
+            model.model.set_params(random_state=options.random_state)
+        rows = random.permutation(len(X))
+        number_of_validation_rows = int(len(rows) * options.validation_fraction) if options.early_stopping_patience > 0 else 0
+        validation_rows, training_rows = rows[:number_of_validation_rows], rows[number_of_validation_rows:]
+        if not len(training_rows):
+            validation_rows, training_rows = validation_rows[:0], rows
+        if len(validation_rows):
+            X_validation = pandas.DataFrame(X[validation_rows], columns=columns, copy=False)
+            y_validation = y[validation_rows]
+        best_score = None
+        best_weights = None
+        epochs_without_improvement = 0
+        for epoch in range(options.epochs):
+            random.shuffle(training_rows)
+            for start in range(0, len(training_rows), options.batch_size):
+                batch = training_rows[start:start + options.batch_size]
+                model.model.partial_fit(
+                    pandas.DataFrame(X[batch], columns=columns, copy=False), y[batch], classes=numpy.array([False, True])
+                )
+            if not len(validation_rows):
+                continue
+            score = model.model.score(X_validation, y_validation)
+            logging.debug("Epoch " + str(epoch + 1) + " for " + model.name + " has held-out accuracy " + str(score))
+            if best_score is None or score > best_score:
+                best_score = score
+                best_weights = (
+                    [coefs.copy() for coefs in model.model.coefs_], [intercepts.copy() for intercepts in model.model.intercepts_]
+                )
+                epochs_without_improvement = 0
+            else:
+                epochs_without_improvement += 1
+                if epochs_without_improvement >= options.early_stopping_patience:
+                    break
+        if best_weights is not None:
+            # Keep the weights from the epoch with the best held-out accuracy.
+            model.model.coefs_, model.model.intercepts_ = best_weights
+
     def perform_testing(self) -> dict:
         """
         Perform testing on the trained models using the data added for the testing via ::add_testing_data.
         """
         # First check that the data is scaled (if the models are loaded instead of being trained, then the data
         #  could be unscaled).
-        self._scale_data()
+        self.scale_data()
         logging.debug("Testing")
         return_dict = {}
         for mode in ModelMode:
@@ -283,6 +525,9 @@ class MLPClassifierTrainer(MLPClassifierImplementationBase):
                     # Handle "generic" with only one model for approved and one for voted.
                     models = {'generic': models}
                 for model in models.values():
+                    if model.name in self._failed_models:
+                        logging.info("Not testing " + model.name + " as it could not be trained.")
+                        continue
                     return_dict[model.name] = {
                         'accuracy_score': {
                             'average': None,
@@ -329,23 +574,24 @@ class MLPClassifierTrainer(MLPClassifierImplementationBase):
                     }
                     try:
                         # Train the model using the training data
-                        def test_model(model: ModelScalerAndData, targets: list):
+                        def test_model(model: ModelScalerAndData, target: str):
                             """
                             Helper method used to test the model given in the associated
                             ModelScalerAndData object.
                             """
-                            for i, X in enumerate(model.X_test_scaled):
+                            for change in model.scaled_testing_changes:
+                                targets = model.testing_data.get_labels(target, change)
                                 # Average the accuracy score
                                 try:
                                     # Get the prediction for the testing data
-                                    prediction = model.model.predict(X)
+                                    prediction = model.model.predict(model.testing_data.get_data_frame(change))
                                     # Compare this prediction against the actual values to get the accuracy
                                     #  score and confusion matrix. Add these to a list of all the scores which
                                     #  will be grouped into min, max, average, 10th percentile and 90th percentile
                                     #  later on in min_max_average_and_percentiles() below.
-                                    accuracy_score_for_change = accuracy_score(targets[i], prediction)
+                                    accuracy_score_for_change = accuracy_score(targets, prediction)
                                     return_dict[model.name]['accuracy_score']['_all_scores'].append(accuracy_score_for_change)
-                                    confusion_matrix_for_change = confusion_matrix(targets[i], prediction).ravel()
+                                    confusion_matrix_for_change = confusion_matrix(targets, prediction).ravel()
                                     tn, fp, fn, tp = [0] * 4
                                     match len(confusion_matrix_for_change):
                                         case 1:
@@ -391,70 +637,90 @@ class MLPClassifierTrainer(MLPClassifierImplementationBase):
                             for confusion_matrix_element_dict in return_dict[model.name]['confusion_matrix'].values():
                                 min_max_average_and_percentiles(confusion_matrix_element_dict)
                             logging.debug("Model testing results for " + model.name + ": " + str(return_dict[model.name]))
-                        if target == "approved":
-                            test_model(model, model.approved_test)
-                        else:
-                            test_model(model, model.voted_test)
+                        test_model(model, target)
                     except BaseException as e:
                         # Catch errors in testing so that partial results can be returned.
                         logging.error("Error in testing model " + model.name, exc_info=e)
         return return_dict
 
-    def _scale_data(self) -> None:
+    def scale_data(self) -> None:
         """
-        Scale the training and testing data. Scaling is skipped if this method has
-        already been called, as the data will have been scaled.
+        Scale the training and testing data and under-sample the training data. This is done by
+        ::perform_training and ::perform_testing, so only needs to be called to scale the data before
+        them. Scaling is skipped if this method has already been called, as the data will have been scaled.
         """
         logging.debug("Scaling data")
         if self._data_scaled:
             return
         self._data_scaled = True
-        for mode in ModelMode:
-            if mode not in self._modes:
-                continue
-            for models in self._get_model_dictionaries(mode):
-                # Scale the data for each of the models.
-                if isinstance(models, ModelScalerAndData):
-                    # Handle "generic" with only one model for approved and one for voted.
-                    models = {'generic': models}
-                for model in models.values():
-                    try:
-                        # If not training existing models, train the scaler
-                        if not model.scaler_has_been_trained:
-                            for X in model.X_train:
-                                model.scaler.fit(X)
-                            model.scaler_has_been_trained = True
-                        for X, approved, voted in zip(model.X_train, model.approved_train, model.voted_train):
-                            # Scale the data - In models trained for the report, this try block is commented
-                            #  out to fix an issue as discussed in section 4.2.3.
-                            try:
-                                X[X.columns] = model.scaler.transform(X[X.columns])
-                            except ValueError as e:
-                                logging.error(
-                                    "Transform failed for " + model.name + " on one training data item. This has been skipped.",
-                                    exc_info=e)
-                                continue
-                            # Under-sample the training data to reduce bias towards not recommending
-                            approved: Series
-                            if True in approved.values and False in approved.values:
-                                under_sampled_approved_X, under_sampled_approved = model.approved_under_sampler.fit_resample(X, approved)
-                                model.under_sampled_approved_X_train.append(under_sampled_approved_X)
-                                model.under_sampled_approved_train.append(under_sampled_approved)
-                            if True in voted.values and False in voted.values:
-                                under_sampled_voted_X, under_sampled_voted = model.voted_under_sampler.fit_resample(X, voted)
-                                model.under_sampled_voted_X_train.append(under_sampled_voted_X)
-                                model.under_sampled_voted_train.append(under_sampled_voted)
-                        for X in model.X_test:
-                            # Scale the data - In models trained for the report, the scaling of the data is commented
-                            #  out to fix the issue as discussed in section 4.2.3.
-                            try:
-                                X[X.columns] = model.scaler.transform(X[X.columns])
-                                model.X_test_scaled.append(X)
-                            except ValueError:
-                                logging.error("Transform failed for " + model.name + " on one testing data item. This has been skipped.")
-                                continue
-                    except BaseException as e:
-                        logging.error("Error in scaling data for model " + model.name, exc_info=e)
+        for mode, target, repository, model in self.get_models_to_train():
+            # Scale the data for each of the models.
+            try:
+                self._scale_model_data(model, target, self._training_options)
+            except BaseException as e:
+                logging.error("Error in scaling data for model " + model.name, exc_info=e)
+
+    @staticmethod
+    def _scale_model_data(model: ModelScalerAndData, target: str, options: TrainingOptions) -> None:
+        """
+        Train the scaler for the model if needed, scale the training and testing data for the model
+        and then under-sample the training data for the target the model predicts.
+        """
+        model.training_data.trim()
+        model.testing_data.trim()
+        # If not training existing models, train the scaler
+        if not model.scaler_has_been_trained:
+            MLPClassifierTrainer._fit_scaler(model.scaler, model.training_data, options.scaling_chunk_size)
+            model.scaler_has_been_trained = True
+        # Scale the data in the store - In models trained for the report, this try block is
+        #  commented out to fix an issue as discussed in section 4.2.3.
+        try:
+            MLPClassifierTrainer._transform_in_place(model.scaler, model.training_data, options.scaling_chunk_size)
+        except ValueError as e:
+            logging.error(
+                "Transform failed for " + model.name + " on the training data. This has been skipped.",
+                exc_info=e)
+        else:
+            # Under-sample the training data to reduce bias towards not recommending
+            if target == "approved":
+                under_sample(
+                    model.training_data, target, model.under_sampled_approved_training_data,
+                    options.under_sampling_mode, model.approved_under_sampler, options.random_state
+                )
+            else:
+                under_sample(
+                    model.training_data, target, model.under_sampled_voted_training_data,
+                    options.under_sampling_mode, model.voted_under_sampler, options.random_state
+                )
+        # Scale the data in the store - In models trained for the report, the scaling of the data
+        #  is commented out to fix the issue as discussed in section 4.2.3.
+        try:
+            MLPClassifierTrainer._transform_in_place(model.scaler, model.testing_data, options.scaling_chunk_size)
+            model.scaled_testing_changes = list(range(len(model.testing_data)))
+        except ValueError:
+            logging.error("Transform failed for " + model.name + " on the testing data. This has been skipped.")
+
+    @staticmethod
+    def _fit_scaler(scaler: StandardScaler, training_data: FeatureStore, chunk_size: int) -> None:
+        """
+        Fit the scaler on all the training data in one pass by calling partial_fit on each chunk of the store.
+        The chunks are passed as DataFrames so that the scaler keeps the feature names.
+        """
+        for chunk in training_data.iter_chunks(chunk_size):
+            scaler.partial_fit(pandas.DataFrame(chunk, columns=training_data.vocabulary.columns, copy=False))
+
+    @staticmethod
+    def _transform_in_place(scaler: StandardScaler, data: FeatureStore, chunk_size: int) -> None:
+        """
+        Scale the features in the store in place, one chunk at a time. The chunks are passed as
+        DataFrames, as for ::_fit_scaler, so that the scaler checks the feature names.
+
+        :raises ValueError: If the scaler was fitted on different features.
+        """
+        for chunk in data.iter_chunks(chunk_size):
+            scaled_chunk = scaler.transform(pandas.DataFrame(chunk, columns=data.vocabulary.columns, copy=False), copy=False)
+            if not numpy.shares_memory(scaled_chunk, chunk):
+                chunk[:] = scaled_chunk
 
     def save_models(self) -> None:
         """
@@ -468,13 +734,23 @@ class MLPClassifierTrainer(MLPClassifierImplementationBase):
                     # Handle "generic" model which only has one approved and one voted model
                     models = {'generic': models}
                 for model in models.values():
-                    self._save_model(model)
+                    if model.name not in self._failed_models:
+                        self._save_model(model)
 
     @staticmethod
     def _save_model(model_scaler_and_data: ModelScalerAndData) -> None:
         # Save model and scaler separately
         pickle.dump(model_scaler_and_data.model, open(MLPClassifierImplementation.get_model_path(model_scaler_and_data.name), 'wb'))
         pickle.dump(model_scaler_and_data.scaler, open(MLPClassifierImplementation.get_scaler_path(model_scaler_and_data.name), 'wb'))
+        # Stop using any previously loaded copies of the model.
+        MLPClassifierImplementation.model_registry.invalidate(model_scaler_and_data.name)
+        # Export the inference bundle used to make recommendations without sklearn.
+        try:
+            MLPClassifierImplementation.export_inference_bundle(
+                model_scaler_and_data.name, model_scaler_and_data.model, model_scaler_and_data.scaler
+            )
+        except (NotFittedError, ValueError) as e:
+            logging.error("Unable to export the inference bundle for " + model_scaler_and_data.name, exc_info=e)
 
     def get_training_and_testing_change_specific_data_frame(self, repository: str, change_info: dict,
                                                             base_data_frame_for_repo: pandas.DataFrame) -> pandas.DataFrame:
@@ -487,42 +763,9 @@ class MLPClassifierTrainer(MLPClassifierImplementationBase):
         :param base_data_frame_for_repo: The DataFrame for the repository as generated by
          ::preprocess_into_pandas_data_frame()
         """
-        change_specific_data_frame = self.add_change_specific_attributes_to_data_frame(repository,
-                                                                                  change_info,
-                                                                                  base_data_frame_for_repo)
-        # Store lowercase representation to actual case used for indexing purposes
-        index_names_to_name = {common.convert_name_to_index_format(x): x for x in change_specific_data_frame.index.values}
-        # Add columns for whether the users actually voted or approved in the DataFrame
-        change_specific_data_frame["Actually voted"] = False
-        change_specific_data_frame["Actually approved"] = False
-        # Go through the code review votes in the change
-        for vote in change_info['code_review_votes']:
-            def is_name_in_data_frame(key_for_name_in_vote: str) -> Union[str, bool]:
-                """
-                Helper function that returns a Truthy value if the value for the key specified
-                in the first parameter inside the vote dictionary exists as a name in the DataFrame.
-                Returns False otherwise.
-                """
-                if key_for_name_in_vote in vote:
-                    index_name = common.convert_name_to_index_format(vote[key_for_name_in_vote])
-                    if index_name in index_names_to_name.keys():
-                        return index_names_to_name[index_name]
-                return False
-            # Try to find associated data_frame row
-            name = is_name_in_data_frame('name')
-            if not name:
-                name = is_name_in_data_frame('display_name')
-                if not name:
-                    name = is_name_in_data_frame('username')
-                    if not name:
-                        # No matching name found in the data frame. Add the name under the key 'name' to the data frame.
-                        change_specific_data_frame.loc[vote['name'], :] = 0
-                        index_names_to_name.update({common.convert_name_to_index_format(vote['name']): vote['name']})
-            change_specific_data_frame.at[vote['name'], "Actually voted"] = True
-            if vote['value'] == 2:
-                # Was an approval vote
-                change_specific_data_frame.at[vote['name'], "Actually approved"] = True
-        return change_specific_data_frame
+        return build_training_data_frame(
+            base_data_frame_for_repo, self.get_change_git_blame_info(repository, change_info), change_info['code_review_votes']
+        )
 
 if __name__ == "__main__":
     # Only allows command line arguments, which are got via the argparse library.
@@ -550,6 +793,36 @@ if __name__ == "__main__":
         '--train-existing-models', action='store_true',
         help="Train the existing models if they exist instead of creating new ones"
     )
+    argument_parser.add_argument(
+        '--training-mode', choices=[mode.value for mode in TrainingMode], default=TrainingMode.PER_CHANGE.value,
+        help="Fit the models on each change separately, or on shuffled mini-batches of all the changes over several epochs"
+    )
+    argument_parser.add_argument('--batch-size', type=int, default=256, help="The number of rows in each mini-batch")
+    argument_parser.add_argument('--epochs', type=int, default=10, help="The maximum number of epochs when training using mini-batches")
+    argument_parser.add_argument(
+        '--early-stopping-patience', type=int, default=3,
+        help="Stop training using mini-batches after this many epochs without an improvement on the held-out split. 0 to disable."
+    )
+    argument_parser.add_argument(
+        '--use-feature-cache', action='store_true',
+        help="Load the features for each change from the feature cache written by featurise.py, adding any that are missing"
+    )
+    argument_parser.add_argument(
+        '--under-sampling', choices=[mode.value for mode in UnderSamplingMode], default=UnderSamplingMode.DEFAULT.value,
+        help="How the training data is under-sampled before training"
+    )
+    argument_parser.add_argument(
+        '--workers', type=int, default=1,
+        help="The number of processes used to train the models at the same time. Each model is trained in one process."
+    )
+    argument_parser.add_argument(
+        '--validation-fraction', type=float, default=0.1,
+        help="The fraction of the training data held-out for early stopping when training using mini-batches"
+    )
+    argument_parser.add_argument(
+        '--seed', type=int, default=None,
+        help="The seed used to initialise the weights and shuffle the rows when training using mini-batches, and to under-sample randomly"
+    )
     command_line_arguments = argument_parser.parse_args()
     repositories = command_line_arguments.repositories
     # Exclude models from training that have been excluded using command line flags.
@@ -567,7 +840,12 @@ if __name__ == "__main__":
     if not models_to_train:
         argument_parser.error("At least one model must not be excluded.")
     # Create the trainer object.
-    MLP_trainer = MLPClassifierTrainer(models_to_train, command_line_arguments.train_existing_models)
+    MLP_trainer = MLPClassifierTrainer(
+        models_to_train, command_line_arguments.train_existing_models, TrainingMode(command_line_arguments.training_mode),
+        command_line_arguments.batch_size, command_line_arguments.epochs, command_line_arguments.early_stopping_patience,
+        command_line_arguments.validation_fraction, command_line_arguments.workers,
+        UnderSamplingMode(command_line_arguments.under_sampling), command_line_arguments.seed
+    )
     repos_and_associated_members = json.load(open(
         common.path_relative_to_root("data_collection/raw_data/members_of_mediawiki_repos.json")
     ))
@@ -585,7 +863,14 @@ if __name__ == "__main__":
             print("Processing", repository)
             time_period = test_data[0]
             test_data = test_data[1]
-            base_data_frame_for_repo = MLP_trainer.preprocess_into_pandas_data_frame(repository)[time_period]
+            if not command_line_arguments.use_feature_cache:
+                base_data_frame_for_repo = MLP_trainer.preprocess_into_pandas_data_frame(repository)[time_period]
+            def get_data_for_change(change_info: dict) -> Union[pandas.DataFrame, ChangeFeatures]:
+                if command_line_arguments.use_feature_cache:
+                    return get_change_features(repository, change_info, time_period)
+                return MLP_trainer.get_training_and_testing_change_specific_data_frame(
+                    repository, change_info, base_data_frame_for_repo
+                )
             for status, sub_test_data in test_data.items():
                 try:
                     # For each status of change in the training/testing data, add these changes as training and testing
@@ -605,20 +890,12 @@ if __name__ == "__main__":
                         # Add the training data
                         print("Collating training data", i+1, "out of", len(train))
                         logging.info("Collating training data " + str(i) + " out of " + str(len(train)))
-                        MLP_trainer.add_training_data(
-                            repository, status, MLP_trainer.get_training_and_testing_change_specific_data_frame(
-                                repository, change_info, base_data_frame_for_repo
-                            )
-                        )
+                        MLP_trainer.add_training_data(repository, status, get_data_for_change(change_info))
                     for i, change_info in enumerate(test):
                         # Add the testing data
                         print("Collating test data", i+1, "out of", len(test))
                         logging.info("Collating test data " + str(i) + " out of " + str(len(train)))
-                        MLP_trainer.add_testing_data(
-                            repository, status, MLP_trainer.get_training_and_testing_change_specific_data_frame(
-                                repository, change_info, base_data_frame_for_repo
-                            )
-                        )
+                        MLP_trainer.add_testing_data(repository, status, get_data_for_change(change_info))
                 except BaseException as e:
                     # If an uncaught exception is thrown which is anything other than a
                     #  KeyboardInterrupt, just skip this particular status of changes for this repository
@@ -638,12 +915,10 @@ if __name__ == "__main__":
             logging.error("Error in processing repository " + repository + " not caught elsewhere.", exc_info=e)
             pass
     print("Training....")
-    # Perform the training.
-    MLP_trainer.perform_training()
+    # Perform the training, saving each model to a pickle file as soon as it has been trained.
+    MLP_trainer.perform_training(save_models=True)
     print("Testing....")
     # Perform the testing
     test_results = MLP_trainer.perform_testing()
     # Save the test results to a JSON file
-    json.dump(test_results, open(common.path_relative_to_root("evaluation/results/neural_network_training_test_results.json"), 'w'), cls=NpEncoder)
-    # Save the models to a pickle file
-    MLP_trainer.save_models()
\ No newline at end of file
+    json.dump(test_results, open(common.path_relative_to_root("evaluation/results/neural_network_training_test_results.json"), 'w'), cls=NpEncoder)
\ No newline at end of file
@@ -0,0 +1,113 @@
+"""
+Under-samples the training data for a model to reduce the bias towards not recommending,
+as most users for a change did not vote on or approve it.
+
+The original implementation fits a ClusterCentroids under-sampler (and so a KMeans model)
+separately for every change. This is often slower than fitting the MLP classifier, so
+faster alternatives that work over the whole FeatureStore at once are also provided.
+"""
+from enum import Enum
+from typing import Optional
+
+import numpy
+from imblearn.under_sampling import ClusterCentroids
+
+from recommender.neural_network_recommender.feature_store import FeatureStore
+
+class UnderSamplingMode(Enum):
+    """
+    The different ways the training data can be under-sampled.
+    """
+    CLUSTER_CENTROIDS = "cluster-centroids"
+    """Replace the majority class of each change with the centroids of a KMeans fit on that change."""
+    CLUSTER_CENTROIDS_PER_MODEL = "cluster-centroids-per-model"
+    """Replace the majority class with the centroids of one KMeans fit over every change for the model."""
+    RANDOM = "random"
+    """
+    Randomly select as many rows of the majority class as there are rows of the minority class
+    within each change. This is stratified by change, so each change keeps its balance of users.
+    """
+    NONE = "none"
+    """Don't under-sample the training data."""
+    DEFAULT = "cluster-centroids"
+
+def under_sample(training_data: FeatureStore, target: str, under_sampled_training_data: FeatureStore,
+                 mode: UnderSamplingMode = UnderSamplingMode.DEFAULT, cluster_centroids: Optional[ClusterCentroids] = None,
+                 random_state: Optional[int] = None) -> None:
+    """
+    Under-sample the training data for the target and add the result to the under-sampled training data.
+
+    Only changes with both users that did and didn't vote (or approve) are used, as under-sampling
+    a change with only one class would leave no rows. The modes which work per change add one
+    change to the under-sampled training data for each change used. The other modes add all
+    the rows as one change.
+
+    :param training_data: The (scaled) training data for the model
+    :param target: The name of the target values to under-sample for ("approved" or "voted")
+    :param under_sampled_training_data: The store the under-sampled rows are added to. It must store the target values
+     for the target.
+    :param mode: How to under-sample the training data
+    :param cluster_centroids: The under-sampler used by the cluster centroids modes. A new one is used if None.
+    :param random_state: The seed used by the random mode
+    """
+    if cluster_centroids is None:
+        cluster_centroids = ClusterCentroids()
+    columns = training_data.vocabulary.columns
+    match mode:
+        case UnderSamplingMode.CLUSTER_CENTROIDS:
+            for change in range(len(training_data)):
+                y = training_data.get_labels(target, change)
+                if y.any() and not y.all():
+                    under_sampled_X, under_sampled_y = cluster_centroids.fit_resample(training_data.get_data_frame(change), y)
+                    under_sampled_training_data.add(under_sampled_X, columns, **{target: under_sampled_y})
+        case UnderSamplingMode.CLUSTER_CENTROIDS_PER_MODEL:
+            rows = _rows_in_changes_with_both_classes(training_data, target)
+            y = training_data.labels(target)[rows]
+            if len(rows):
+                under_sampled_X, under_sampled_y = cluster_centroids.fit_resample(training_data.features[rows], y)
+                under_sampled_training_data.add(under_sampled_X, columns, **{target: under_sampled_y})
+        case UnderSamplingMode.RANDOM:
+            rows, change_lengths = _random_under_sample_rows(training_data, target, numpy.random.default_rng(random_state))
+            if len(rows):
+                under_sampled_training_data.add(
+                    training_data.features[rows], columns, change_lengths=change_lengths,
+                    **{target: training_data.labels(target)[rows]}
+                )
+        case UnderSamplingMode.NONE:
+            rows = _rows_in_changes_with_both_classes(training_data, target)
+            if len(rows):
+                under_sampled_training_data.add(
+                    training_data.features[rows], columns, **{target: training_data.labels(target)[rows]}
+                )
+
+def _get_change_for_each_row(training_data: FeatureStore) -> numpy.ndarray:
+    return numpy.repeat(numpy.arange(len(training_data)), numpy.diff(training_data.offsets))
+
+def _rows_in_changes_with_both_classes(training_data: FeatureStore, target: str) -> numpy.ndarray:
+    """
+    Get the rows of the changes which have both users that did and didn't vote (or approve).
+    """
+    change_for_each_row = _get_change_for_each_row(training_data)
+    positives = numpy.bincount(change_for_each_row, weights=training_data.labels(target), minlength=len(training_data))
+    change_has_both_classes = (positives > 0) & (positives < numpy.diff(training_data.offsets))
+    return numpy.flatnonzero(change_has_both_classes[change_for_each_row])
+
+def _random_under_sample_rows(training_data: FeatureStore, target: str, random: numpy.random.Generator) -> tuple[numpy.ndarray, numpy.ndarray]:
+    """
+    Randomly select the rows to keep for each change so that both classes have the same number of rows.
+
+    :returns: The rows to keep in the order of the changes, and the number of rows kept for each change
+     that has any rows kept.
+    """
+    y = training_data.labels(target)
+    change_for_each_row = _get_change_for_each_row(training_data)
+    positives = numpy.bincount(change_for_each_row, weights=y, minlength=len(training_data)).astype(numpy.int64)
+    rows_to_keep_per_class = numpy.minimum(positives, numpy.diff(training_data.offsets) - positives)
+    # Sort the rows by change, then by class and then randomly, so that the first rows for each
+    #  class of each change are a random sample of that class.
+    order = numpy.lexsort((random.random(len(y)), y, change_for_each_row))
+    group_for_each_row = (change_for_each_row * 2 + y)[order]
+    rank_in_group = numpy.arange(len(order)) - numpy.searchsorted(group_for_each_row, group_for_each_row, side='left')
+    rows = numpy.sort(order[rank_in_group < rows_to_keep_per_class[change_for_each_row[order]]])
+    change_lengths = rows_to_keep_per_class[rows_to_keep_per_class > 0] * 2
+    return rows, change_lengths
@@ -0,0 +1,40 @@
+"""
+Builds the static scores for the rule based implementation's scoring engine (see scoring_engine.py)
+for each repository and stores them on disk. The rule based implementation then only needs to
+score the git blame stats for each change when run with --scoring-engine.
+
+The stored scores are ignored once the reviewer vote, comment or members data sets or the
+weightings change, so this should be re-run after either is updated.
+"""
+import argparse
+import json
+import logging
+import time
+
+import common
+from recommender.rule_based_recommender import RuleBasedImplementation
+
+if __name__ == "__main__":
+    logging.basicConfig(
+        filename=common.path_relative_to_root("logs/precompute_static_scores.log.txt"),
+        level=logging.INFO
+    )
+    argument_parser = argparse.ArgumentParser(
+        description="Builds and stores the static scores used by the rule based implementation's scoring engine")
+    argument_parser.add_argument('repositories', nargs='*', help="The repositories to build the static scores for. None for all repositories.")
+    command_line_arguments = argument_parser.parse_args()
+    repositories = command_line_arguments.repositories
+    if not repositories:
+        repositories = list(json.load(open(
+            common.path_relative_to_root("data_collection/raw_data/members_of_mediawiki_repos.json")
+        ))['groups_for_repository'].keys())
+    start_time = time.time()
+    for number_processed, repository in enumerate(repositories, start=1):
+        try:
+            static_scores = RuleBasedImplementation(repository).precompute_static_scores()
+            print("Stored the static scores for", len(static_scores.identities), "users on", repository + ".", end=" ")
+        except KeyError as e:
+            # The repository is not in the data sets.
+            logging.error("Unable to build the static scores for " + repository, exc_info=e)
+            print("No data for", repository + ".", end=" ")
+        print("Processed", number_processed, "out of", len(repositories), "repos. Elapsed: %ds" % (time.time() - start_time))
@@ -0,0 +1,281 @@
+"""
+A long-running server that makes recommendations using either implementation over a local
+JSON HTTP API. The vote, comment and members data sets, the trained models and the bare
+repositories are loaded once when first used and kept loaded between requests, so each
+request only does the work specific to the change.
+
+The server listens on a TCP port on localhost by default, or on a Unix socket if a path is given.
+
+Endpoints (all POST requests take and return JSON):
+* /rule-based/change-info - {"repository": ..., "change_info": {...}}
+* /rule-based/change-id - {"repository": ..., "change_id": ..., "branch": ...}
+* /neural-network/change-info - as for /rule-based/change-info
+* /neural-network/change-id - as for /rule-based/change-id
+
+The neural network endpoints also accept "model_type", "selection_mode", "approved_to_voted" and
+"time_period". All endpoints accept "top_n" (default 10) and "only_users_that_can_approve" (default False).
+
+A GET request to /health returns {"status": "ok"} once the server is running. A GET request
+to /model-registry returns the cache hits, misses and memory used by the neural network model registry.
+
+The models used most by the neural network implementation are saved when the server stops, and
+are loaded in the background when it next starts.
+"""
+import argparse
+import json
+import logging
+import os
+import socket
+import socketserver
+import threading
+from collections import OrderedDict
+from http.server import BaseHTTPRequestHandler, HTTPServer, ThreadingHTTPServer
+
+from requests import HTTPError
+
+import common
+from data_collection import git_blame
+from recommender import RecommenderImplementation, Recommendations, get_reviewer_data, get_comment_data, \
+    load_members_of_mediawiki_repos
+from recommender.rule_based_recommender import RuleBasedImplementation
+from recommender.neural_network_recommender import MLPClassifierImplementationBase
+from recommender.neural_network_recommender.model_registry import ModelRegistry
+from recommender.neural_network_recommender.neural_network_recommender import MLPClassifierImplementation, \
+    ModelMode, SelectionMode
+
+_implementations = OrderedDict()
+"""
+Implementation instances kept between requests, keyed by the implementation name, repository and options.
+The least recently used instance is removed first.
+"""
+
+_implementations_lock = threading.Lock()
+
+_implementation_locks = {}
+"""A lock for each key in ::_implementations, held while the instance for that key is created."""
+
+max_implementations = 32
+"""The number of implementation instances kept between requests."""
+
+hot_models_path = common.path_relative_to_root("data_collection/raw_data/hot_models.json")
+"""The file the names of the most used models are saved to when the server stops."""
+
+def get_implementation(implementation_name: str, repository: str, options: dict) -> RecommenderImplementation:
+    """
+    Get the implementation instance for the repository with the given options, creating
+    it if no request has used it yet. Creating an instance loads the weightings or the models
+    and base DataFrame, so re-using them avoids doing this for every request.
+
+    :param implementation_name: Either "rule-based" or "neural-network"
+    :param repository: The repository the recommendations are for
+    :param options: The request body, which contains the options for the neural network implementation
+    :raises ValueError: If the implementation name or an option is not valid.
+    """
+    match implementation_name:
+        case "rule-based":
+            key = (implementation_name, repository)
+        case "neural-network":
+            key = (
+                implementation_name, repository, ModelMode(options.get('model_type', 'repo-specific')),
+                SelectionMode(options.get('selection_mode', 'in-order')), int(options.get('approved_to_voted', 3)),
+                options.get('time_period')
+            )
+        case _:
+            raise ValueError("Unknown implementation " + implementation_name)
+    with _implementations_lock:
+        if key in _implementations:
+            _implementations.move_to_end(key)
+            return _implementations[key]
+        key_lock = _implementation_locks.setdefault(key, threading.Lock())
+    # Create the instance without holding the lock for all the instances, so that requests
+    #  for other repositories are not blocked while the weightings or models are loaded.
+    with key_lock:
+        with _implementations_lock:
+            implementation = _implementations.get(key)
+        if implementation is None:
+            logging.info("Creating implementation for " + str(key))
+            if implementation_name == "rule-based":
+                implementation = RuleBasedImplementation(repository)
+            else:
+                implementation = MLPClassifierImplementation(*key[1:])
+            with _implementations_lock:
+                _implementations[key] = implementation
+                while len(_implementations) > max_implementations:
+                    removed_key, _ = _implementations.popitem(last=False)
+                    _implementation_locks.pop(removed_key, None)
+        return implementation
+
+def warm(repositories: list[str]) -> None:
+    """
+    Load the data sets used by both implementations, and create the implementation
+    instances and bare repositories for the provided repositories.
+
+    :param repositories: The repositories to load ahead of the first request
+    """
+    get_reviewer_data()
+    get_comment_data()
+    load_members_of_mediawiki_repos()
+    for repository in repositories:
+        logging.info("Warming " + repository)
+        git_blame.get_bare_repo(repository)
+        get_implementation("rule-based", repository, {})
+        try:
+            get_implementation("neural-network", repository, {})
+        except Exception as e:
+            # The models may not have been trained for this repository.
+            logging.warning("Unable to load the neural network implementation for " + repository, exc_info=e)
+
+def prefetch_hot_models(number: int) -> None:
+    """
+    Load the most used models from when the server last ran in the background.
+
+    :param number: The maximum number of inference engines to load
+    """
+    if number <= 0 or not os.path.exists(hot_models_path):
+        return
+    with open(hot_models_path) as file:
+        hot_models = [tuple(names) for names in json.load(file)][:number]
+    logging.info("Prefetching " + str(len(hot_models)) + " inference engines")
+    MLPClassifierImplementation.model_registry.prefetch(hot_models)
+
+def save_hot_models(number: int) -> None:
+    """
+    Save the names of the most used models so they can be prefetched when the server next starts.
+
+    :param number: The maximum number of inference engines to save. Nothing is saved if this is 0.
+    """
+    if number <= 0:
+        return
+    hot_models = MLPClassifierImplementation.model_registry.get_most_used(number)
+    if not hot_models:
+        return
+    with open(hot_models_path, 'w') as file:
+        json.dump(hot_models, file)
+
+class RecommendationRequestHandler(BaseHTTPRequestHandler):
+    """
+    Handles the requests for recommendations.
+    """
+    def do_GET(self):
+        if self.path == "/health":
+            self._send_json(200, {"status": "ok"})
+        elif self.path == "/model-registry":
+            self._send_json(200, MLPClassifierImplementation.model_registry.get_statistics())
+        else:
+            self._send_json(404, {"error": "Unknown path " + self.path})
+
+    def do_POST(self):
+        path = self.path.strip('/').split('/')
+        if len(path) != 2 or path[0] not in ["rule-based", "neural-network"] or path[1] not in ["change-info", "change-id"]:
+            self._send_json(404, {"error": "Unknown path " + self.path})
+            return
+        implementation_name, request_type = path
+        try:
+            body = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))) or b'{}')
+            if not isinstance(body, dict) or 'repository' not in body:
+                raise ValueError("The request body must be a JSON object with a repository.")
+            implementation = get_implementation(implementation_name, body['repository'], body)
+            if request_type == "change-info":
+                recommendations = implementation.recommend_using_change_info(body['change_info'])
+            else:
+                recommendations = implementation.recommend_using_change_id(body['change_id'], body.get('branch', ''))
+        except KeyError as e:
+            self._send_json(400, {"error": "Missing or unknown " + str(e)})
+        except (ValueError, TypeError) as e:
+            self._send_json(400, {"error": str(e)})
+        except HTTPError as e:
+            self._send_json(502, {"error": "Gerrit returned HTTP status code " + str(e.response.status_code)})
+        except Exception as e:
+            logging.exception("Recommendation request failed", exc_info=e)
+            self._send_json(500, {"error": str(e)})
+        else:
+            self._send_json(200, self._recommendations_to_dict(recommendations, body))
+
+    @staticmethod
+    def _recommendations_to_dict(recommendations: Recommendations, body: dict) -> dict:
+        top_n_recommendations = recommendations.top_n(
+            int(body.get('top_n', 10)), bool(body.get('only_users_that_can_approve', False))
+        )
+        return {
+            "recommendations": [recommendation.to_dict() for recommendation in top_n_recommendations],
+            "total_users_found": len(recommendations)
+        }
+
+    def _send_json(self, status: int, data: dict) -> None:
+        response = json.dumps(data).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(response)))
+        self.end_headers()
+        self.wfile.write(response)
+
+    def address_string(self) -> str:
+        # Clients connecting over a Unix socket have no address.
+        if isinstance(self.client_address, tuple) and len(self.client_address):
+            return str(self.client_address[0])
+        return "unix-socket"
+
+    def log_message(self, format: str, *args) -> None:
+        logging.info("%s - %s" % (self.address_string(), format % args))
+
+class ThreadingUnixHTTPServer(socketserver.ThreadingMixIn, HTTPServer):
+    """
+    A threaded HTTP server that listens on a Unix socket.
+    """
+    address_family = socket.AF_UNIX
+    daemon_threads = True
+
+    def server_bind(self):
+        # HTTPServer::server_bind expects a host and port, which a Unix socket doesn't have.
+        socketserver.TCPServer.server_bind(self)
+        self.server_name = "localhost"
+        self.server_port = 0
+
+def make_server(host: str = "127.0.0.1", port: int = 8080, unix_socket: str = None) -> HTTPServer:
+    """
+    Create the recommendation server, listening on the Unix socket if provided and otherwise the host and port.
+    """
+    if unix_socket:
+        if os.path.exists(unix_socket):
+            os.remove(unix_socket)
+        return ThreadingUnixHTTPServer(unix_socket, RecommendationRequestHandler)
+    return ThreadingHTTPServer((host, port), RecommendationRequestHandler)
+
+if __name__ == "__main__":
+    logging.basicConfig(
+        filename=common.path_relative_to_root("logs/recommendation_server.log.txt"),
+        level=logging.INFO
+    )
+    argument_parser = argparse.ArgumentParser(description="A server that keeps the recommenders loaded and makes recommendations over a local JSON HTTP API")
+    argument_parser.add_argument('--host', default="127.0.0.1", help="The host to listen on (default is localhost only)")
+    argument_parser.add_argument('--port', type=int, default=8080, help="The port to listen on")
+    argument_parser.add_argument('--unix-socket', default=None, help="Listen on this Unix socket path instead of a TCP port")
+    argument_parser.add_argument('--warm', nargs='*', default=[], help="Repositories to load the implementations and bare repositories for before the first request")
+    argument_parser.add_argument('--blame-workers', type=int, default=1, help="The number of files in a change to run git blame on at the same time.")
+    argument_parser.add_argument('--model-memory-budget', type=int, default=512, help="The memory in MiB the loaded neural network models can use before the least recently used are unloaded")
+    argument_parser.add_argument('--memory-map-models', action='store_true', help="Memory-map the weights of the neural network models instead of reading them into memory")
+    argument_parser.add_argument('--prefetch-hot-models', type=int, default=20, help="The number of the most used models to save when the server stops and load in the background when it next starts (0 to disable)")
+    argument_parser.add_argument('--max-implementations', type=int, default=32, help="The number of implementation instances to keep loaded between requests before the least recently used are removed")
+    argument_parser.add_argument('--scoring-engine', action='store_true', help="Score the users for the rule based implementation using the vectorised scoring engine, which sums the signals of users found under several names or emails instead of averaging them")
+    argument_parser.add_argument('--scoring-engine-top-n', type=int, default=100, help="The number of users with the highest scores the scoring engine returns (0 for all users)")
+    command_line_arguments = argument_parser.parse_args()
+    MLPClassifierImplementation.model_registry = ModelRegistry(
+        command_line_arguments.model_memory_budget * 1024 * 1024, command_line_arguments.memory_map_models
+    )
+    max_implementations = max(1, command_line_arguments.max_implementations)
+    RuleBasedImplementation.git_blame_workers = max(1, command_line_arguments.blame_workers)
+    RuleBasedImplementation.use_scoring_engine = command_line_arguments.scoring_engine
+    RuleBasedImplementation.scoring_engine_top_n = command_line_arguments.scoring_engine_top_n or None
+    MLPClassifierImplementation.git_blame_workers = max(1, command_line_arguments.blame_workers)
+    MLPClassifierImplementationBase.use_base_data_frame_snapshots = True
+    prefetch_hot_models(command_line_arguments.prefetch_hot_models)
+    warm(command_line_arguments.warm)
+    server = make_server(command_line_arguments.host, command_line_arguments.port, command_line_arguments.unix_socket)
+    print("Listening on", command_line_arguments.unix_socket or (command_line_arguments.host + ":" + str(command_line_arguments.port)))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        save_hot_models(command_line_arguments.prefetch_hot_models)
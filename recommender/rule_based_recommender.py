@@ -4,16 +4,23 @@ Makes recommendations for changes using the rule based approach
 import sys
 import os
 import logging
+import threading
 import argparse
 import urllib.parse
 from requests import HTTPError
 from recommender import Recommendations, WeightingsBase, get_members_of_repo, get_reviewer_data, \
-    get_comment_data, RecommenderImplementation
+    get_comment_data, RecommenderImplementation, reload_data_if_changed
+from recommender.scoring_engine import RuleBasedScoringEngine, StaticScores, get_static_scores_path
 
 # Add parent directory to the path incase it's not already there
 sys.path.insert(1, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 import common
 
+_static_scores_cache = {}
+"""The static scores for each repository, keyed by the repository and the version they were built with."""
+
+_static_scores_cache_lock = threading.Lock()
+
 class RuleBasedWeightings(WeightingsBase):
     """
     The class that parses and then allows access to the weightings for the rule based recommender.
@@ -44,10 +51,60 @@ class RuleBasedImplementation(RecommenderImplementation):
     """
     Class that holds the code for the rule based recommendation implementation.
     """
+    use_scoring_engine = False
+    """
+    Score the users with the vectorised scoring engine (see scoring_engine.py) instead of adding
+    the score for each signal to each recommended reviewer. The engine sums the signals for users
+    found under several names or emails instead of averaging them, so the scores differ.
+    """
+    scoring_engine_top_n = None
+    """
+    The number of users with the highest scores that the scoring engine returns. None to return all users,
+    which the evaluation needs as the MRR for changes with no matching reviewer depends on the number returned.
+    """
     def __init__(self, repository: str):
         super().__init__(repository)
         # Load the weightings
         self.weightings = RuleBasedWeightings()
+        self.scoring_engine = RuleBasedScoringEngine(self.weightings)
+        """Scores the users using the weightings if use_scoring_engine is True."""
+
+    def get_static_scores(self) -> StaticScores:
+        """
+        Get the scores from the vote and comment signals for the repository, which are the same for
+        every change. These are loaded from disk if stored by ::precompute_static_scores for the current
+        data sets and weightings, otherwise they are built. They are then kept until the data sets change.
+        """
+        version = self.scoring_engine.get_static_scores_version(reload_data_if_changed())
+        with _static_scores_cache_lock:
+            static_scores = _static_scores_cache.get((self.repository, version))
+        if static_scores is None:
+            static_scores = StaticScores.load(get_static_scores_path(self.repository), version)
+            if static_scores is None:
+                static_scores = self._build_static_scores()
+            with _static_scores_cache_lock:
+                # Remove the static scores built from old data or weightings for this repository.
+                for key in [key for key in _static_scores_cache.keys() if key[0] == self.repository]:
+                    del _static_scores_cache[key]
+                _static_scores_cache[(self.repository, version)] = static_scores
+        return static_scores
+
+    def precompute_static_scores(self) -> StaticScores:
+        """
+        Build the static scores for the repository and store them on disk, so that other
+        processes can load them using ::get_static_scores.
+        """
+        version = self.scoring_engine.get_static_scores_version(reload_data_if_changed())
+        static_scores = self._build_static_scores()
+        static_scores.save(get_static_scores_path(self.repository), version)
+        return static_scores
+
+    def _build_static_scores(self) -> StaticScores:
+        return self.scoring_engine.build_static_scores(
+            self.get_repository_signals("votes", self.repository, lambda: get_reviewer_data()[self.repository]),
+            self.get_repository_signals("comments", self.repository, lambda: get_comment_data()[self.repository]),
+            self.get_repository_signals("members", self.repository, lambda: get_members_of_repo(self.repository))
+        )
 
     def recommend_using_change_info(self, change_info: dict):
         # Doc string is specified in the RecommenderImplementation class that this extends.
@@ -69,6 +126,11 @@ class RuleBasedImplementation(RecommenderImplementation):
                 owner_emails.add(common.username_to_email_map[name])
         if 'email' in owner and owner['email']:
             owner_emails.add(owner['email'])
+        if self.use_scoring_engine:
+            return self.scoring_engine.recommend(
+                self.get_change_git_blame_info(self.repository, change_info), self.get_static_scores(),
+                owner_names, owner_emails, self.scoring_engine_top_n
+            )
         # Initialise the recommendations list
         recommendations = Recommendations(exclude_emails=list(owner_emails), exclude_names=list(owner_names))
         # Get the files modified (added, changed or deleted) by the change
@@ -87,7 +149,7 @@ class RuleBasedImplementation(RecommenderImplementation):
                     reviewer = recommendations.get_reviewer_by_email_or_create_new(author_email)
                     reviewer.add_score(percentage, weighting)
         # Get previous reviewers for changes
-        reviewer_votes_for_current_repo = get_reviewer_data()[self.repository]
+        reviewer_votes_for_current_repo = self.get_repository_signals("votes", self.repository, lambda: get_reviewer_data()[self.repository])
         logging.debug("Reviewer votes: " + str(reviewer_votes_for_current_repo))
         # Apply the weightings for the code review percentages and add this to the score
         #  for each user.
@@ -98,7 +160,7 @@ class RuleBasedImplementation(RecommenderImplementation):
                     reviewer.add_score(reviewer_percentages[vote_weighting_key], weighting)
         del reviewer_votes_for_current_repo
         # Get authors of previous comments
-        comments_for_current_repo = get_comment_data()[self.repository]
+        comments_for_current_repo = self.get_repository_signals("comments", self.repository, lambda: get_comment_data()[self.repository])
         logging.debug("Comments: " + str(comments_for_current_repo))
         # Apply the weightings for the comment percentages and add this to the score
         #  for each user.
@@ -108,7 +170,7 @@ class RuleBasedImplementation(RecommenderImplementation):
                 reviewer.add_score(comment_percentage, weighting)
         del comments_for_current_repo
         # Mark users who can merge changes in the repository in the result class
-        users_with_rights_to_merge = get_members_of_repo(self.repository)
+        users_with_rights_to_merge = self.get_repository_signals("members", self.repository, lambda: get_members_of_repo(self.repository))
         logging.debug("users with right to merge: " + str(users_with_rights_to_merge))
         for user in users_with_rights_to_merge:
             reviewer = None
@@ -144,6 +206,8 @@ if __name__ == '__main__':
     argument_parser.add_argument('--repository', nargs='+', help="The repository for these changes. Specifying one repository applies to all changes. Multiple repositories apply to each change in order.", required=True)
     argument_parser.add_argument('--branch', nargs='+', help="The branch these change IDs are on (default is the main branch). Specifying one branch applies to all changes. Multiple branches apply to each change in order.", default=[], required=False)
     argument_parser.add_argument('--stats', action='store_true', help="Show stats about the recommendations.")
+    argument_parser.add_argument('--blame-workers', type=int, default=1, help="The number of files in a change to run git blame on at the same time.", required=False)
+    argument_parser.add_argument('--scoring-engine', action='store_true', help="Score the users using the vectorised scoring engine. This sums the signals of users found under several names or emails instead of averaging them, so the scores differ from the default.")
     change_ids_with_repo_and_branch = []
     command_line_arguments = None
     if not len(sys.argv) > 1:
@@ -166,6 +230,8 @@ if __name__ == '__main__':
         change_ids = command_line_arguments.change_id
         repositories = command_line_arguments.repository
         branches = command_line_arguments.branch
+        RuleBasedImplementation.git_blame_workers = max(1, command_line_arguments.blame_workers)
+        RuleBasedImplementation.use_scoring_engine = command_line_arguments.scoring_engine
         if len(repositories) != 1 and len(repositories) != len(change_ids):
             argument_parser.error("If specifying multiple repositories the same number of change IDs must be provided")
         if len(branches) > 1 and len(branches) != len(change_ids):
@@ -188,11 +254,22 @@ if __name__ == '__main__':
                 change_dictionary['branch'] = repositories[index]
             change_ids_with_repo_and_branch.append(change_dictionary)
     logging.info("Recommending with the following inputs: " + str(change_ids_with_repo_and_branch))
-    # With the provided arguments, perform the recommendations.
-    for change in change_ids_with_repo_and_branch:
+    # With the provided arguments, perform the recommendations. The changes for each repository
+    #  are recommended together so that the setup for each repository is only done once.
+    recommendations_for_changes = [None] * len(change_ids_with_repo_and_branch)
+    for repository in dict.fromkeys(change["repository"] for change in change_ids_with_repo_and_branch):
+        indexes_for_repository = [index for index, change in enumerate(change_ids_with_repo_and_branch) if change["repository"] == repository]
+        recommendations_for_repository = RuleBasedImplementation(repository).recommend_many_change_ids(
+            [change_ids_with_repo_and_branch[index]['change_id'] for index in indexes_for_repository],
+            [change_ids_with_repo_and_branch[index]['branch'] for index in indexes_for_repository]
+        )
+        for index, recommendations in zip(indexes_for_repository, recommendations_for_repository):
+            recommendations_for_changes[index] = recommendations
+    for change, recommended_reviewers in zip(change_ids_with_repo_and_branch, recommendations_for_changes):
         try:
-            # For each change ask for the recommendations, and then print them out.
-            recommended_reviewers = RuleBasedImplementation(change["repository"]).recommend_using_change_id(change['change_id'], change["branch"])
+            # For each change print out the recommendations.
+            if isinstance(recommended_reviewers, HTTPError):
+                raise recommended_reviewers
             logging.debug("Recommendations: " + str(recommended_reviewers))
             top_10_recommendations = recommended_reviewers.top_n(10)
             for recommendation in top_10_recommendations:
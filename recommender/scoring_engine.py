@@ -0,0 +1,377 @@
+"""
+A vectorised scoring engine for the rule based implementation.
+
+Instead of looking up (and possibly creating) a RecommendedReviewer for every user in every
+signal, the names and emails in the signals are first resolved to identities using a
+union-find index. The signals are then placed in a users by signals matrix, so that the
+scores for all users are one matrix-vector product with the weightings vector. Only the
+top N users are added to a Recommendations object.
+
+The vote and comment signals, and which users have rights to merge, are the same for every
+change on a repository. These are scored once for each repository as StaticScores, which can
+be stored on disk by precompute_static_scores.py. Only the git blame signals are scored for
+each change and added to the static scores.
+
+The engine intentionally scores users differently to the rule based implementation. That
+implementation averages the scores of two entries when Recommendations::merge_reviewer_entries
+finds they are the same user. This happens for most users with rights to merge, whose entry
+from the members data (found by their email) is merged with their entry from the vote and
+comment data (found by their name), which halves their score. The engine resolves the
+identities before scoring and sums all the signals for a user, so their scores are not
+halved. The scores and rankings from the engine are therefore not comparable with results
+from the rule based implementation without the engine, and are only the same for users who
+are not found under more than one name or email.
+"""
+import json
+import os
+from typing import List, Tuple, Optional, Iterable, TYPE_CHECKING
+
+import numpy
+
+import common
+from recommender import Recommendations, RecommendedReviewer
+
+if TYPE_CHECKING:
+    from recommender.rule_based_recommender import RuleBasedWeightings
+
+static_scores_path = common.path_relative_to_root("data_collection/raw_data/static_scores/")
+
+def get_static_scores_path(repository: str) -> str:
+    """
+    Gets the path to the static scores stored on disk for the repository.
+    """
+    return os.path.join(static_scores_path, common.get_sanitised_filename(repository) + ".npz")
+
+class IdentityIndex:
+    """
+    Resolves the names and emails of users to identities, where names and emails which are
+    known to be used by the same user are joined using union-find.
+    """
+    def __init__(self):
+        self._nodes = {}
+        """The node for each name and email, keyed by the index format of the name or email."""
+        self._nodes_by_value = {}
+        """The node for each name and email as given, so that the same name is only converted to the index format once."""
+        self._parents = []
+        """The parent of each node. A node that is its own parent is the root of an identity."""
+        self._values = []
+        """The names and emails for each node."""
+
+    def __len__(self):
+        return len(self._parents)
+
+    def copy(self) -> "IdentityIndex":
+        """
+        Get a copy of the index which can be added to without changing this index.
+        """
+        identity_index = IdentityIndex()
+        identity_index._nodes = self._nodes.copy()
+        identity_index._nodes_by_value = self._nodes_by_value.copy()
+        identity_index._parents = self._parents.copy()
+        identity_index._values = self._values.copy()
+        return identity_index
+
+    def _add_node(self, names: Tuple[str, ...], emails: Tuple[str, ...]) -> int:
+        node = len(self._parents)
+        self._parents.append(node)
+        self._values.append((names, emails))
+        return node
+
+    def add_identity(self, names: List[str], emails: List[str]) -> int:
+        """
+        Add a node for a user known by all the given names and emails. The node is joined to the
+        nodes of any of these names or emails that have been seen before.
+
+        :returns: The node for the user
+        """
+        node = self._add_node(tuple(names), tuple(emails))
+        keys = [(False, common.convert_name_to_index_format(name)) for name in names] \
+            + [(True, common.convert_email_to_index_format(email)) for email in emails]
+        for key in keys:
+            if key in self._nodes:
+                self.union(node, self._nodes[key])
+            else:
+                self._nodes[key] = node
+        for value in [(False, name) for name in names] + [(True, email) for email in emails]:
+            self._nodes_by_value.setdefault(value, node)
+        return node
+
+    def get_email_node(self, email: str) -> Optional[int]:
+        """
+        Get the node for an email, or None if it has not been seen before.
+        """
+        return self._nodes.get((True, common.convert_email_to_index_format(email)))
+
+    def get_name_node(self, name: str) -> Optional[int]:
+        """
+        Get the node for a name, or None if it has not been seen before.
+        """
+        return self._nodes.get((False, common.convert_name_to_index_format(name)))
+
+    def add_email(self, email: str) -> int:
+        """
+        Get the node for an email, adding it if it has not been seen before.
+
+        :param email: The email address
+        :returns: The node for the email
+        """
+        node = self._nodes_by_value.get((True, email))
+        if node is None:
+            key = (True, common.convert_email_to_index_format(email))
+            node = self._nodes.get(key)
+            if node is None:
+                node = self._add_node((), (email.strip(),))
+                self._nodes[key] = node
+            self._nodes_by_value[(True, email)] = node
+        return node
+
+    def add_name(self, name: str) -> int:
+        """
+        Get the node for a name, adding it if it has not been seen before. If the name is in
+        the global username to email map, the name is joined to the email.
+
+        :param name: The name / username
+        :returns: The node for the name
+        """
+        node = self._nodes_by_value.get((False, name))
+        if node is not None:
+            return node
+        index_name = common.convert_name_to_index_format(name)
+        node = self._nodes.get((False, index_name))
+        if node is None:
+            node = self._add_node((name.strip(),), ())
+            self._nodes[(False, index_name)] = node
+            if index_name in common.username_to_email_map:
+                self.union(node, self.add_email(common.username_to_email_map[index_name]))
+        self._nodes_by_value[(False, name)] = node
+        return node
+
+    def find(self, node: int) -> int:
+        """
+        Get the root node of the identity that the node belongs to.
+        """
+        parents = self._parents
+        while parents[node] != node:
+            # Path halving keeps the trees shallow.
+            parents[node] = parents[parents[node]]
+            node = parents[node]
+        return node
+
+    def union(self, first: int, second: int) -> None:
+        """
+        Join the identities of the two nodes, as they are used by the same user.
+        """
+        first_root = self.find(first)
+        second_root = self.find(second)
+        if first_root != second_root:
+            # Keep the root that was seen first, so that identities are ordered by when they were first seen.
+            if second_root < first_root:
+                first_root, second_root = second_root, first_root
+            self._parents[second_root] = first_root
+
+    def resolve(self) -> Tuple[numpy.ndarray, List[Tuple[List[str], List[str]]]]:
+        """
+        Number the identities in the order that they were first seen.
+
+        :returns: The identity number for each node, and the names and emails of each identity.
+        """
+        identity_for_root = {}
+        node_identities = numpy.empty(len(self._parents), dtype=numpy.intp)
+        identities = []
+        for node, (names, emails) in enumerate(self._values):
+            root = self.find(node)
+            if root not in identity_for_root:
+                identity_for_root[root] = len(identities)
+                identities.append(([], []))
+            identity = identity_for_root[root]
+            node_identities[node] = identity
+            identities[identity][0].extend(names)
+            identities[identity][1].extend(emails)
+        return node_identities, identities
+
+class StaticScores:
+    """
+    The scores from the signals which are the same for every change on a repository, along
+    with which users have rights to merge.
+    """
+    def __init__(self, identities: List[Tuple[List[str], List[str]]], scores: numpy.ndarray, has_rights_to_merge: numpy.ndarray):
+        """
+        :param identities: The names and emails of each user
+        :param scores: The score for each user
+        :param has_rights_to_merge: Whether each user has rights to merge
+        """
+        self.identities = identities
+        """The names and emails of each user."""
+        self.scores = scores
+        """The score for each user from the vote and comment signals."""
+        self.has_rights_to_merge = has_rights_to_merge
+        """Whether each user has rights to merge changes in the repository."""
+        self.identity_index = IdentityIndex()
+        """An index where node N is the Nth user. Copied for each change so that the users in the git blame stats can be added."""
+        for names, emails in identities:
+            self.identity_index.add_identity(names, emails)
+
+    def save(self, path: str, version: str) -> None:
+        """
+        Save the static scores to disk.
+
+        :param path: The path to save the static scores to
+        :param version: The version returned by RuleBasedScoringEngine::get_static_scores_version
+        """
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Write to a temporary file first so that other processes never read partially written scores.
+        with open(path + '.tmp', 'wb') as file:
+            numpy.savez(
+                file, version=numpy.array(version), identities=numpy.array(json.dumps(self.identities)),
+                scores=self.scores, has_rights_to_merge=self.has_rights_to_merge
+            )
+        os.replace(path + '.tmp', path)
+
+    @classmethod
+    def load(cls, path: str, version: str) -> Optional["StaticScores"]:
+        """
+        Load the static scores saved by ::save.
+
+        :param path: The path to the static scores
+        :param version: The current version returned by RuleBasedScoringEngine::get_static_scores_version
+        :returns: The static scores, or None if they don't exist or were saved with a different version.
+        """
+        if not os.path.exists(path):
+            return None
+        with numpy.load(path) as arrays:
+            if str(arrays['version']) != version:
+                return None
+            return cls(
+                [(names, emails) for names, emails in json.loads(str(arrays['identities']))],
+                arrays['scores'], arrays['has_rights_to_merge']
+            )
+
+class RuleBasedScoringEngine:
+    """
+    Scores the users for a change by multiplying a users by signals matrix with the weightings.
+    """
+    def __init__(self, weightings: "RuleBasedWeightings"):
+        """
+        :param weightings: The weightings for the rule based implementation
+        """
+        self.git_blame_signals = []
+        """The git blame signals which are the columns of the matrix for each change, as a tuple of authors or committers and the time period."""
+        git_blame_weights = []
+        for git_blame_key in ["authors", "committers"]:
+            for time_period, weighting in weightings.lines_count[git_blame_key].items():
+                self.git_blame_signals.append((git_blame_key, time_period.replace(' ', '_') + '_lines_count'))
+                git_blame_weights.append(weighting)
+        self.git_blame_weights = numpy.array(git_blame_weights, dtype=float)
+        """The weighting for each git blame signal"""
+        self.static_signals = []
+        """The vote and comment signals which are the columns of the matrix for the static scores, as a tuple of the data set, vote type and time period."""
+        static_weights = []
+        for vote_type, vote_weightings in weightings.votes.items():
+            for time_period, weighting in vote_weightings.items():
+                self.static_signals.append(("votes", vote_type, time_period))
+                static_weights.append(weighting)
+        for time_period, weighting in weightings.comments.items():
+            self.static_signals.append(("comments", None, time_period))
+            static_weights.append(weighting)
+        self.static_weights = numpy.array(static_weights, dtype=float)
+        """The weighting for each vote and comment signal"""
+
+    def get_static_scores_version(self, data_signature: Tuple[int, ...]) -> str:
+        """
+        Get the version that the static scores are stored with, which changes if the data sets
+        or the weightings for the vote and comment signals change.
+
+        :param data_signature: The data signature returned by get_data_signature
+        """
+        return json.dumps([list(data_signature), self.static_signals, self.static_weights.tolist()])
+
+    def build_static_scores(self, reviewer_votes: dict, comments: dict, members: List[dict]) -> StaticScores:
+        """
+        Score the users using the vote and comment signals for a repository.
+
+        :param reviewer_votes: The vote percentages for the repository
+        :param comments: The comment percentages for the repository
+        :param members: The users with rights to merge changes in the repository
+        """
+        identity_index = IdentityIndex()
+        nodes, columns, values = [], [], []
+        for column, (data_set, vote_type, time_period) in enumerate(self.static_signals):
+            if data_set == "votes":
+                for name, percentages in reviewer_votes[time_period].items():
+                    nodes.append(identity_index.add_name(name))
+                    columns.append(column)
+                    values.append(percentages[vote_type])
+            else:
+                for name, percentage in comments[time_period].items():
+                    nodes.append(identity_index.add_name(name))
+                    columns.append(column)
+                    values.append(percentage)
+        member_nodes = []
+        for user in members:
+            user_nodes = []
+            if 'email' in user and user['email']:
+                user_nodes.append(identity_index.add_email(user['email']))
+            for username_key in ['user', 'display_name', 'username']:
+                if username_key in user and user[username_key]:
+                    user_nodes.append(identity_index.add_name(user[username_key]))
+            for node in user_nodes[1:]:
+                identity_index.union(user_nodes[0], node)
+            member_nodes.extend(user_nodes[:1])
+        node_identities, identities = identity_index.resolve()
+        # Build the users by signals matrix and score all the users at once.
+        matrix = numpy.zeros((len(identities), len(self.static_signals)))
+        numpy.add.at(matrix, (node_identities[numpy.array(nodes, dtype=numpy.intp)], numpy.array(columns, dtype=numpy.intp)), values)
+        has_rights_to_merge = numpy.zeros(len(identities), dtype=bool)
+        has_rights_to_merge[node_identities[numpy.array(member_nodes, dtype=numpy.intp)]] = True
+        return StaticScores(identities, matrix @ self.static_weights, has_rights_to_merge)
+
+    def recommend(self, git_blame_stats: dict, static_scores: StaticScores, exclude_names: Iterable[str] = (),
+                  exclude_emails: Iterable[str] = (), top_n: Optional[int] = None) -> Recommendations:
+        """
+        Score the users using the git blame stats for a change and the static scores for the
+        repository, and return the recommendations for the users with the highest scores.
+
+        :param git_blame_stats: The git blame stats for the change
+        :param static_scores: The static scores for the repository returned by ::build_static_scores
+        :param exclude_names: The names to exclude from the recommendations (such as the change owner)
+        :param exclude_emails: The emails to exclude from the recommendations
+        :param top_n: The number of users to add to the recommendations. None to add all users.
+        """
+        identity_index = static_scores.identity_index.copy()
+        for email, names in git_blame_stats['names'].items():
+            email_node = identity_index.add_email(email)
+            for name in names:
+                identity_index.union(email_node, identity_index.add_name(name))
+        nodes, columns, values = [], [], []
+        for column, (git_blame_key, time_period) in enumerate(self.git_blame_signals):
+            for email, percentage in git_blame_stats[git_blame_key][time_period].items():
+                nodes.append(identity_index.add_email(email))
+                columns.append(column)
+                values.append(percentage)
+        node_identities, identities = identity_index.resolve()
+        # The first nodes are the users in the static scores, so add their scores to the identities they are now part of.
+        static_identities = node_identities[:len(static_scores.identities)]
+        scores = numpy.bincount(static_identities, weights=static_scores.scores, minlength=len(identities))
+        matrix = numpy.zeros((len(identities), len(self.git_blame_signals)))
+        numpy.add.at(matrix, (node_identities[numpy.array(nodes, dtype=numpy.intp)], numpy.array(columns, dtype=numpy.intp)), values)
+        scores += matrix @ self.git_blame_weights
+        has_rights_to_merge = numpy.zeros(len(identities), dtype=bool)
+        has_rights_to_merge[static_identities[static_scores.has_rights_to_merge]] = True
+        # Exclude users before choosing the top N, so that excluded users don't take up places.
+        exclude_names, exclude_emails = list(exclude_names), list(exclude_emails)
+        included = numpy.ones(len(identities), dtype=bool)
+        excluded_nodes = [identity_index.get_name_node(name) for name in exclude_names + common.username_exclude_list] \
+            + [identity_index.get_email_node(email) for email in exclude_emails + common.email_exclude_list]
+        included[node_identities[numpy.array([node for node in excluded_nodes if node is not None], dtype=numpy.intp)]] = False
+        candidates = numpy.flatnonzero(included)
+        # A stable sort keeps users with the same score in the order they were first seen.
+        candidates = candidates[numpy.argsort(-scores[candidates], kind='stable')]
+        if top_n is not None:
+            candidates = candidates[:top_n]
+        recommendations = Recommendations(exclude_names=exclude_names, exclude_emails=exclude_emails)
+        for identity in candidates:
+            names, emails = identities[identity]
+            recommendations.add(RecommendedReviewer(
+                emails=emails, names=names, score=float(scores[identity]), has_rights_to_merge=bool(has_rights_to_merge[identity])
+            ))
+        return recommendations
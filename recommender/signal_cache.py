@@ -0,0 +1,158 @@
+"""
+A persistent cache of the raw signals the implementations use to make recommendations for
+a change, so that the evaluation can be re-run (for example with different weightings, a
+different approved to voted ratio or a different selection mode) without running git blame
+or the models again.
+
+The signals for a change are keyed by the repository, the change ID and the revision of the
+change. Signals which are the same for every change on a repository (such as the vote and
+comment percentages) are keyed by the repository only. Each entry also records a version,
+such as the data signature or the models used, and an entry with a different version is
+treated as missing.
+
+The cache is used when RecommenderImplementationBase.use_signal_cache is True.
+"""
+import json
+import os
+import sqlite3
+import threading
+import time
+import zlib
+from typing import Any, Callable, Optional
+
+import common
+
+DEFAULT_CACHE_PATH = common.path_relative_to_root("data_collection/raw_data/signal_cache.sqlite3")
+
+class SignalCache:
+    """
+    Stores the signals for each change in a SQLite database.
+    """
+    def __init__(self, path: str = DEFAULT_CACHE_PATH):
+        """
+        Open (and create if needed) the signal cache.
+
+        :param path: The path to the SQLite database file
+        """
+        self.hits = 0
+        """The number of signals read from the cache"""
+        self.misses = 0
+        """The number of signals that were not in the cache and so were computed"""
+        self._repository_signals = {}
+        """The signals about a repository read by this process, as these are used for every change on the repository."""
+        self._lock = threading.Lock()
+        """Serialises use of the connection when the cache is shared between threads."""
+        self._connection = sqlite3.connect(path, timeout=60, check_same_thread=False)
+        """The connection to the SQLite database."""
+        with self._lock, self._connection:
+            self._connection.execute("""
+                CREATE TABLE IF NOT EXISTS signals (
+                    kind TEXT NOT NULL,
+                    repository TEXT NOT NULL,
+                    change_id TEXT NOT NULL,
+                    revision TEXT NOT NULL,
+                    version TEXT NOT NULL,
+                    signals BLOB NOT NULL,
+                    created REAL NOT NULL,
+                    PRIMARY KEY (kind, repository, change_id, revision)
+                )
+            """)
+
+    def get(self, kind: str, repository: str, change_id: str, revision: str, version: str) -> Optional[Any]:
+        """
+        Get the signals of the given kind.
+
+        :param kind: The type of signals, such as "git blame"
+        :param repository: The repository the change is on
+        :param change_id: The ID of the change, or an empty string for signals about the repository
+        :param revision: The revision of the change, or an empty string for signals about the repository
+        :param version: The version the signals must have been stored with
+        :returns: The signals, or None if they are not cached or were stored with a different version.
+        """
+        with self._lock:
+            row = self._connection.execute(
+                "SELECT signals FROM signals WHERE kind = ? AND repository = ? AND change_id = ? AND revision = ? AND version = ?",
+                (kind, repository, change_id, revision, version)
+            ).fetchone()
+        if row is None:
+            return None
+        return json.loads(zlib.decompress(row[0]))
+
+    def put(self, kind: str, repository: str, change_id: str, revision: str, version: str, signals: Any) -> None:
+        """
+        Store the signals of the given kind, replacing any stored with a different version.
+
+        :param signals: The signals, which must be JSON serialisable
+        """
+        compressed_signals = zlib.compress(json.dumps(signals, separators=(',', ':')).encode('utf-8'))
+        with self._lock, self._connection:
+            self._connection.execute(
+                "INSERT INTO signals (kind, repository, change_id, revision, version, signals, created) VALUES (?, ?, ?, ?, ?, ?, ?) "
+                "ON CONFLICT (kind, repository, change_id, revision) DO UPDATE SET "
+                "version = excluded.version, signals = excluded.signals, created = excluded.created",
+                (kind, repository, change_id, revision, version, compressed_signals, time.time())
+            )
+
+    def get_or_compute(self, kind: str, repository: str, change_id: str, revision: str, version: str,
+                       compute: Callable[[], Any]) -> Any:
+        """
+        Get the signals of the given kind, computing and storing them if they are not cached.
+        The signals are returned as read from the cache, so tuples are returned as lists.
+
+        :param compute: Computes the signals if they are not cached
+        """
+        if not change_id and (kind, repository, version) in self._repository_signals:
+            self.hits += 1
+            return self._repository_signals[(kind, repository, version)]
+        signals = self.get(kind, repository, change_id, revision, version)
+        if signals is not None:
+            self.hits += 1
+        else:
+            self.misses += 1
+            self.put(kind, repository, change_id, revision, version, compute())
+            # Use the signals as they would be read from the cache, so that a replay
+            #  produces exactly the same recommendations.
+            signals = self.get(kind, repository, change_id, revision, version)
+        if not change_id:
+            self._repository_signals[(kind, repository, version)] = signals
+        return signals
+
+    def get_or_compute_for_change(self, kind: str, repository: str, change_info: dict, version: str,
+                                  compute: Callable[[], Any]) -> Any:
+        """
+        Get the signals of the given kind for a change, computing and storing them if they are not
+        cached. If the change info has no ID or current revision the signals are computed and not cached.
+
+        :param change_info: The change information dictionary associated with the change
+        """
+        change_id = change_info.get('id', change_info.get('change_id'))
+        if not change_id or not change_info.get('current_revision'):
+            return compute()
+        return self.get_or_compute(kind, repository, change_id, change_info['current_revision'], version, compute)
+
+    def clear(self) -> None:
+        """
+        Remove all signals from the cache.
+        """
+        with self._lock, self._connection:
+            self._connection.execute("DELETE FROM signals")
+            self._repository_signals.clear()
+
+_signal_cache = None
+"""The SignalCache shared by calls in this process. Created on first use."""
+
+_signal_cache_process_id = None
+"""The ID of the process that created the shared SignalCache, as a connection can't be used after a fork."""
+
+_signal_cache_lock = threading.Lock()
+
+def get_signal_cache() -> SignalCache:
+    """
+    Get the signal cache shared by this process, creating it if needed.
+    """
+    global _signal_cache, _signal_cache_process_id
+    with _signal_cache_lock:
+        if _signal_cache is None or _signal_cache_process_id != os.getpid():
+            _signal_cache = SignalCache()
+            _signal_cache_process_id = os.getpid()
+        return _signal_cache